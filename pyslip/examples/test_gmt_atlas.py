@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the memory-mapped GMT tile atlas and its packer.
+
+Packs a copy of the example GMT tiles and checks the atlas serves the
+same tiles as the tile files.
+
+Requires a wxPython application to be created before use.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import wx
+
+import pyslip.gmt_local_tiles as gmt_local_tiles
+
+
+# where the pre-generated GMT tiles are
+TilesDir = './gmt_tiles'
+
+DefaultAppSize = (512, 512)
+DemoName = 'GMT Atlas Test'
+DemoVersion = '0.1'
+
+
+class AppFrame(wx.Frame):
+
+    def __init__(self):
+        wx.Frame.__init__(self, None, size=DefaultAppSize,
+                          title='%s %s' % (DemoName, DemoVersion))
+        self.SetMinSize(DefaultAppSize)
+        self.panel = wx.Panel(self, wx.ID_ANY)
+        self.panel.SetBackgroundColour(wx.WHITE)
+        self.panel.ClearBackground()
+        self.Bind(wx.EVT_CLOSE, self.onClose)
+
+        unittest.main()
+
+    def onClose(self, event):
+        self.Destroy()
+
+class TestGMTAtlas(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tiles_dir = os.path.join(self.tmp_dir, 'gmt_tiles')
+        shutil.copytree(TilesDir, self.tiles_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testAtlasSameAsFiles(self):
+        """Check the atlas holds the same data as the tile files."""
+
+        # no atlas yet, so tile files are used
+        gmt = gmt_local_tiles.GMTTiles(tiles_dir=self.tiles_dir)
+        self.assertFalse(isinstance(gmt.cache, gmt_local_tiles.GMTAtlasCache))
+
+        count = gmt_local_tiles.PackAtlas(self.tiles_dir)
+        self.assertTrue(count > 0)
+
+        # atlas found automatically
+        gmt = gmt_local_tiles.GMTTiles(tiles_dir=self.tiles_dir)
+        self.assertTrue(isinstance(gmt.cache, gmt_local_tiles.GMTAtlasCache))
+
+        for level in gmt.levels:
+            gmt.UseLevel(level)
+            for x in range(gmt.num_tiles_x):
+                for y in range(gmt.num_tiles_y):
+                    tile_path = os.path.join(self.tiles_dir, '%d' % level,
+                                             gmt.cache.TilePath % (x, y))
+                    with open(tile_path, 'rb') as fd:
+                        expected = fd.read()
+                    data = gmt.cache.get_tile_data((level, x, y))
+                    self.assertEqual(data, expected)
+                    bmp = gmt.GetTile(x, y)
+                    msg = "Can't find tile (%d,%d,%d)!?" % (level, x, y)
+                    self.assertFalse(bmp is None, msg)
+
+            # tiles off the map aren't there
+            self.assertTrue(gmt.GetTile(gmt.num_tiles_x, 0) is None)
+            self.assertTrue(gmt.GetTile(0, gmt.num_tiles_y) is None)
+
+        # can still force use of the tile files
+        gmt = gmt_local_tiles.GMTTiles(tiles_dir=self.tiles_dir, atlas=False)
+        self.assertFalse(isinstance(gmt.cache, gmt_local_tiles.GMTAtlasCache))
+
+    def testPartialAtlas(self):
+        """Check a partly packed tileset uses the tile files."""
+
+        gmt = gmt_local_tiles.GMTTiles(tiles_dir=self.tiles_dir)
+        gmt_local_tiles.PackAtlas(self.tiles_dir, levels=gmt.levels[:1])
+
+        gmt = gmt_local_tiles.GMTTiles(tiles_dir=self.tiles_dir)
+        self.assertFalse(isinstance(gmt.cache, gmt_local_tiles.GMTAtlasCache))
+
+    def testMismatchedAtlas(self):
+        """Check an index and data file from different packs aren't used."""
+
+        gmt = gmt_local_tiles.GMTTiles(tiles_dir=self.tiles_dir)
+        level = gmt.levels[0]
+        gmt_local_tiles.PackAtlas(self.tiles_dir, levels=[level])
+        index_path = os.path.join(self.tiles_dir, '%d' % level,
+                                  gmt_local_tiles.AtlasIndexFilename)
+        shutil.copy(index_path, index_path + '.old')
+
+        # repack, then put back the first index as a racing reader might see
+        gmt_local_tiles.PackAtlas(self.tiles_dir, levels=[level])
+        shutil.copy(index_path, index_path + '.new')
+        shutil.copy(index_path + '.old', index_path)
+
+        cache = gmt_local_tiles.GMTAtlasCache(tiles_dir=self.tiles_dir)
+        self.assertFalse(cache.has_atlas(level))
+        self.assertTrue(cache.get_tile_data((level, 0, 0)) is None)
+        bmp = cache[(level, 0, 0)]
+        self.assertFalse(bmp is None, 'Tile file not used for bad atlas')
+
+        # the mismatch wasn't remembered, a matching pair is used
+        shutil.copy(index_path + '.new', index_path)
+        self.assertTrue(cache.has_atlas(level))
+        self.assertFalse(cache.get_tile_data((level, 0, 0)) is None)
+
+app = wx.App()
+app_frame = AppFrame()
+app_frame.Show()
+app.MainLoop()
@@ -70,6 +70,105 @@ class TestGMTTiles(unittest.TestCase):
                         msg = "Can't find tile (%d,%d,%d)!?" % (level, x, y)
                         self.failIf(bmp is None, msg)
 
+    def testAsyncDecode(self):
+        """Check tiles decoded in the background arrive via the callback."""
+
+        available = []
+        def callback(level, x, y, image, bitmap):
+            available.append((level, x, y))
+
+        cache = gmt_local_tiles.GMTTiles(tiles_dir=TilesDir, async_decode=True)
+        cache.SetAvailableCallback(callback)
+        level = cache.levels[0]
+        cache.UseLevel(level)
+
+        # first get is the placeholder, the real tile comes later
+        bmp = cache.GetTile(0, 0)
+        self.assertTrue(bmp is cache.placeholder_tile)
+        cache.decode_queue.join()
+        wx.GetApp().ProcessPendingEvents()     # run the CallAfter()s
+        self.assertEqual(available, [(level, 0, 0)])
+
+        bmp = cache.GetTile(0, 0)
+        self.assertFalse(bmp is cache.placeholder_tile)
+        self.assertEqual(bmp.GetWidth(), self.TileWidth)
+
+    def testStandIn(self):
+        """Check a loading tile is stood in for by its loaded parent."""
+
+        cache = gmt_local_tiles.GMTTiles(tiles_dir=TilesDir, async_decode=True)
+        cache.SetAvailableCallback(lambda *args: None)
+        (parent_level, level) = cache.levels[:2]
+        cache.UseLevel(parent_level)
+        cache.GetTile(0, 0)
+        cache.decode_queue.join()
+        wx.GetApp().ProcessPendingEvents()     # run the CallAfter()s
+
+        # the child tile is the enlarged parent until it is decoded
+        cache.UseLevel(level)
+        bmp = cache.GetTile(1, 1)
+        self.assertFalse(bmp is cache.placeholder_tile)
+        self.assertEqual(bmp.GetWidth(), self.TileWidth)
+        self.assertTrue((level, 1, 1) in cache.stand_ins)
+        cache.decode_queue.join()
+        wx.GetApp().ProcessPendingEvents()
+        self.assertFalse((level, 1, 1) in cache.stand_ins)
+
+    def testStandInPruned(self):
+        """Check stand-ins for tiles out of view are forgotten."""
+
+        cache = gmt_local_tiles.GMTTiles(tiles_dir=TilesDir, async_decode=True)
+        cache.SetAvailableCallback(lambda *args: None)
+        (parent_level, level) = cache.levels[:2]
+        cache.UseLevel(parent_level)
+        cache.GetTile(0, 0)
+        cache.decode_queue.join()
+        wx.GetApp().ProcessPendingEvents()
+
+        # stand-ins are made before any decoded tile is delivered
+        cache.UseLevel(level)
+        cache.GetTile(0, 0)
+        cache.GetTile(1, 1)
+        self.assertEqual(sorted(cache.stand_ins.keys()),
+                         [(level, 0, 0), (level, 1, 1)])
+        cache.SetVisibleTiles([1, 2], [1, 2])
+        self.assertEqual(cache.stand_ins.keys(), [(level, 1, 1)])
+        cache.SetVisibleTiles([5], [5])
+        self.assertEqual(cache.stand_ins, {})
+        cache.decode_queue.join()
+        wx.GetApp().ProcessPendingEvents()
+
+    def testStandInChildren(self):
+        """Check a stand-in from some of the children isn't remembered."""
+
+        cache = gmt_local_tiles.GMTTiles(tiles_dir=TilesDir, async_decode=True)
+        cache.SetAvailableCallback(lambda *args: None)
+        (level, child_level) = cache.levels[:2]
+        cache.UseLevel(child_level)
+        cache.GetTile(0, 0)
+        cache.decode_queue.join()
+        wx.GetApp().ProcessPendingEvents()
+
+        # one child of four in memory, top level has no ancestor
+        cache.UseLevel(level)
+        bmp = cache.GetTile(0, 0)
+        self.assertFalse(bmp is cache.placeholder_tile)
+        self.assertFalse((level, 0, 0) in cache.stand_ins)
+
+        # all four children make a stand-in that is remembered
+        cache.decode_queue.join()
+        wx.GetApp().ProcessPendingEvents()
+        cache.UseLevel(child_level)
+        for (x, y) in [(2, 0), (2, 1), (3, 0), (3, 1)]:
+            cache.GetTile(x, y)
+        cache.decode_queue.join()
+        wx.GetApp().ProcessPendingEvents()
+        cache.UseLevel(level)
+        cache.GetTile(1, 0)
+        self.assertTrue((level, 1, 0) in cache.stand_ins)
+        cache.decode_queue.join()
+        wx.GetApp().ProcessPendingEvents()
+
     def testErrors(self):
         """Test possible errors."""
 
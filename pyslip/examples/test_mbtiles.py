@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the MBTiles tile source and the tile directory importer.
+
+Imports the example GMT tiles into an MBTiles file and checks the new
+tile source serves the same tiles as the GMT tile source.
+
+Requires a wxPython application to be created before use.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import wx
+
+import pyslip.gmt_local_tiles as gmt_local_tiles
+import pyslip.mbtiles_tiles as mbtiles_tiles
+
+
+# where the pre-generated GMT tiles are
+TilesDir = './gmt_tiles'
+
+DefaultAppSize = (512, 512)
+DemoName = 'MBTiles Test'
+DemoVersion = '0.1'
+
+
+class AppFrame(wx.Frame):
+
+    def __init__(self):
+        wx.Frame.__init__(self, None, size=DefaultAppSize,
+                          title='%s %s' % (DemoName, DemoVersion))
+        self.SetMinSize(DefaultAppSize)
+        self.panel = wx.Panel(self, wx.ID_ANY)
+        self.panel.SetBackgroundColour(wx.WHITE)
+        self.panel.ClearBackground()
+        self.Bind(wx.EVT_CLOSE, self.onClose)
+
+        unittest.main()
+
+    def onClose(self, event):
+        self.Destroy()
+
+class TestMBTiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tiles_file = os.path.join(self.tmp_dir, 'gmt.mbtiles')
+        mbtiles_tiles.ImportTiles(TilesDir, self.tiles_file, 'gmt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testSameAsGMT(self):
+        """Check MBTiles serves the same levels, tiles and geometry."""
+
+        gmt = gmt_local_tiles.GMTTiles(tiles_dir=TilesDir)
+        mbt = mbtiles_tiles.MBTiles(self.tiles_file)
+
+        self.assertEqual(gmt.levels, mbt.levels)
+        self.assertEqual(gmt.tile_size_x, mbt.tile_size_x)
+        self.assertEqual(gmt.tile_size_y, mbt.tile_size_y)
+
+        for level in gmt.levels:
+            gmt.UseLevel(level)
+            mbt.UseLevel(level)
+            self.assertEqual(gmt.GetInfo(level), mbt.GetInfo(level))
+
+            # every tile is there, read a row at a time
+            x_list = range(mbt.num_tiles_x)
+            for y in range(mbt.num_tiles_y):
+                mbt.SetVisibleTiles(x_list, [y])
+                for x in x_list:
+                    self.assertTrue((level, x, y) in mbt.cache)
+                    bmp = mbt.GetTile(x, y)
+                    msg = "Can't find tile (%d,%d,%d)!?" % (level, x, y)
+                    self.assertFalse(bmp is None, msg)
+
+            # and geo conversions agree
+            for geo in [(0.0, 0.0), (100.0, -30.0), (-60.0, 60.0)]:
+                (gx, gy) = gmt.Geo2Tile(geo)
+                (mx, my) = mbt.Geo2Tile(geo)
+                self.assertAlmostEqual(gx, mx, places=6)
+                self.assertAlmostEqual(gy, my, places=6)
+                (lon, lat) = mbt.Tile2Geo((mx, my))
+                self.assertAlmostEqual(lon, geo[0], places=6)
+                self.assertAlmostEqual(lat, geo[1], places=6)
+
+    def testErrors(self):
+        """Test possible errors."""
+
+        # missing tiles file
+        with self.assertRaises(IOError):
+            mbtiles_tiles.MBTiles(os.path.join(self.tmp_dir, 'xyzzy'))
+
+        # won't overwrite an existing file
+        with self.assertRaises(IOError):
+            mbtiles_tiles.ImportTiles(TilesDir, self.tiles_file, 'gmt')
+
+        # tile outside the map is blank, and remembered as missing
+        mbt = mbtiles_tiles.MBTiles(self.tiles_file)
+        mbt.UseLevel(mbt.levels[0])
+        x_list = [mbt.num_tiles_x]
+        mbt.SetVisibleTiles(x_list, [0])
+        self.assertTrue(mbt.GetTile(mbt.num_tiles_x, 0) is mbt.blank_tile)
+        self.assertEqual(mbt.cache.stats()['missing_hits'], 1)
+
+    def testSparseOSM(self):
+        """Check holes in a file imported from an OSM cache can be drawn."""
+
+        # an OSM disk cache only holds viewed tiles, make one from GMT tiles
+        osm_dir = os.path.join(self.tmp_dir, 'osm_tiles')
+        gmt = gmt_local_tiles.GMTTiles(tiles_dir=TilesDir)
+        src = os.path.join(TilesDir, '%d' % gmt.levels[0],
+                           gmt.cache.TilePath % (0, 0))
+        kept = [(1, 0, 0), (1, 1, 1), (2, 1, 1)]
+        for (level, x, y) in kept:
+            dst = os.path.join(osm_dir, '%d' % level, '%d' % x, '%d.png' % y)
+            os.makedirs(os.path.dirname(dst))
+            shutil.copy(src, dst)
+        osm_file = os.path.join(self.tmp_dir, 'osm.mbtiles')
+        count = mbtiles_tiles.ImportTiles(osm_dir, osm_file, 'osm')
+        self.assertEqual(count, len(kept))
+
+        mbt = mbtiles_tiles.MBTiles(osm_file)
+        mbt.UseLevel(1)
+        mbt.SetVisibleTiles([0, 1], [0, 1])
+        self.assertFalse(mbt.GetTile(0, 0) is mbt.blank_tile)
+        self.assertTrue(mbt.GetTile(1, 0) is mbt.blank_tile)
+
+        # a hole under a tile in memory shows the enlarged parent
+        mbt.UseLevel(2)
+        mbt.SetVisibleTiles([2, 3], [2, 3])
+        stand_in = mbt.GetTile(3, 2)
+        self.assertFalse(stand_in is mbt.blank_tile)
+        self.assertEqual(stand_in.GetSize(), mbt.blank_tile.GetSize())
+
+        # and every tile, missing or not, can be drawn
+        bitmap = wx.EmptyBitmap(2*mbt.tile_size_x, 2*mbt.tile_size_y)
+        dc = wx.MemoryDC(bitmap)
+        for x in (2, 3):
+            for y in (2, 3):
+                dc.DrawBitmap(mbt.GetTile(x, y), (x-2)*mbt.tile_size_x,
+                              (y-2)*mbt.tile_size_y)
+        dc.SelectObject(wx.NullBitmap)
+
+app = wx.App()
+app_frame = AppFrame()
+app_frame.Show()
+app.MainLoop()
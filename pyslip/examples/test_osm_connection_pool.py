@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the keep-alive tile server connection pool used by OSMTiles.
+
+Uses a local stand-in tile server that counts the connections made to it.
+Also reports the time to fetch tiles with and without the pool.
+"""
+
+import time
+import threading
+import unittest
+import urllib2
+import BaseHTTPServer
+import SocketServer
+
+import pyslip.osm_tiles as osm_tiles
+
+
+# the fake tile data served
+TileData = '\xff\xd8' + 'x'*2000
+
+# number of tiles to fetch in the timing test
+NumTiles = 200
+
+# delay (seconds) for each new connection, standing in for handshake time
+ConnectDelay = 0.005
+
+
+class TileHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve fake tiles, keeping connections alive."""
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1       # send each response in one write, avoids Nagle delays
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connects += 1
+        time.sleep(ConnectDelay)
+
+    def do_GET(self):
+        if self.path.startswith('/missing/'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(TileData)))
+        self.end_headers()
+        self.wfile.write(TileData)
+
+        if self.path.startswith('/drop/'):
+            # drop the connection without telling the client
+            self.close_connection = 1
+
+    def log_message(self, format, *args):
+        pass
+
+class TileServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    connects = 0
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = TileServer(('127.0.0.1', 0), TileHandler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testReuse(self):
+        """Check one connection serves many tiles."""
+
+        pool = osm_tiles.ConnectionPool(self.url)
+        for x in range(20):
+            (status, content_type, data) = pool.fetch('/tiles/1/%d/0.jpg' % x)
+            self.assertEqual(status, 200)
+            self.assertEqual(content_type, 'image/jpeg')
+            self.assertEqual(data, TileData)
+        self.assertEqual(pool.connects, 1)
+        self.assertEqual(self.server.connects, 1)
+
+        # an error response doesn't lose the connection
+        (status, _, _) = pool.fetch('/missing/1/0/0.jpg')
+        self.assertEqual(status, 404)
+        pool.fetch('/tiles/1/0/0.jpg')
+        self.assertEqual(pool.connects, 1)
+        pool.close()
+
+    def testReconnect(self):
+        """Check a connection closed by the server is replaced."""
+
+        pool = osm_tiles.ConnectionPool(self.url)
+        (status, _, _) = pool.fetch('/drop/1/0/0.jpg')
+        self.assertEqual(status, 200)
+        time.sleep(0.1)         # let the server close the connection
+        (status, _, data) = pool.fetch('/tiles/1/0/0.jpg')
+        self.assertEqual(status, 200)
+        self.assertEqual(data, TileData)
+        self.assertEqual(pool.connects, 2)
+        pool.close()
+
+    def testPoolSize(self):
+        """Check no more than 'size' idle connections are kept."""
+
+        pool = osm_tiles.ConnectionPool(self.url, size=2)
+        conns = [pool._connect() for _ in range(4)]
+        for conn in conns:
+            pool._release(conn)
+        self.assertEqual(pool.idle.qsize(), 2)
+        pool.close()
+        self.assertEqual(pool.idle.qsize(), 0)
+
+    def testSpeed(self):
+        """Compare fetch time with the pool and with urllib2."""
+
+        pool = osm_tiles.ConnectionPool(self.url)
+        start = time.time()
+        for x in range(NumTiles):
+            pool.fetch('/tiles/1/%d/0.jpg' % x)
+        pool_delta = time.time() - start
+        pool.close()
+
+        start = time.time()
+        for x in range(NumTiles):
+            urllib2.urlopen(self.url + '/tiles/1/%d/0.jpg' % x).read()
+        urllib2_delta = time.time() - start
+
+        print('\n%d tiles: pool %.3fs, urllib2 %.3fs'
+              % (NumTiles, pool_delta, urllib2_delta))
+        self.assertEqual(pool.connects, 1)
+
+################################################################################
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(TestConnectionPool, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test and benchmark the OSM tile fetchers.
+
+Fetches tiles from a local stand-in tile server that delays every response
+with the threaded TileWorker fetcher and with the single thread
+AsyncTileFetcher.
+
+Requires a wxPython application to be created before use.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import cStringIO
+import BaseHTTPServer
+import SocketServer
+import wx
+
+import pyslip.osm_tiles as osm_tiles
+import pyslip.osm_seed as osm_seed
+
+
+# delay (seconds) for each tile served
+Latency = 0.1
+
+# number of tiles fetched for the benchmark
+NumTiles = 400
+
+# stand-in tile servers, as OSMTiles.TileServers (all the local server)
+NumServers = 4
+
+# the tile path on the server
+TilePath = '/tiles/%d/%d/%d.jpg'
+
+# the ETag and lifetime of every tile served
+TileETag = '"v1"'
+TileMaxAge = 3600
+
+DefaultAppSize = (512, 512)
+DemoName = 'OSM Fetchers Test'
+DemoVersion = '0.1'
+
+
+class TileHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve one tile for all requests, after a delay."""
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1       # send each response in one write, avoids Nagle delays
+
+    def do_GET(self):
+        time.sleep(Latency)
+        if self.path.startswith('/missing/'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.headers.get('If-None-Match', None) == TileETag:
+            self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', TileETag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.server.tile_data)))
+        self.send_header('ETag', TileETag)
+        self.send_header('Cache-Control', 'max-age=%d' % TileMaxAge)
+        if self.headers.get('Connection', '').lower() == 'keep-alive':
+            self.send_header('Connection', 'keep-alive')
+        self.end_headers()
+        self.wfile.write(self.server.tile_data)
+
+    def log_message(self, format, *args):
+        pass
+
+class TileServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+    not_modified = 0
+
+class AppFrame(wx.Frame):
+
+    def __init__(self):
+        wx.Frame.__init__(self, None, size=DefaultAppSize,
+                          title='%s %s' % (DemoName, DemoVersion))
+        self.SetMinSize(DefaultAppSize)
+        self.panel = wx.Panel(self, wx.ID_ANY)
+        self.panel.SetBackgroundColour(wx.WHITE)
+        self.panel.ClearBackground()
+        self.Bind(wx.EVT_CLOSE, self.onClose)
+
+        unittest.main()
+
+    def onClose(self, event):
+        self.Destroy()
+
+class TestOSMFetchers(unittest.TestCase):
+
+    def setUp(self):
+        # make a real JPEG tile to serve
+        stream = cStringIO.StringIO()
+        wx.EmptyImage(256, 256).SaveStream(stream, wx.BITMAP_TYPE_JPEG)
+
+        self.server = TileServer(('127.0.0.1', 0), TileHandler)
+        self.server.tile_data = stream.getvalue()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.error_tile = wx.EmptyImage(256, 256)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fetch(self, start_fetcher, keys):
+        """Fetch tiles for 'keys', return (results, seconds taken).
+
+        start_fetcher  function start_fetcher(requests, callafter) that
+                       starts fetching from the request queue
+        """
+
+        results = {}
+        def callafter(level, x, y, image, error):
+            results[(level, x, y)] = (image, error)
+
+        requests = osm_tiles.TileRequestQueue()
+        for key in keys:
+            requests.put(key)
+
+        start = time.time()
+        start_fetcher(requests, callafter)
+        while len(results) < len(keys):
+            wx.GetApp().ProcessPendingEvents()      # run the CallAfter()s
+            time.sleep(0.001)
+            if time.time() - start > 60:
+                break
+        return (results, time.time() - start)
+
+    def start_threads(self, requests, callafter):
+        """Start the threaded fetcher as OSMTiles does."""
+
+        for _ in range(NumServers):
+            pool = osm_tiles.ConnectionPool(self.url)
+            for _ in range(osm_tiles.OSMTiles.MaxServerRequests):
+                worker = osm_tiles.TileWorker(pool, TilePath, requests,
+                                              callafter, self.error_tile)
+                worker.start()
+
+    def start_async(self, requests, callafter):
+        """Start the async fetcher as OSMTiles does."""
+
+        self.fetcher = osm_tiles.AsyncTileFetcher(
+                               [self.url]*NumServers, TilePath, requests,
+                               callafter, self.error_tile,
+                               osm_tiles.OSMTiles.MaxAsyncServerRequests)
+        self.fetcher.start()
+
+    def testAsync(self):
+        """Check the async fetcher returns tiles and errors."""
+
+        keys = [(1, x, 0) for x in range(10)]
+        (results, _) = self.fetch(self.start_async, keys)
+        self.assertEqual(sorted(results.keys()), keys)
+        for (image, error) in results.values():
+            self.assertFalse(error)
+            self.assertEqual(image.GetWidth(), 256)
+
+        # keep-alive connections were reused for a second batch
+        connects = self.fetcher.connects
+        requests = self.fetcher.requests
+        results.clear()
+        for x in range(10):
+            requests.put((2, x, 0))
+        while len(results) < 10:
+            wx.GetApp().ProcessPendingEvents()
+            time.sleep(0.001)
+        self.assertEqual(self.fetcher.connects, connects)
+
+    def testAsyncError(self):
+        """Check the async fetcher returns the error tile on error."""
+
+        def start_fetcher(requests, callafter):
+            fetcher = osm_tiles.AsyncTileFetcher(
+                               [self.url], '/missing/%d/%d/%d.jpg', requests,
+                               callafter, self.error_tile, 4)
+            fetcher.start()
+
+        (results, _) = self.fetch(start_fetcher, [(1, 0, 0)])
+        self.assertEqual(results[(1, 0, 0)], (self.error_tile, True))
+
+    def testStoreRaw(self):
+        """Check both fetchers write tile files exactly as fetched."""
+
+        tiles_dir = tempfile.mkdtemp()
+        try:
+            def start_threads(requests, callafter):
+                pool = osm_tiles.ConnectionPool(self.url)
+                osm_tiles.TileWorker(pool, TilePath, requests, callafter,
+                                     self.error_tile,
+                                     tiles_dir=tiles_dir).start()
+
+            def start_async(requests, callafter):
+                osm_tiles.AsyncTileFetcher([self.url], TilePath, requests,
+                                           callafter, self.error_tile, 4,
+                                           tiles_dir=tiles_dir).start()
+
+            for (level, start_fetcher) in [(1, start_threads),
+                                           (2, start_async)]:
+                keys = [(level, x, 0) for x in range(4)]
+                self.fetch(start_fetcher, keys)
+                for key in keys:
+                    path = os.path.join(tiles_dir, osm_tiles.TilePath % key)
+                    with open(path, 'rb') as fd:
+                        self.assertEqual(fd.read(), self.server.tile_data)
+                # just the tile and its metadata, no temporary files
+                self.assertEqual(len(os.listdir(os.path.join(tiles_dir,
+                                                             str(level), '0'))),
+                                 2)
+        finally:
+            shutil.rmtree(tiles_dir)
+
+    def testRevalidate(self):
+        """Check cached tiles are revalidated with conditional GETs."""
+
+        tiles_dir = tempfile.mkdtemp()
+        try:
+            def start_threads(requests, callafter):
+                pool = osm_tiles.ConnectionPool(self.url)
+                osm_tiles.TileWorker(pool, TilePath, requests, callafter,
+                                     self.error_tile,
+                                     tiles_dir=tiles_dir).start()
+
+            def start_async(requests, callafter):
+                osm_tiles.AsyncTileFetcher([self.url], TilePath, requests,
+                                           callafter, self.error_tile, 4,
+                                           tiles_dir=tiles_dir).start()
+
+            for start_fetcher in (start_threads, start_async):
+                shutil.rmtree(tiles_dir)
+                key = (1, 0, 0)
+
+                # first fetch gets the tile and its metadata
+                (results, _) = self.fetch(start_fetcher, [key])
+                self.assertFalse(results[key][0] is None)
+                meta = osm_tiles.ReadTileMeta(tiles_dir, key)
+                self.assertEqual(meta['etag'], TileETag)
+                self.assertEqual(meta['max_age'], TileMaxAge)
+
+                # fetching again just revalidates
+                not_modified = self.server.not_modified
+                (results, _) = self.fetch(start_fetcher, [key])
+                self.assertEqual(results[key], (None, False))
+                self.assertEqual(self.server.not_modified, not_modified + 1)
+                new_meta = osm_tiles.ReadTileMeta(tiles_dir, key)
+                self.assertTrue(new_meta['fetched'] >= meta['fetched'])
+        finally:
+            shutil.rmtree(tiles_dir, ignore_errors=True)
+
+    def testStale(self):
+        """Check when the disk cache says a tile has expired."""
+
+        tiles_dir = tempfile.mkdtemp()
+        try:
+            cache = osm_tiles.OSMCache(tiles_dir=tiles_dir, max_age=100)
+            key = (1, 0, 0)
+            osm_tiles.WriteTileFile(tiles_dir, key, self.server.tile_data)
+
+            # no metadata, the file time and default lifetime are used
+            self.assertFalse(cache.is_stale(key))
+            tile_path = os.path.join(tiles_dir, osm_tiles.TilePath % key)
+            old = time.time() - 200
+            os.utime(tile_path, (old, old))
+            self.assertTrue(cache.is_stale(key))
+
+            # the server's lifetime beats the default
+            meta = {'etag': TileETag, 'last_modified': None,
+                    'fetched': old, 'max_age': 1000}
+            osm_tiles.WriteTileMeta(tiles_dir, key, meta)
+            self.assertFalse(cache.is_stale(key))
+            meta['max_age'] = None
+            osm_tiles.WriteTileMeta(tiles_dir, key, meta)
+            self.assertTrue(cache.is_stale(key))
+
+            # loading a tile doesn't check it, that's done after drawing
+            stale = []
+            cache.stale_callback = stale.append
+            self.assertFalse(cache[key] is None)
+            self.assertEqual(stale, [])
+            self.assertEqual(cache.unchecked, set([key]))
+            wx.GetApp().ProcessPendingEvents()      # run the CallAfter()s
+            self.assertEqual(stale, [key])
+            self.assertEqual(cache.unchecked, set())
+        finally:
+            shutil.rmtree(tiles_dir)
+
+    def testSeed(self):
+        """Check the seeder fetches missing tiles and skips cached ones."""
+
+        tiles_dir = tempfile.mkdtemp()
+        servers = osm_tiles.OSMTiles.TileServers
+        osm_tiles.OSMTiles.TileServers = [self.url]
+        try:
+            ranges = osm_seed.TileRanges((140.0, -40.0, 155.0, -30.0), [5])
+            self.assertEqual(ranges, [(5, 28, 29, 18, 19)])
+
+            seeder = osm_seed.Seeder(tiles_dir, 4)
+            self.assertEqual(seeder.seed(ranges), 0)
+            self.assertEqual((seeder.fetched, seeder.skipped), (4, 0))
+
+            # every thread sharing a pool can keep its connection open
+            self.assertEqual(seeder.pools[0].size, 4)
+            self.assertTrue(seeder.pools[0].connects <= 4)
+
+            # delete one tile, only that one is fetched again
+            os.remove(os.path.join(tiles_dir, osm_tiles.TilePath % (5, 28, 18)))
+            seeder = osm_seed.Seeder(tiles_dir, 4)
+            self.assertEqual(seeder.seed(ranges), 0)
+            self.assertEqual((seeder.fetched, seeder.skipped), (1, 3))
+        finally:
+            osm_tiles.OSMTiles.TileServers = servers
+            shutil.rmtree(tiles_dir)
+
+    def testBenchmark(self):
+        """Compare the threaded and async fetchers."""
+
+        keys = [(10, x, y) for x in range(20) for y in range(NumTiles/20)]
+
+        (results, threads_delta) = self.fetch(self.start_threads, keys)
+        self.assertEqual(len(results), NumTiles)
+        (results, async_delta) = self.fetch(self.start_async, keys)
+        self.assertEqual(len(results), NumTiles)
+
+        print('\n%d tiles, %.2fs latency: threads %.2fs, async %.2fs'
+              % (NumTiles, Latency, threads_delta, async_delta))
+        self.assertTrue(async_delta < threads_delta)
+
+app = wx.App()
+app_frame = AppFrame()
+app_frame.Show()
+app.MainLoop()
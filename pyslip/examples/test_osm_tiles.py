@@ -71,6 +71,57 @@ class TestOSMTiles(unittest.TestCase):
             else:
                 print('level %d not available' % level)
 
+    def testPrefetch(self):
+        """Check which tiles are prefetched and their priorities."""
+
+        cache = osm_tiles.OSMTiles(tiles_dir=TilesDir, prefetch=False)
+        cache.UseLevel(3)
+        cache.visible = (3, 2, 3, 2, 3)
+
+        # still view, ring of 12 tiles then 4 parents
+        wanted = cache._prefetch_tiles(0, 0, 0)
+        ring = [key for key in wanted if key[0] == 3]
+        self.assertEqual(len(ring), 12)
+        self.assertEqual(sorted([key for key in wanted if key[0] == 2]),
+                         [(2, 1, 1)])
+        self.assertTrue(max([wanted[key] for key in ring])
+                        < wanted[(2, 1, 1)])
+
+        # moving right widens the ring on the right
+        wanted = cache._prefetch_tiles(1, 0, 0)
+        self.assertTrue((3, 5, 2) in wanted)
+        self.assertFalse((3, 0, 2) in wanted)
+
+        # zooming in fetches the 16 children, not the parent
+        wanted = cache._prefetch_tiles(0, 0, 1)
+        self.assertEqual(len([key for key in wanted if key[0] == 4]), 16)
+        self.assertFalse((2, 1, 1) in wanted)
+
+        # visible tiles beat prefetched ones
+        cache.prefetch_wanted = wanted
+        self.assertTrue(cache._request_priority((3, 2, 2))
+                        < cache._request_priority((3, 1, 1)))
+        self.assertTrue(cache._request_priority((5, 0, 0)) is None)
+
+    def testArrayConvert(self):
+        """Check batch conversions agree with one at a time conversions."""
+
+        cache = osm_tiles.OSMTiles(tiles_dir=TilesDir, prefetch=False)
+        cache.UseLevel(5)
+        lons = [-170.0, 0.0, 7.605916, 151.2]
+        lats = [-60.0, 0.0, 50.364444, -33.9]
+
+        (xtiles, ytiles) = cache.Geo2TileArray(lons, lats)
+        for (lon, lat, xtile, ytile) in zip(lons, lats, xtiles, ytiles):
+            (x, y) = cache.Geo2Tile((lon, lat))
+            self.assertAlmostEqual(xtile, x)
+            self.assertAlmostEqual(ytile, y)
+
+        (xgeos, ygeos) = cache.Tile2GeoArray(xtiles, ytiles)
+        for (lon, lat, xgeo, ygeo) in zip(lons, lats, xgeos, ygeos):
+            self.assertAlmostEqual(xgeo, lon)
+            self.assertAlmostEqual(ygeo, lat)
+
     def XtestErrors(self):
         """Test possible errors."""
 
@@ -140,6 +191,59 @@ class TestOSMTiles(unittest.TestCase):
         # we have to delay for internet response
         time.sleep(30)
 
+class TestTileRequestQueue(unittest.TestCase):
+
+    def testPriority(self):
+        """Check requests are got in priority order, then put order."""
+
+        queue = osm_tiles.TileRequestQueue()
+        queue.put((1, 0, 0), 5)
+        queue.put((1, 1, 0), 1)
+        queue.put((1, 2, 0), 5)
+        queue.put((1, 3, 0), 0)
+        self.assertEqual(queue.qsize(), 4)
+        self.assertEqual([queue.get() for _ in range(4)],
+                         [(1, 3, 0), (1, 1, 0), (1, 0, 0), (1, 2, 0)])
+        self.assertEqual(queue.qsize(), 0)
+
+    def testReprioritise(self):
+        """Check requests can be reordered and cancelled."""
+
+        queue = osm_tiles.TileRequestQueue()
+        for x in range(5):
+            queue.put((1, x, 0), x)
+
+        # reverse the order and cancel odd X
+        def priority(key):
+            (_, x, _) = key
+            if x % 2:
+                return None
+            return -x
+
+        cancelled = queue.reprioritise(priority)
+        self.assertEqual(sorted(cancelled), [(1, 1, 0), (1, 3, 0)])
+        self.assertEqual(queue.qsize(), 3)
+        self.assertEqual([queue.get() for _ in range(3)],
+                         [(1, 4, 0), (1, 2, 0), (1, 0, 0)])
+
+        # putting a queued key again just changes its priority
+        queue.put((2, 0, 0), 9)
+        queue.put((2, 1, 0), 5)
+        queue.put((2, 0, 0), 1)
+        self.assertEqual(queue.qsize(), 2)
+        self.assertEqual(queue.get(), (2, 0, 0))
+
+    def testJoin(self):
+        """Check join() returns when every request is done or cancelled."""
+
+        queue = osm_tiles.TileRequestQueue()
+        queue.put((1, 0, 0))
+        queue.put((1, 1, 0))
+        key = queue.get()
+        queue.task_done()
+        queue.reprioritise(lambda key: None)
+        queue.join()            # would hang if counts were wrong
+
 
 app = wx.App()
 app_frame = AppFrame()
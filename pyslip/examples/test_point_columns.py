@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the columnar point layer storage.
+
+The memory and time taken by a big column layer in pySlip is measured in
+test_pyslip_layers.py.
+"""
+
+import random
+import unittest
+
+import pyslip.point_columns as point_columns
+import pyslip.spatial_index as spatial_index
+
+
+# attributes shared by the test points
+Defaults = ('cc', 3, '#ff0000', 0, 0, None)
+
+
+def tuple_points(points, defaults):
+    """Make point tuples the way AddPointLayer() does, for comparison."""
+
+    (placement, radius, colour, offset_x, offset_y, udata) = defaults
+    draw_data = []
+    for pt in points:
+        if len(pt) == 3:
+            (x, y, attributes) = pt
+        else:
+            (x, y) = pt
+            attributes = {}
+        draw_data.append((float(x), float(y),
+                          attributes.get('placement', placement).lower(),
+                          attributes.get('radius', radius),
+                          attributes.get('colour', colour),
+                          attributes.get('offset_x', offset_x),
+                          attributes.get('offset_y', offset_y),
+                          attributes.get('data', udata)))
+    return draw_data
+
+
+
+class TestPointColumns(unittest.TestCase):
+
+    def test_tuples(self):
+        """Check columns give the same point tuples AddPointLayer() makes."""
+
+        random.seed(1)
+        points = [(random.uniform(-180, 180), random.uniform(-85, 85))
+                  for _ in range(1000)]
+        points[10] = points[10] + ({'radius': 8, 'data': 'ten'},)
+        points[999] = points[999] + ({'placement': 'NW', 'offset_x': -4},)
+        expected = tuple_points(points, Defaults)
+
+        xs = [pt[0] for pt in points]
+        ys = [pt[1] for pt in points]
+        overrides = {10: expected[10][2:], 999: expected[999][2:]}
+        columns = point_columns.PointColumns(xs, ys, Defaults, overrides)
+
+        self.assertEqual(len(columns), len(expected))
+        self.assertEqual(list(columns), expected)
+        self.assertEqual([columns[i] for i in range(len(columns))], expected)
+        self.assertEqual(columns[-1], expected[-1])
+        self.assertEqual(columns.margin(), 8)
+
+    def test_index(self):
+        """Check the column index finds the points a box index finds."""
+
+        random.seed(2)
+        xs = [random.uniform(-180, 180) for _ in range(1000)]
+        ys = [random.uniform(-85, 85) for _ in range(1000)]
+        columns = point_columns.PointColumns(xs, ys, Defaults)
+        boxes = [(x, x, y, y) for (x, y) in zip(xs, ys)]
+
+        index = spatial_index.PointGridIndex(columns.xs, columns.ys)
+        expected = spatial_index.GridIndex(boxes)
+        for area in [(0, 10, 0, 10), (-180, -170, 80, 85), (100, 120, -50, -40),
+                     (-200, 200, -90, 90)]:
+            self.assertEqual(index.query(*area), expected.query(*area))
+
+    def test_errors(self):
+        """Check columns of different lengths are refused."""
+
+        with self.assertRaises(Exception):
+            point_columns.PointColumns([1.0, 2.0], [1.0], Defaults)
+
+################################################################################
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(TestPointColumns, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
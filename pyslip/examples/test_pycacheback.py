@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the pyCacheBack LRU cache.
+
+Also contains a microbenchmark showing the cost of a cache hit doesn't
+depend on the number of entries in the cache.
+"""
+
+import time
+import unittest
+
+import pyslip.pycacheback as pycacheback
+
+
+class BackedCache(pycacheback.pyCacheBack):
+    """A pyCacheBack with a dictionary as the backing store."""
+
+    def __init__(self, *args, **kwargs):
+        self.back = {}
+        super(BackedCache, self).__init__(*args, **kwargs)
+
+    def _put_to_back(self, key, value):
+        self.back[key] = value
+
+    def _get_from_back(self, key):
+        return self.back[key]
+
+
+class MissingCache(pycacheback.pyCacheBack):
+    """A pyCacheBack that counts lookups of an empty backing store."""
+
+    def __init__(self, *args, **kwargs):
+        self.lookups = 0
+        super(MissingCache, self).__init__(*args, **kwargs)
+
+    def _get_from_back(self, key):
+        if self._known_missing(key):
+            raise KeyError
+        self.lookups += 1
+        self._note_missing(key)
+        raise KeyError
+
+
+class NoneCache(pycacheback.pyCacheBack):
+    """A pyCacheBack whose backing store returns None for missing keys."""
+
+    def __init__(self, *args, **kwargs):
+        self.back = {}
+        self.lookups = 0
+        super(NoneCache, self).__init__(*args, **kwargs)
+
+    def _get_from_back(self, key):
+        if self._known_missing(key):
+            return None
+        self.lookups += 1
+        return self.back.get(key, None)
+
+
+class TestPyCacheBack(unittest.TestCase):
+
+    def test_simple(self):
+        """Check simple set/get."""
+
+        cache = pycacheback.pyCacheBack(max_lru=10)
+        cache['one'] = 1
+        cache['two'] = 2
+        self.assertEqual(cache['one'], 1)
+        self.assertEqual(cache['two'], 2)
+        self.assertEqual(len(cache), 2)
+        self.assertRaises(KeyError, cache.__getitem__, 'three')
+
+    def test_lru_order(self):
+        """Check a 'get' moves a key to the recent end of the LRU."""
+
+        cache = pycacheback.pyCacheBack(max_lru=10)
+        for key in range(5):
+            cache[key] = key
+        self.assertEqual(cache._lru_keys(), [4, 3, 2, 1, 0])
+
+        cache[0]
+        cache[2]
+        self.assertEqual(cache._lru_keys(), [2, 0, 4, 3, 1])
+
+    def test_eviction(self):
+        """Check the least recently used keys are evicted."""
+
+        cache = pycacheback.pyCacheBack(max_lru=3)
+        for key in range(3):
+            cache[key] = key
+        cache[0]                # 1 is now least recently used
+        cache[3] = 3
+        self.assertEqual(sorted(cache.keys()), [0, 2, 3])
+        self.assertEqual(cache._lru_keys(), [3, 0, 2])
+
+    def test_delete(self):
+        """Check del, pop, popitem and clear keep the LRU consistent."""
+
+        cache = pycacheback.pyCacheBack(max_lru=10)
+        for key in range(5):
+            cache[key] = key
+
+        del cache[2]
+        self.assertEqual(cache._lru_keys(), [4, 3, 1, 0])
+        self.assertEqual(cache.pop(3), 3)
+        self.assertEqual(cache.pop(3, None), None)
+        self.assertEqual(cache._lru_keys(), [4, 1, 0])
+        (key, value) = cache.popitem()
+        self.assertFalse(key in cache._lru_keys())
+        self.assertEqual(len(cache._lru_keys()), len(cache))
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache._lru_keys(), [])
+
+    def test_backing_store(self):
+        """Check evicted entries are fetched from the backing store."""
+
+        cache = BackedCache(max_lru=2)
+        for key in range(5):
+            cache[key] = key * 10
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache[0], 0)       # from backing store
+        self.assertTrue(0 in cache)         # and now in memory
+        self.assertEqual(len(cache), 2)
+        self.assertRaises(KeyError, cache.__getitem__, 99)
+
+    def test_init_entries(self):
+        """Check entries passed to the constructor are in the LRU."""
+
+        cache = pycacheback.pyCacheBack({1: 'one', 2: 'two', 3: 'three'},
+                                        max_lru=2)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(len(cache._lru_keys()), 2)
+
+    def test_max_bytes(self):
+        """Check a byte budget evicts LRU entries until under budget."""
+
+        cache = pycacheback.pyCacheBack(max_lru=None, max_bytes=1000)
+        cache._size_of = len            # size of a string is its length
+        cache['a'] = 'a' * 400
+        cache['b'] = 'b' * 400
+        cache['a']                      # 'b' is now least recently used
+        cache['c'] = 'c' * 400
+
+        self.assertEqual(sorted(cache.keys()), ['a', 'c'])
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['bytes'], 800)
+        self.assertEqual(stats['high_water'], 1200)
+
+        # a value bigger than the budget is kept, but nothing else is
+        cache['d'] = 'd' * 2000
+        self.assertEqual(cache.keys(), ['d'])
+        self.assertEqual(cache.stats()['bytes'], 2000)
+
+        del cache['d']
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_size_of_bitmap(self):
+        """Check the size estimate for bitmap-like objects."""
+
+        class FakeBitmap(object):
+            def GetWidth(self):
+                return 256
+            def GetHeight(self):
+                return 256
+            def GetDepth(self):
+                return 24
+
+        cache = pycacheback.pyCacheBack()
+        self.assertEqual(cache._size_of(FakeBitmap()), 256*256*3)
+
+    def test_missing(self):
+        """Check missing keys are remembered and forgotten when stored."""
+
+        cache = MissingCache(max_missing=2)
+        for _ in range(5):
+            self.assertRaises(KeyError, cache.__getitem__, 'a')
+        self.assertEqual(cache.lookups, 1)
+        self.assertEqual(cache.stats()['missing_hits'], 4)
+
+        # storing the key forgets that it's missing
+        cache['a'] = 1
+        self.assertEqual(cache['a'], 1)
+        self.assertEqual(cache.stats()['missing'], 0)
+
+        # the negative cache is bounded
+        for key in 'bcd':
+            self.assertRaises(KeyError, cache.__getitem__, key)
+        self.assertEqual(cache.stats()['missing'], 2)
+        self.assertRaises(KeyError, cache.__getitem__, 'b')
+        self.assertEqual(cache.lookups, 5)
+
+    def test_missing_ttl(self):
+        """Check remembered missing keys expire."""
+
+        cache = MissingCache(missing_ttl=0.05)
+        self.assertRaises(KeyError, cache.__getitem__, 'a')
+        self.assertRaises(KeyError, cache.__getitem__, 'a')
+        self.assertEqual(cache.lookups, 1)
+        time.sleep(0.1)
+        self.assertRaises(KeyError, cache.__getitem__, 'a')
+        self.assertEqual(cache.lookups, 2)
+
+    def test_missing_none(self):
+        """Check a None from the backing store isn't kept in memory."""
+
+        cache = NoneCache(max_lru=2, missing_ttl=0.05)
+        for _ in range(3):
+            self.assertTrue(cache['a'] is None)
+        self.assertEqual(cache.lookups, 1)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['missing'], 1)
+
+        # the key is found once it appears and the missing entry expires
+        cache.back['a'] = 1
+        time.sleep(0.1)
+        self.assertEqual(cache['a'], 1)
+        self.assertEqual(cache.lookups, 2)
+        self.assertEqual(cache.stats()['missing'], 0)
+
+    def test_hit_cost_flat(self):
+        """Check the cost of a cache hit is flat from 100 to 100000 entries.
+
+        The old list-based LRU did a list.remove() and list.insert() on
+        every hit, so a hit in a big cache was much slower than in a small one.
+        """
+
+        Loops = 100000
+
+        timings = []
+        for size in (100, 1000, 10000, 100000):
+            cache = pycacheback.pyCacheBack(max_lru=size)
+            for key in xrange(size):
+                cache[key] = key
+
+            # hit keys from the middle of the LRU, the worst case before
+            keys = range(size/4, size/4 + 50)
+            start = time.time()
+            for i in xrange(Loops):
+                cache[keys[i % 50]]
+            delta = time.time() - start
+            timings.append((size, delta))
+
+        for (size, delta) in timings:
+            print('%6d entries: %.3f usec/hit' % (size, delta*1000000/Loops))
+
+        (_, small_delta) = timings[0]
+        (_, big_delta) = timings[-1]
+        msg = ('Hit in 100000 entry cache is %.1f times slower than '
+               'in 100 entry cache?' % (big_delta/small_delta))
+        self.assertTrue(big_delta < small_delta * 3, msg)
+
+################################################################################
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(TestPyCacheBack, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
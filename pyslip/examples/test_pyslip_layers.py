@@ -0,0 +1,816 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test pySlip layer drawing, selection and redraw machinery on a real pySlip
+widget.
+
+Uses the local GMT tiles.
+
+Requires a wxPython application to be created before use.
+"""
+
+import os
+import math
+import time
+import random
+import unittest
+import wx
+
+import pyslip
+from pyslip.gmt_local_tiles import GMTTiles
+
+
+# where the pre-generated GMT tiles are
+TilesDir = './gmt_tiles'
+
+# size of the pySlip view
+ViewSize = (400, 300)
+
+# level and view centre the tests start at
+TestLevel = 2
+TestPosition = (145.0, -30.0)
+
+# number of points in the click timing test
+NumClickPoints = 1000000
+
+# number of clicks averaged for the warm click time
+NumClicks = 20
+
+# number of points in the column layer build test
+NumColumnPoints = 1000000
+
+# image used in image layers
+ImageFile = 'graphics/arrow_up.png'
+
+DefaultAppSize = (512, 512)
+DemoName = 'pySlip Layer Test'
+DemoVersion = '0.1'
+
+
+class AppFrame(wx.Frame):
+
+    def __init__(self):
+        wx.Frame.__init__(self, None, size=DefaultAppSize,
+                          title='%s %s' % (DemoName, DemoVersion))
+        self.SetMinSize(DefaultAppSize)
+        self.panel = wx.Panel(self, wx.ID_ANY)
+        self.panel.SetBackgroundColour(wx.WHITE)
+        self.panel.ClearBackground()
+        self.Bind(wx.EVT_CLOSE, self.onClose)
+
+        unittest.main()
+
+    def onClose(self, event):
+        self.Destroy()
+
+def make_view():
+    """Make a pySlip widget on the GMT tiles, at the test level and position.
+
+    Returns (frame, view), destroy the frame when done.
+    """
+
+    frame = wx.Frame(None, size=DefaultAppSize)
+    view = pyslip.PySlip(frame, tile_src=GMTTiles(tiles_dir=TilesDir),
+                         size=ViewSize)
+    view.SetSize(ViewSize)
+    view.OnSize()
+    view.GotoLevelAndPosition(TestLevel, TestPosition)
+    return (frame, view)
+
+def draw(view, region=None):
+    """Draw the view, or a wx.Region of it, into a bitmap as a paint would."""
+
+    bitmap = wx.EmptyBitmap(view.view_width, view.view_height)
+    dc = wx.MemoryDC(bitmap)
+    if region is not None:
+        dc.SetClippingRegionAsRegion(region)
+    view.Draw(dc, region)
+    dc.SelectObject(wx.NullBitmap)
+
+def run_events(seconds):
+    """Run the event loop for a while, so timers can fire."""
+
+    end = time.time() + seconds
+    while time.time() < end:
+        wx.GetApp().Yield(True)
+        time.sleep(0.001)
+
+def pan(view, dx, dy):
+    """Move the view over the map, as a drag would."""
+
+    view.view_offset_x += dx
+    view.view_offset_y += dy
+    view.RecalcViewLimits()
+
+def random_geo(count, spread=10.0):
+    """Get 'count' random geo positions around TestPosition."""
+
+    (lon, lat) = TestPosition
+    return [(random.uniform(lon - spread, lon + spread),
+             random.uniform(lat - spread, lat + spread))
+            for _ in xrange(count)]
+
+def clicks(view, data, count):
+    """Get click positions, half on layer objects, half anywhere in the view."""
+
+    result = []
+    for i in range(count):
+        if i % 2:
+            (x, y) = random.choice(data)[:2]
+            result.append((x + random.uniform(-0.01, 0.01),
+                           y + random.uniform(-0.01, 0.01)))
+        else:
+            result.append(view.View2Geo((random.randint(0, view.view_width),
+                                         random.randint(0, view.view_height))))
+    return result
+
+def resident():
+    """Get the bytes of memory this process uses, None if unknown."""
+
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+def full_scan(layer, select, *args):
+    """Select from a layer without its spatial index, as before indexing."""
+
+    index = layer.index
+    layer.index = None
+    try:
+        return select(layer, *args)
+    finally:
+        layer.index = index
+
+
+class TestLayerCache(unittest.TestCase):
+
+    def setUp(self):
+        (self.frame, self.view) = make_view()
+        points = [(145.0 + d, -30.0 + d) for d in range(-3, 4)]
+        self.id = self.view.AddPointLayer(points)
+        self.view.SetLayerCached(self.id)
+        self.layer = self.view.layer_mapping[self.id]
+
+    def tearDown(self):
+        self.frame.Destroy()
+
+    def testReuse(self):
+        """Check the cached bitmap is drawn again while it covers the view."""
+
+        draw(self.view)
+        cache = self.layer.cache
+        self.assertFalse(cache is None)
+        draw(self.view)
+        self.assertTrue(self.layer.cache is cache)
+
+    def testLevelChange(self):
+        """Check the cached bitmap is remade at a new level."""
+
+        draw(self.view)
+        cache = self.layer.cache
+        self.view.ZoomToLevel(TestLevel + 1)
+        draw(self.view)
+        self.assertFalse(self.layer.cache is cache)
+        self.assertEqual(self.layer.cache[0], TestLevel + 1)
+
+    def testPan(self):
+        """Check the cached bitmap is remade when panned past its margin."""
+
+        margin = self.view.LayerCacheMargin
+        draw(self.view)
+        cache = self.layer.cache
+
+        # inside the margin
+        pan(self.view, margin/2, -margin/2)
+        draw(self.view)
+        self.assertTrue(self.layer.cache is cache)
+
+        # past the margin, the new bitmap is around the view again
+        pan(self.view, margin, 0)
+        draw(self.view)
+        self.assertFalse(self.layer.cache is cache)
+        (_, x, y, _) = self.layer.cache
+        self.assertEqual((x, y), (self.view.view_offset_x - margin,
+                                  self.view.view_offset_y - margin))
+
+    def testInvalidate(self):
+        """Check InvalidateLayerCache() drops the bitmap."""
+
+        draw(self.view)
+        cache = self.layer.cache
+        self.view.InvalidateLayerCache(self.id)
+        self.assertTrue(self.layer.cache is None)
+        draw(self.view)
+        self.assertFalse(self.layer.cache is None)
+        self.assertFalse(self.layer.cache is cache)
+
+    def testUncache(self):
+        """Check an uncached layer drops its bitmap and isn't cached again."""
+
+        draw(self.view)
+        self.view.SetLayerCached(self.id, False)
+        self.assertFalse(self.layer.cached)
+        self.assertTrue(self.layer.cache is None)
+        draw(self.view)
+        self.assertTrue(self.layer.cache is None)
+
+class TestTileUpdate(unittest.TestCase):
+
+    def setUp(self):
+        (self.frame, self.view) = make_view()
+        run_events(0.1)         # let redraws from setting up finish
+
+        # note the areas redrawn after tiles arrive
+        self.regions = []
+        self.view.UpdateRegion = lambda region: \
+                                     self.regions.append(region.GetBox())
+
+    def tearDown(self):
+        if self.frame:
+            self.frame.Destroy()
+
+    def tileRect(self, x, y):
+        """Get the view wx.Rect of tile (x, y) at the view level."""
+
+        view = self.view
+        return wx.Rect(x*view.tile_size_x - view.view_offset_x,
+                       y*view.tile_size_y - view.view_offset_y,
+                       view.tile_size_x, view.tile_size_y)
+
+    def visibleTiles(self):
+        """Get the (x, y) of tiles at least partly in the view."""
+
+        view = self.view
+        view_rect = wx.Rect(0, 0, view.view_width, view.view_height)
+        return [(x, y) for x in range(view.tiles.num_tiles_x)
+                       for y in range(view.tiles.num_tiles_y)
+                       if self.tileRect(x, y).Intersects(view_rect)]
+
+    def testCoalesce(self):
+        """Check tiles arriving together are redrawn together, once."""
+
+        tiles = self.visibleTiles()[:3]
+        self.assertTrue(len(tiles) > 1)
+        for (x, y) in tiles:
+            self.view.OnTileAvailable(self.view.level, x, y, None, None)
+        self.assertEqual(self.regions, [])
+
+        run_events(5 * self.view.DirtyDelay / 1000.0)
+        expected = self.tileRect(*tiles[0])
+        for (x, y) in tiles[1:]:
+            expected = expected.Union(self.tileRect(x, y))
+        self.assertEqual(self.regions, [expected])
+        self.assertTrue(self.view.dirty_region is None)
+
+    def testNotShown(self):
+        """Check tiles out of view or at another level aren't redrawn."""
+
+        visible = self.visibleTiles()
+        (x, y) = visible[0]
+        self.view.OnTileAvailable(self.view.level + 1, x, y, None, None)
+        self.view.OnTileAvailable(self.view.level - 1, x, y, None, None)
+        for x in range(self.view.tiles.num_tiles_x):
+            for y in range(self.view.tiles.num_tiles_y):
+                if (x, y) not in visible:
+                    self.view.OnTileAvailable(self.view.level, x, y,
+                                              None, None)
+        self.assertTrue(self.view.dirty_region is None)
+
+        run_events(5 * self.view.DirtyDelay / 1000.0)
+        self.assertEqual(self.regions, [])
+
+    def testRegionPaint(self):
+        """Check a layer only paints its data near a redrawn area."""
+
+        random.seed(11)
+        points = random_geo(2000, spread=40.0)
+        id = self.view.AddPointLayer(points)
+        layer = self.view.layer_mapping[id]
+        painted = []
+        painter = layer.painter
+        def record(dc, data, map_rel, view=None):
+            painted.append(list(data))
+            painter(dc, data, map_rel, view=view)
+        layer.painter = record
+
+        draw(self.view)
+        rect = wx.Rect(100, 80, 50, 40)
+        draw(self.view, wx.RegionFromRect(rect))
+        (whole, part) = painted
+        self.assertTrue(len(part) < len(whole) / 4)
+        for obj in whole:
+            (x, y) = self.view.Geo2View(obj[:2])
+            if rect.ContainsXY(int(x), int(y)):
+                self.assertTrue(obj in part)
+
+    def testDeadWindow(self):
+        """Check a redraw due after the window has gone does nothing."""
+
+        update = self.view.UpdateDirty
+        delay = self.view.DirtyDelay
+        self.view.UpdateRect(wx.Rect(0, 0, 10, 10))
+        self.frame.Destroy()
+        run_events(5 * delay / 1000.0)
+        update()
+
+class TestScroll(unittest.TestCase):
+
+    def setUp(self):
+        (self.frame, self.view) = make_view()
+        random.seed(12)
+        self.id = self.view.AddPointLayer(random_geo(500), radius=3)
+        self.view.UpdateNow()
+
+    def tearDown(self):
+        self.frame.Destroy()
+
+    def pixels(self):
+        """Get the pixel data of the view buffer."""
+
+        return self.view.buffer.ConvertToImage().GetData()
+
+    def testScroll(self):
+        """Check a scrolled view is what a full redraw draws."""
+
+        view = self.view
+        for (dx, dy) in [(10, 0), (-25, 0), (0, 17), (0, -9), (13, -21),
+                         (-30, 40), (view.view_width, 0),
+                         (5, view.view_height + 10), (-view.view_width, -3)]:
+            pan(view, dx, dy)
+            view.UpdateScrollNow(dx, dy)
+            scrolled = self.pixels()
+            view.UpdateNow()
+            self.assertTrue(scrolled == self.pixels(),
+                            'scroll by (%d, %d) differs' % (dx, dy))
+
+    def testStrips(self):
+        """Check a diagonal scroll only paints layer data near the strips."""
+
+        layer = self.view.layer_mapping[self.id]
+        painted = []
+        painter = layer.painter
+        def record(dc, data, map_rel, view=None):
+            painted.append(len(data))
+            painter(dc, data, map_rel, view=view)
+        layer.painter = record
+
+        self.view.UpdateNow()
+        pan(self.view, 5, -5)
+        self.view.UpdateScrollNow(5, -5)
+        (whole, strips) = painted
+        self.assertTrue(strips < whole / 2)
+
+    def testCanScroll(self):
+        """Check the view isn't scrolled with anything fixed in it."""
+
+        view = self.view
+        self.assertTrue(view.CanScrollView())
+
+        id = view.AddPointLayer([(10, 10)], map_rel=False)
+        self.assertFalse(view.CanScrollView())
+        view.HideLayer(id)
+        self.assertTrue(view.CanScrollView())
+
+        (view.sbox_1_x, view.sbox_1_y) = (0, 0)
+        (view.sbox_w, view.sbox_h) = (20, 20)
+        self.assertFalse(view.CanScrollView())
+        view.sbox_1_x = view.sbox_1_y = None
+        self.assertTrue(view.CanScrollView())
+
+class TestFrameRate(unittest.TestCase):
+
+    def setUp(self):
+        (self.frame, self.view) = make_view()
+        self.view.SetMaxFPS(10)
+        run_events(0.2)         # let redraws from setting up finish
+
+        # count the redraws, full or partial
+        self.draws = []
+        draw = self.view.Draw
+        def record(dc, region=None):
+            self.draws.append(region)
+            draw(dc, region)
+        self.view.Draw = record
+
+    def tearDown(self):
+        if self.frame:
+            self.frame.Destroy()
+
+    def interval(self):
+        """Seconds to wait for a redraw held back by the governor."""
+
+        return 3.0 / self.view.max_fps
+
+    def testUpdate(self):
+        """Check many updates in one frame interval make one redraw."""
+
+        self.view.UpdateNow()
+        del self.draws[:]
+        for _ in range(50):
+            self.view.Update()
+        self.assertEqual(self.draws, [])
+        run_events(self.interval())
+        self.assertEqual(self.draws, [None])
+
+    def testImmediate(self):
+        """Check immediate and unlimited updates redraw every time."""
+
+        self.view.UpdateNow()
+        del self.draws[:]
+        self.view.Update(immediate=True)
+        self.assertEqual(len(self.draws), 1)
+
+        self.view.SetMaxFPS(None)
+        for _ in range(5):
+            self.view.Update()
+        self.assertEqual(len(self.draws), 6)
+        run_events(0.1)
+        self.assertEqual(len(self.draws), 6)
+
+    def testScroll(self):
+        """Check a burst of drag moves is drawn by one scroll."""
+
+        view = self.view
+        view.UpdateNow()
+        del self.draws[:]
+        for _ in range(20):
+            pan(view, 2, -1)
+            view.UpdateScroll(2, -1)
+        self.assertEqual(self.draws, [])
+        self.assertEqual(view.scroll_pending, (40, -20))
+
+        # a tile arriving meanwhile is drawn with the scroll
+        view.UpdateRect(wx.Rect(100, 100, 10, 10))
+        run_events(self.interval())
+        self.assertEqual(len(self.draws), 1)
+        self.assertTrue(view.scroll_pending is None)
+        self.assertTrue(view.dirty_region is None)
+        box = self.draws[0].GetBox()
+        self.assertTrue(box.ContainsRect(wx.Rect(100, 100, 10, 10)))
+
+        scrolled = view.buffer.ConvertToImage().GetData()
+        view.UpdateNow()
+        self.assertTrue(scrolled == view.buffer.ConvertToImage().GetData())
+
+    def testDeadWindow(self):
+        """Check redraws due after the window has gone do nothing."""
+
+        (update, scroll) = (self.view.UpdateNow,
+                            self.view.UpdateScrollPending)
+        self.view.UpdateNow()
+        pan(self.view, 5, 5)
+        self.view.UpdateScroll(5, 5)
+        self.view.Update()
+        interval = self.interval()
+        self.frame.Destroy()
+        run_events(interval)
+        update()
+        scroll()
+
+class TestClickSelect(unittest.TestCase):
+
+    def setUp(self):
+        (self.frame, self.view) = make_view()
+
+    def tearDown(self):
+        self.frame.Destroy()
+
+    def testPointClick(self):
+        """Check indexed point clicks select what a full scan selects."""
+
+        random.seed(1)
+        points = [(x, y, {'data': i})
+                  for (i, (x, y)) in enumerate(random_geo(2000))]
+        id = self.view.AddPointLayer(points, radius=2)
+        layer = self.view.layer_mapping[id]
+
+        for level in (TestLevel, TestLevel + 2):
+            self.view.GotoLevelAndPosition(level, TestPosition)
+            for geo in clicks(self.view, points, 200):
+                self.assertEqual(self.view.GetPointInLayer(layer, geo),
+                                 full_scan(layer, self.view.GetPointInLayer,
+                                           geo))
+
+    def testTextClick(self):
+        """Check indexed text clicks select what a full scan selects."""
+
+        random.seed(2)
+        text = [(x, y, 'text %d' % i, {'data': i})
+                for (i, (x, y)) in enumerate(random_geo(2000))]
+        id = self.view.AddTextLayer(text)
+        layer = self.view.layer_mapping[id]
+
+        for level in (TestLevel, TestLevel + 2):
+            self.view.GotoLevelAndPosition(level, TestPosition)
+            for geo in clicks(self.view, text, 200):
+                self.assertEqual(self.view.GetTextInLayer(layer, geo),
+                                 full_scan(layer, self.view.GetTextInLayer,
+                                           geo))
+
+    def testClickSpeed(self):
+        """Time clicks on a very big point layer, cold, warm and scanned.
+
+        A cold click is the first at a new level.
+        """
+
+        random.seed(3)
+        points = random_geo(NumClickPoints, spread=40.0)
+        id = self.view.AddPointLayer(points, radius=2)
+        layer = self.view.layer_mapping[id]
+        self.view.GotoLevelAndPosition(TestLevel + 1, TestPosition)
+        geos = clicks(self.view, points, NumClicks + 1)
+
+        start = time.time()
+        self.view.GetPointInLayer(layer, geos[0])
+        cold_delta = time.time() - start
+
+        start = time.time()
+        for geo in geos[1:]:
+            self.view.GetPointInLayer(layer, geo)
+        warm_delta = (time.time() - start) / NumClicks
+
+        start = time.time()
+        full_scan(layer, self.view.GetPointInLayer, geos[0])
+        scan_delta = time.time() - start
+
+        print('\n%d points, click: cold %.5fs, warm %.5fs, scan %.5fs'
+              % (NumClickPoints, cold_delta, warm_delta, scan_delta))
+        self.assertTrue(cold_delta < scan_delta)
+        self.assertTrue(warm_delta < scan_delta)
+
+class TestProjectedPositions(unittest.TestCase):
+
+    def setUp(self):
+        (self.frame, self.view) = make_view()
+        random.seed(8)
+        self.id = self.view.AddPointLayer(random_geo(500))
+        self.layer = self.view.layer_mapping[self.id]
+
+    def tearDown(self):
+        self.frame.Destroy()
+
+    def checkPositions(self):
+        """Check the layer's kept positions at this level are right."""
+
+        view = self.view
+        (map_x, map_y) = view.LayerMapPositions(self.layer)
+        self.assertEqual(len(map_x), len(self.layer.data))
+        for (i, obj) in enumerate(self.layer.data):
+            (xtile, ytile) = view.tiles.Geo2Tile(obj[:2])
+            self.assertAlmostEqual(map_x[i], xtile*view.tile_size_x)
+            self.assertAlmostEqual(map_y[i], ytile*view.tile_size_y)
+            (xview, yview) = view.Geo2View(obj[:2])
+            self.assertAlmostEqual(map_x[i] - view.view_offset_x, xview)
+            self.assertAlmostEqual(map_y[i] - view.view_offset_y, yview)
+
+        # and that drawing uses them
+        (data, positions) = view.LayerDataInViewRect(self.layer, 0, 0,
+                                                     view.view_width,
+                                                     view.view_height)
+        for (obj, (xview, yview)) in zip(data, positions):
+            (x, y) = view.Geo2View(obj[:2])
+            self.assertAlmostEqual(xview, x)
+            self.assertAlmostEqual(yview, y)
+
+    def testLevels(self):
+        """Check kept positions are right at every level."""
+
+        for level in range(self.view.min_level, self.view.max_level + 1):
+            self.view.GotoLevelAndPosition(level, TestPosition)
+            self.checkPositions()
+            self.assertTrue(level in self.layer.projected)
+
+    def testLevelChange(self):
+        """Check a new level doesn't use positions kept for the old level."""
+
+        (old_x, _) = self.view.LayerMapPositions(self.layer)
+        self.view.GotoLevelAndPosition(TestLevel + 1, TestPosition)
+        (new_x, _) = self.view.LayerMapPositions(self.layer)
+        self.assertFalse(new_x is old_x)
+        self.assertNotAlmostEqual(new_x[0], old_x[0])
+        self.checkPositions()
+
+        # going back reuses the old level's positions
+        self.view.GotoLevelAndPosition(TestLevel, TestPosition)
+        self.assertTrue(self.view.LayerMapPositions(self.layer)[0] is old_x)
+
+    def testPan(self):
+        """Check a pan reuses the kept positions."""
+
+        draw(self.view)
+        kept = self.view.LayerMapPositions(self.layer)
+        pan(self.view, 50, -30)
+        draw(self.view)
+        self.assertTrue(self.view.LayerMapPositions(self.layer) is kept)
+        self.checkPositions()
+
+    def testDataChange(self):
+        """Check changed layer data gets new positions."""
+
+        self.view.LayerMapPositions(self.layer)
+        obj = self.layer.data[0]
+        self.layer.data[0] = (obj[0] + 1.0, obj[1] - 1.0) + obj[2:]
+        self.view.InvalidateLayerCache(self.id)
+        self.checkPositions()
+
+    def testBounded(self):
+        """Check only ProjectedLevels levels of positions are kept."""
+
+        levels = range(self.view.min_level, self.view.max_level + 1)
+        self.assertTrue(len(levels) > self.view.ProjectedLevels)
+        for level in levels:
+            self.view.GotoLevelAndPosition(level, TestPosition)
+            self.view.LayerMapPositions(self.layer)
+        self.assertEqual(len(self.layer.projected), self.view.ProjectedLevels)
+        self.assertFalse(levels[0] in self.layer.projected)
+        self.assertTrue(levels[-1] in self.layer.projected)
+
+class TestBoxSelect(unittest.TestCase):
+
+    def setUp(self):
+        (self.frame, self.view) = make_view()
+
+    def tearDown(self):
+        self.frame.Destroy()
+
+    def boxes(self, layer):
+        """Get (ll, ur) geo selection boxes to try on a layer.
+
+        Some have edges on index cell boundaries, some straddle them, the
+        rest are random.
+        """
+
+        index = layer.index
+        (min_x, _, min_y, _) = index.bounds
+        (cell_w, cell_h) = (index.cell_w, index.cell_h)
+
+        result = []
+        for i in range(1, 4):
+            (x, y) = (min_x + i*cell_w, min_y + i*cell_h)
+            result.append(((x, y), (x + 3*cell_w, y + 2*cell_h)))
+            result.append(((x - cell_w/2, y - cell_h/3),
+                           (x + cell_w/2, y + cell_h/3)))
+        for _ in range(20):
+            ((x1, y1), (x2, y2)) = random_geo(2)
+            result.append(((min(x1, x2), min(y1, y2)),
+                           (max(x1, x2), max(y1, y2))))
+        result.append(((-65.0, -66.0), (295.0, 66.0)))     # everything
+        return result
+
+    def check(self, layer, select):
+        """Check indexed box selection selects what a full scan selects."""
+
+        for level in (TestLevel, TestLevel + 1):
+            self.view.GotoLevelAndPosition(level, TestPosition)
+            for (ll, ur) in self.boxes(layer):
+                self.assertEqual(select(layer, ll, ur),
+                                 full_scan(layer, select, ll, ur))
+
+    def testPoints(self):
+        """Check box selection of points."""
+
+        random.seed(4)
+        points = [(x, y, {'data': i})
+                  for (i, (x, y)) in enumerate(random_geo(1000))]
+        id = self.view.AddPointLayer(points)
+        self.check(self.view.layer_mapping[id],
+                   self.view.GetBoxSelPointsInLayer)
+
+    def testImages(self):
+        """Check box selection of images."""
+
+        random.seed(5)
+        images = [(x, y, ImageFile, {'data': i})
+                  for (i, (x, y)) in enumerate(random_geo(300))]
+        id = self.view.AddImageLayer(images)
+        self.check(self.view.layer_mapping[id],
+                   self.view.GetBoxSelImagesInLayer)
+
+    def testTexts(self):
+        """Check box selection of text."""
+
+        random.seed(6)
+        text = [(x, y, 'text %d' % i, {'data': i})
+                for (i, (x, y)) in enumerate(random_geo(500))]
+        id = self.view.AddTextLayer(text)
+        self.check(self.view.layer_mapping[id],
+                   self.view.GetBoxSelTextsInLayer)
+
+    def testPolygons(self):
+        """Check box selection of polygons, some empty, some big."""
+
+        random.seed(7)
+        polys = []
+        for (i, (x, y)) in enumerate(random_geo(200)):
+            size = random.uniform(0.1, 2.0)
+            poly = [(x, y), (x + size, y), (x + size, y + size), (x, y + size)]
+            polys.append((poly, {'data': i}))
+        for i in range(3):
+            # empty polygons have no box, so every query returns them
+            polys.append(([], {'closed': False, 'filled': False,
+                               'data': 'empty %d' % i}))
+        (lon, lat) = TestPosition
+        polys.append(([(lon + 8*math.cos(a*math.pi/50),
+                        lat + 8*math.sin(a*math.pi/50)) for a in range(100)],
+                      {'data': 'big'}))
+        id = self.view.AddPolygonLayer(polys)
+        layer = self.view.layer_mapping[id]
+        self.assertTrue(None in layer.index.boxes)
+        self.check(layer, self.view.GetBoxSelPolygonsInLayer)
+
+class TestPointColumnLayer(unittest.TestCase):
+
+    def setUp(self):
+        (self.frame, self.view) = make_view()
+
+    def tearDown(self):
+        self.frame.Destroy()
+
+    def testSame(self):
+        """Check a column layer draws and selects like a point layer."""
+
+        random.seed(9)
+        points = random_geo(2000)
+        xs = [x for (x, _) in points]
+        ys = [y for (_, y) in points]
+        overrides = {5: {'radius': 6, 'data': 'five'},
+                     1999: {'offset_x': 4, 'data': 'last'}}
+        tuple_points = [pt + (overrides[i],) if i in overrides else pt
+                        for (i, pt) in enumerate(points)]
+        view = self.view
+        columns = view.layer_mapping[view.AddPointColumnLayer(xs, ys,
+                                                               overrides)]
+        tuples = view.layer_mapping[view.AddPointLayer(tuple_points)]
+        self.assertEqual(list(columns.data), list(tuples.data))
+
+        for level in (TestLevel, TestLevel + 2):
+            view.GotoLevelAndPosition(level, TestPosition)
+            self.assertEqual(view.LayerDataInViewRect(columns, 0, 0,
+                                                      view.view_width,
+                                                      view.view_height),
+                             view.LayerDataInViewRect(tuples, 0, 0,
+                                                      view.view_width,
+                                                      view.view_height))
+            for geo in clicks(view, points, 100):
+                self.assertEqual(view.GetPointInLayer(columns, geo),
+                                 view.GetPointInLayer(tuples, geo))
+            for (ll, ur) in [((140.0, -35.0), (150.0, -25.0)),
+                             ((144.9, -30.1), (145.1, -29.9)),
+                             ((-65.0, -66.0), (295.0, 66.0))]:
+                self.assertEqual(view.GetBoxSelPointsInLayer(columns, ll, ur),
+                                 view.GetBoxSelPointsInLayer(tuples, ll, ur))
+
+    def testBuild(self):
+        """Compare making and first drawing a very big column and point layer.
+
+        Times and measures AddPointColumnLayer() and AddPointLayer() with
+        the index they build, then the first draw of a zoomed in view.
+        """
+
+        random.seed(10)
+        points = random_geo(NumColumnPoints, spread=40.0)
+        xs = [x for (x, _) in points]
+        ys = [y for (_, y) in points]
+        view = self.view
+        view.GotoLevelAndPosition(TestLevel + 2, TestPosition)
+
+        # the column layer is kept while the point layer is made, so the
+        # point layer can't reuse memory the column layer let go
+        before = resident()
+        start = time.time()
+        columns_id = view.AddPointColumnLayer(xs, ys)
+        draw(view)
+        columns_delta = time.time() - start
+        after = resident()
+        columns_bytes = None if before is None else after - before
+        view.HideLayer(columns_id)
+
+        before = resident()
+        start = time.time()
+        view.AddPointLayer(points)
+        draw(view)
+        tuples_delta = time.time() - start
+        after = resident()
+        tuples_bytes = None if before is None else after - before
+
+        if columns_bytes is None:
+            print('\n%d points, add and draw: columns %.3fs, points %.3fs'
+                  % (NumColumnPoints, columns_delta, tuples_delta))
+        else:
+            print('\n%d points, add and draw: columns %.1fMB in %.3fs, '
+                  'points %.1fMB in %.3fs'
+                  % (NumColumnPoints, columns_bytes/1e6, columns_delta,
+                     tuples_bytes/1e6, tuples_delta))
+            self.assertTrue(columns_bytes*3 < tuples_bytes)
+        self.assertTrue(columns_delta*2 < tuples_delta)
+
+################################################################################
+
+app = wx.App()
+app_frame = AppFrame()
+app_frame.Show()
+app.MainLoop()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the grid spatial index used to cull layer objects outside the view.
+
+Also reports the time to find the objects in a small area of a big layer,
+and near a click in a very big layer, with the index and with a scan of
+every object, and the time to index a very big layer of points held in
+coordinate columns.
+"""
+
+import math
+import time
+import array
+import random
+import unittest
+
+import pyslip.spatial_index as spatial_index
+
+
+# number of points in the timing test
+NumPoints = 100000
+
+# number of points in the click selection timing test
+NumClickPoints = 1000000
+
+
+def scan(boxes, min_x, max_x, min_y, max_y):
+    """Find overlapping boxes the slow way, for comparison."""
+
+    return [i for (i, box) in enumerate(boxes)
+            if box is None or (box[0] <= max_x and box[1] >= min_x
+                               and box[2] <= max_y and box[3] >= min_y)]
+
+def inside(point, poly):
+    """The ray-cast point-in-polygon test pySlip uses, for comparison."""
+
+    (x, y) = point
+    l_poly = list(poly)
+    l_poly.append(l_poly[0])
+    result = False
+    (p1x, p1y) = l_poly[0]
+    for (p2x, p2y) in l_poly:
+        if min(p1y, p2y) < y <= max(p1y, p2y) and x <= max(p1x, p2x):
+            if p1y != p2y:
+                xinters = (y-p1y)*(p2x-p1x)/(p2y-p1y) + p1x
+            if p1x == p2x or x <= xinters:
+                result = not result
+        (p1x, p1y) = (p2x, p2y)
+    return result
+
+def star(num_points, x=0.0, y=0.0):
+    """Make a star polygon with 2*num_points vertices centred at (x, y)."""
+
+    poly = []
+    for i in range(2*num_points):
+        r = 10.0 if i % 2 else 4.0
+        angle = math.pi * i / num_points
+        poly.append((x + r*math.cos(angle), y + r*math.sin(angle)))
+    return poly
+
+
+class TestGridIndex(unittest.TestCase):
+
+    def test_points(self):
+        """Check points in an area are found, in original order."""
+
+        random.seed(1)
+        boxes = []
+        for _ in range(1000):
+            (x, y) = (random.uniform(-180, 180), random.uniform(-85, 85))
+            boxes.append((x, x, y, y))
+        index = spatial_index.GridIndex(boxes)
+
+        for area in [(0, 10, 0, 10), (-180, -170, 80, 85), (-1, 1, -90, 90),
+                     (100, 120, -50, -40), (200, 210, 0, 10)]:
+            self.assertEqual(index.query(*area), scan(boxes, *area))
+
+        # everything
+        self.assertEqual(index.query(-200, 200, -90, 90), range(len(boxes)))
+
+    def test_extents(self):
+        """Check objects with an extent are found by any part of it."""
+
+        boxes = [(0, 100, 0, 1),            # long thin
+                 (10, 11, 10, 11),
+                 None,                      # always found
+                 (50, 51, -50, 50)]         # tall thin
+        index = spatial_index.GridIndex(boxes)
+        self.assertEqual(index.query(90, 95, 0.5, 0.6), [0, 2])
+        self.assertEqual(index.query(50.5, 50.6, 40, 41), [2, 3])
+        self.assertEqual(index.query(200, 300, 200, 300), [2])
+
+    def test_degenerate(self):
+        """Check an empty layer and all objects at one point."""
+
+        index = spatial_index.GridIndex([])
+        self.assertEqual(index.query(0, 1, 0, 1), [])
+
+        index = spatial_index.GridIndex([(5, 5, 5, 5)] * 10)
+        self.assertEqual(index.query(4, 6, 4, 6), range(10))
+        self.assertEqual(index.query(6, 7, 6, 7), [])
+
+    def test_speed(self):
+        """Compare finding points in a small area with index and scan."""
+
+        random.seed(2)
+        boxes = []
+        for _ in xrange(NumPoints):
+            (x, y) = (random.uniform(-180, 180), random.uniform(-85, 85))
+            boxes.append((x, x, y, y))
+
+        start = time.time()
+        index = spatial_index.GridIndex(boxes)
+        build_delta = time.time() - start
+
+        area = (140, 150, -40, -30)
+        start = time.time()
+        for _ in range(10):
+            found = index.query(*area)
+        index_delta = (time.time() - start) / 10
+
+        start = time.time()
+        expected = scan(boxes, *area)
+        scan_delta = time.time() - start
+
+        print('\n%d points, build %.3fs, query %.5fs, scan %.5fs'
+              % (NumPoints, build_delta, index_delta, scan_delta))
+        self.assertEqual(found, expected)
+        self.assertTrue(index_delta < scan_delta)
+
+    def test_click_speed(self):
+        """Time finding the points near a click in a very big layer.
+
+        A click selects within a few pixels, here about 0.01 degree.
+        """
+
+        random.seed(3)
+        boxes = []
+        for _ in xrange(NumClickPoints):
+            (x, y) = (random.uniform(-180, 180), random.uniform(-85, 85))
+            boxes.append((x, x, y, y))
+        index = spatial_index.GridIndex(boxes)
+
+        clicks = [(random.uniform(-180, 180), random.uniform(-85, 85))
+                  for _ in range(100)]
+        start = time.time()
+        for (x, y) in clicks:
+            index.query(x-0.01, x+0.01, y-0.01, y+0.01)
+        index_delta = (time.time() - start) / len(clicks)
+
+        (x, y) = clicks[0]
+        start = time.time()
+        expected = scan(boxes, x-0.01, x+0.01, y-0.01, y+0.01)
+        scan_delta = time.time() - start
+
+        print('\n%d points, click: index %.6fs, scan %.6fs'
+              % (NumClickPoints, index_delta, scan_delta))
+        self.assertEqual(index.query(x-0.01, x+0.01, y-0.01, y+0.01),
+                         expected)
+        self.assertTrue(index_delta < scan_delta)
+
+class TestPointGridIndex(unittest.TestCase):
+
+    def test_points(self):
+        """Check points in an area are found, in original order."""
+
+        random.seed(6)
+        xs = array.array('d', [random.uniform(-180, 180) for _ in range(1000)])
+        ys = array.array('d', [random.uniform(-85, 85) for _ in range(1000)])
+        boxes = [(x, x, y, y) for (x, y) in zip(xs, ys)]
+        index = spatial_index.PointGridIndex(xs, ys)
+
+        # some areas on cell edges, some across them
+        (min_x, _, min_y, _) = index.bounds
+        edge_x = min_x + 3*index.cell_w
+        edge_y = min_y + 2*index.cell_h
+        for area in [(0, 10, 0, 10), (-180, -170, 80, 85), (-1, 1, -90, 90),
+                     (100, 120, -50, -40), (200, 210, 0, 10),
+                     (edge_x, edge_x, -90, 90), (-200, 200, edge_y, edge_y),
+                     (edge_x-1, edge_x+1, edge_y-1, edge_y+1)]:
+            self.assertEqual(index.query(*area), scan(boxes, *area))
+
+        # every point is found exactly where it is
+        for i in range(0, 1000, 50):
+            self.assertTrue(i in index.query(xs[i], xs[i], ys[i], ys[i]))
+
+        # everything
+        self.assertEqual(index.query(-200, 200, -90, 90), range(len(boxes)))
+
+    def test_degenerate(self):
+        """Check no points and all points at one place."""
+
+        index = spatial_index.PointGridIndex(array.array('d'),
+                                             array.array('d'))
+        self.assertEqual(index.query(0, 1, 0, 1), [])
+
+        index = spatial_index.PointGridIndex([5.0]*10, [5.0]*10)
+        self.assertEqual(index.query(4, 6, 4, 6), range(10))
+        self.assertEqual(index.query(5, 5, 5, 5), range(10))
+        self.assertEqual(index.query(6, 7, 6, 7), [])
+
+    def test_build_speed(self):
+        """Compare building the column index with a box index."""
+
+        random.seed(7)
+        xs = array.array('d', [random.uniform(-180, 180)
+                               for _ in xrange(NumClickPoints)])
+        ys = array.array('d', [random.uniform(-85, 85)
+                               for _ in xrange(NumClickPoints)])
+
+        start = time.time()
+        index = spatial_index.PointGridIndex(xs, ys)
+        columns_delta = time.time() - start
+
+        start = time.time()
+        boxes = [(x, x, y, y) for (x, y) in zip(xs, ys)]
+        expected = spatial_index.GridIndex(boxes)
+        boxes_delta = time.time() - start
+
+        print('\n%d points, build: columns %.3fs, boxes %.3fs'
+              % (NumClickPoints, columns_delta, boxes_delta))
+        for area in [(140, 141, -31, -30), (-0.01, 0.01, -0.01, 0.01)]:
+            self.assertEqual(index.query(*area), expected.query(*area))
+        self.assertTrue(columns_delta < boxes_delta)
+
+class TestPolygonEdgeIndex(unittest.TestCase):
+
+    def test_contains(self):
+        """Check the edge index agrees with the plain ray-cast test."""
+
+        random.seed(4)
+        for poly in [star(3), star(50), star(500, 100.0, -20.0),
+                     [(0, 0), (10, 0), (10, 10), (0, 10)]]:
+            index = spatial_index.PolygonEdgeIndex(poly)
+            xs = [x for (x, _) in poly]
+            ys = [y for (_, y) in poly]
+            for _ in range(2000):
+                point = (random.uniform(min(xs)-1, max(xs)+1),
+                         random.uniform(min(ys)-1, max(ys)+1))
+                self.assertEqual(index.contains(point), inside(point, poly))
+
+    def test_speed(self):
+        """Compare testing points in a big polygon with and without index."""
+
+        poly = star(2500)
+        index = spatial_index.PolygonEdgeIndex(poly)
+        random.seed(5)
+        points = [(random.uniform(-10, 10), random.uniform(-10, 10))
+                  for _ in range(100)]
+
+        start = time.time()
+        for point in points:
+            inside(point, poly)
+        plain_delta = time.time() - start
+
+        start = time.time()
+        for point in points:
+            index.contains(point)
+        index_delta = time.time() - start
+
+        print('\n%d vertex polygon, %d points: plain %.4fs, index %.4fs'
+              % (len(poly), len(points), plain_delta, index_delta))
+        self.assertTrue(index_delta < plain_delta)
+
+################################################################################
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite([unittest.makeSuite(TestGridIndex, 'test'),
+                                unittest.makeSuite(TestPointGridIndex, 'test'),
+                                unittest.makeSuite(TestPolygonEdgeIndex,
+                                                   'test')])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
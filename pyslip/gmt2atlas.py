@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Pack a GMT tile directory tree into per-level memory-mapped atlas files.
+
+Usage: gmt2atlas.py [-h] [-l <levels>] <tiles_dir>
+
+where -h           prints this help and exits
+      -l <levels>  is a comma-separated list of levels to pack (default all)
+      tiles_dir    is the GMT tile directory to pack
+
+The tile files are left in place.  gmt_local_tiles.GMTTiles will use the
+atlas files if every level it serves has been packed.
+"""
+
+import sys
+import time
+import getopt
+
+import gmt_local_tiles
+
+
+def usage(msg=None):
+    if msg:
+        print(('*'*80 + '\n%s\n' + '*'*80) % msg)
+    print(__doc__)
+
+def main(argv):
+    try:
+        (opts, args) = getopt.getopt(argv, 'hl:', ['help', 'levels='])
+    except getopt.error:
+        usage()
+        return 1
+
+    levels = None
+    for (opt, param) in opts:
+        if opt in ['-h', '--help']:
+            usage()
+            return 0
+        elif opt in ['-l', '--levels']:
+            try:
+                levels = [int(l) for l in param.split(',')]
+            except ValueError:
+                usage("Bad level list: '%s'" % param)
+                return 1
+
+    if len(args) != 1:
+        usage()
+        return 1
+    tiles_dir = args[0]
+
+    def progress(level, count):
+        print('level %2d: %d tiles' % (level, count))
+
+    start = time.time()
+    try:
+        count = gmt_local_tiles.PackAtlas(tiles_dir, levels=levels,
+                                          progress=progress)
+    except Exception as e:
+        usage(str(e))
+        return 1
+    print('%d tiles packed in %.1fs' % (count, time.time() - start))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -5,16 +5,31 @@
 A tile source that serves local pre-generated GMT tiles.
 
 Uses pyCacheBack to provide in-memory and on-disk caching.
+
+The tiles may also be packed into a read-only 'atlas' of one data file and
+one index file per level, see PackAtlas().  The atlas files are memory
+mapped so many processes serving the same tileset share the page cache.
 """
 
 import os
 import glob
+import mmap
+import Queue
+import threading
+import struct
 import pickle
+import cStringIO
 import wx
 
 import tiles
 import pycacheback
 
+# numpy is optional, batch conversions are faster with it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 # if we don't have log.py, don't crash
 try:
@@ -49,6 +64,30 @@ class GMTCache(pycacheback.pyCacheBack):
         Raises KeyError if key not in cache.
         """
 
+        # don't look on disk for tiles we know aren't there
+        if self._known_missing(key):
+            return None
+
+        image = self.load_image(key)
+        if image is None:
+            # tile not there, remember that and return None
+            self._note_missing(key)
+            return None
+
+        # we have the tile image - convert, cache & return
+        bitmap = image.ConvertToBitmap()
+        return bitmap
+
+    def load_image(self, key):
+        """Read and decode the tile image for 'key'.
+
+        key  tuple (level, x, y)
+
+        Returns a wx.Image or None if the tile doesn't exist.
+
+        This doesn't change the cache, so may be called from any thread.
+        """
+
         # unpack key
         (level, x, y) = key
 
@@ -56,13 +95,239 @@ class GMTCache(pycacheback.pyCacheBack):
         tile_dir = os.path.join(self._tiles_dir, '%d' % level)
         tile_path = os.path.join(tile_dir, self.TilePath % (x, y))
         if not os.path.exists(tile_path):
-            # tile not there, return None
             return None
 
-        # we have the tile file - read into memory, cache & return
-        image = wx.Image(tile_path, wx.BITMAP_TYPE_ANY)
-        bitmap = image.ConvertToBitmap()
-        return bitmap
+        return wx.Image(tile_path, wx.BITMAP_TYPE_ANY)
+
+######
+# A GMTCache that reads tiles from memory-mapped atlas files.
+#
+# Each level directory holds:
+#     atlas.dat  a header followed by the tile files, concatenated
+#     atlas.idx  a header followed by one fixed-width record per tile
+# The atlas.dat header is (magic, stamp).  The atlas.idx header is
+# (magic, stamp, data_size, num_tiles_x, num_tiles_y) where 'stamp' is a
+# random generation stamp written to both files by one PackAtlas() run and
+# 'data_size' is the size of atlas.dat.  The pair is only used if the stamps
+# and size agree, so a reader never pairs an index with another run's data.
+# The record for tile (x, y) is (offset, length) of the tile file data in
+# atlas.dat, found at position AtlasHeader.size
+# + (y*num_tiles_x + x)*AtlasRecord.size.  A length of 0 means the tile
+# doesn't exist.
+######
+
+AtlasDataFilename = 'atlas.dat'
+AtlasIndexFilename = 'atlas.idx'
+AtlasMagic = 'PSA2'
+AtlasHeader = struct.Struct('<4s8sQII')
+AtlasDataHeader = struct.Struct('<4s8s')
+AtlasRecord = struct.Struct('<QI')
+
+class GMTAtlasCache(GMTCache):
+
+    def __init__(self, *args, **kwargs):
+        self._atlases = {}      # level -> (num_x, num_y, index mmap, data mmap)
+        super(GMTAtlasCache, self).__init__(*args, **kwargs)
+
+    def load_image(self, key):
+        """Decode the tile image for 'key' from the level atlas.
+
+        key  tuple (level, x, y)
+
+        Returns a wx.Image or None if the tile isn't in the atlas.
+        """
+
+        if self._open_atlas(key[0]) is None:
+            # atlas missing or being repacked, the tile files are still there
+            return super(GMTAtlasCache, self).load_image(key)
+
+        data = self.get_tile_data(key)
+        if data is None:
+            return None
+
+        return wx.ImageFromStream(cStringIO.StringIO(data), wx.BITMAP_TYPE_ANY)
+
+    def get_tile_data(self, key):
+        """Get the undecoded tile file data for 'key' from the atlas.
+
+        key  tuple (level, x, y)
+
+        Returns a string of PNG data or None if the tile doesn't exist.
+        """
+
+        (level, x, y) = key
+        atlas = self._open_atlas(level)
+        if atlas is None:
+            return None
+        (num_tiles_x, num_tiles_y, index, data) = atlas
+        if not (0 <= x < num_tiles_x and 0 <= y < num_tiles_y):
+            return None
+
+        record_posn = AtlasHeader.size + (y*num_tiles_x + x)*AtlasRecord.size
+        (offset, length) = AtlasRecord.unpack_from(index, record_posn)
+        if length == 0:
+            return None
+        return data[offset:offset+length]
+
+    def has_atlas(self, level):
+        """Return True if 'level' has atlas files."""
+
+        return self._open_atlas(level) is not None
+
+    def _open_atlas(self, level):
+        """Map the atlas files for a level, if not already done.
+
+        Returns the tuple (num_tiles_x, num_tiles_y, index, data) or None if
+        the level has no atlas.
+
+        An index and data file from different PackAtlas() runs (a reader
+        racing a repack) is treated as no atlas and not remembered, so the
+        next call tries again.
+        """
+
+        try:
+            return self._atlases[level]
+        except KeyError:
+            pass
+
+        level_dir = os.path.join(self._tiles_dir, '%d' % level)
+        atlas = None
+        try:
+            with open(os.path.join(level_dir, AtlasIndexFilename), 'rb') as fd:
+                index = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, stamp, data_size,
+             num_tiles_x, num_tiles_y) = AtlasHeader.unpack_from(index)
+            if magic != AtlasMagic:
+                raise IOError("Bad atlas index for level %d" % level)
+            with open(os.path.join(level_dir, AtlasDataFilename), 'rb') as fd:
+                data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            (data_magic, data_stamp) = AtlasDataHeader.unpack_from(data)
+            if (data_magic != AtlasMagic or data_stamp != stamp
+                    or len(data) != data_size):
+                log('Atlas files for level %d in %s are from different packs'
+                    % (level, self._tiles_dir))
+                index.close()
+                data.close()
+                return None
+            atlas = (num_tiles_x, num_tiles_y, index, data)
+        except (IOError, OSError, struct.error, ValueError) as e:
+            log('No atlas for level %d in %s: %s'
+                % (level, self._tiles_dir, str(e)))
+
+        self._atlases[level] = atlas
+        return atlas
+
+def PackAtlas(tiles_dir, levels=None, progress=None):
+    """Pack the tiles of a GMT tile directory into per-level atlas files.
+
+    tiles_dir  the GMT tile directory
+    levels     list of levels to pack (None means all levels)
+    progress   if not None, function called as progress(level, count)
+               after each level is packed
+
+    Returns the number of tiles packed.
+
+    The tile files are left in place.  Atlas files are written to temporary
+    files and renamed, so a reader never sees a partly written file.  The
+    two renames aren't atomic together, but both files carry the same
+    generation stamp and a reader ignores a mismatched pair.
+    """
+
+    if levels is None:
+        levels = []
+        for path in glob.glob(os.path.join(tiles_dir, '[0-9]*')):
+            if os.path.isdir(path):
+                levels.append(int(os.path.basename(path)))
+        levels.sort()
+
+    total = 0
+    for level in levels:
+        level_dir = os.path.join(tiles_dir, '%d' % level)
+        with open(os.path.join(level_dir, GMTTiles.TileInfoFilename), 'rb') as fd:
+            (num_tiles_x, num_tiles_y, _, _) = pickle.load(fd)
+
+        index_path = os.path.join(level_dir, AtlasIndexFilename)
+        data_path = os.path.join(level_dir, AtlasDataFilename)
+        stamp = os.urandom(8)
+        count = 0
+        offset = AtlasDataHeader.size
+        with open(index_path + '.tmp', 'wb') as index_fd:
+            with open(data_path + '.tmp', 'wb') as data_fd:
+                # data size isn't known yet, header rewritten at the end
+                index_fd.write(AtlasHeader.pack(AtlasMagic, stamp, 0,
+                                                num_tiles_x, num_tiles_y))
+                data_fd.write(AtlasDataHeader.pack(AtlasMagic, stamp))
+                for y in range(num_tiles_y):
+                    for x in range(num_tiles_x):
+                        tile_path = os.path.join(level_dir,
+                                                 GMTCache.TilePath % (x, y))
+                        try:
+                            with open(tile_path, 'rb') as fd:
+                                tile_data = fd.read()
+                        except IOError:
+                            tile_data = ''
+                        index_fd.write(AtlasRecord.pack(offset, len(tile_data)))
+                        data_fd.write(tile_data)
+                        offset += len(tile_data)
+                        if tile_data:
+                            count += 1
+                index_fd.seek(0)
+                index_fd.write(AtlasHeader.pack(AtlasMagic, stamp, offset,
+                                                num_tiles_x, num_tiles_y))
+
+        # rename into place, a reader seeing one new and one old file
+        # finds the stamps differ and doesn't use the atlas
+        for path in (data_path, index_path):
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)     # Windows won't rename over a file
+            os.rename(path + '.tmp', path)
+
+        total += count
+        log('PackAtlas: level %d, %d tiles' % (level, count))
+        if progress:
+            progress(level, count)
+
+    return total
+
+######
+# Thread class to decode tile images off the main thread.
+######
+
+class DecodeWorker(threading.Thread):
+    """Thread class that gets request from queue, decodes tile, calls callback."""
+
+    def __init__(self, cache, requests, callafter):
+        """Prepare the decode worker.
+
+        cache      the GMTCache to load tile images with
+        requests   the request queue
+        callafter  function to CALL AFTER tile decoded
+
+        Results are returned in the CallAfter() params.  The image is None
+        if the tile doesn't exist.
+        """
+
+        threading.Thread.__init__(self)
+
+        self.cache = cache
+        self.requests = requests
+        self.callafter = callafter
+        self.daemon = True
+
+    def run(self):
+        while True:
+            # get zoom level and tile coordinates to decode
+            (level, x, y) = self.requests.get()
+
+            try:
+                image = self.cache.load_image((level, x, y))
+            except Exception as e:
+                log("'%s' exception decoding tile %d,%d,%d\n%s"
+                    % (e.__class__.__name__, level, x, y, str(e)))
+                image = None
+
+            wx.CallAfter(self.callafter, level, x, y, image)
+            self.requests.task_done()
 
 ######
 # Class for pre-generated GMT tiles.   Builds on tiles.Tiles.
@@ -75,16 +340,35 @@ DefaultTileDir = 'gmt_tiles'
 # set maximum number of in-memory tiles for each level
 DefaultMaxLRU = 10000
 
+# set maximum bytes of in-memory tiles (None means no limit)
+DefaultMaxBytes = None
+
+# number of threads decoding tiles if decoding asynchronously
+DefaultDecodeThreads = 4
+
 class GMTTiles(tiles.Tiles):
     """An object to source tiles local GMT tiles for pyslip."""
 
     TileInfoFilename = "tile.info"
 
-    def __init__(self, tiles_dir=DefaultTileDir, tile_levels=None):
+    def __init__(self, tiles_dir=DefaultTileDir, tile_levels=None,
+                 max_lru=DefaultMaxLRU, max_bytes=DefaultMaxBytes,
+                 atlas=None, async_decode=False,
+                 decode_threads=DefaultDecodeThreads):
         """Initialise a GMT local tiles instance.
 
-        tiles_dir    tile cache directory, contains GMT tiles
-        tile_levels  list of tile levels to be served
+        tiles_dir       tile cache directory, contains GMT tiles
+        tile_levels     list of tile levels to be served
+        max_lru         maximum number of tiles held in memory
+        max_bytes       maximum estimated bytes of tiles held in memory
+        atlas           True to read tiles from atlas files (see PackAtlas),
+                        False to read tile files, None to use atlas files
+                        if every level has them
+        async_decode    if True, tiles not in memory are decoded in
+                        background threads and GetTile() returns a
+                        placeholder tile until the "tile available"
+                        callback is called
+        decode_threads  number of background decode threads
         """
 
         # open top-level GMT info file (it MUST be there!)
@@ -117,7 +401,32 @@ class GMTTiles(tiles.Tiles):
         self.max_level = max(self.levels)
 
         # setup the tile cache (note, no callback set since net unused)
-        self.cache = GMTCache(tiles_dir=self.tiles_dir, max_lru=DefaultMaxLRU)
+        self.cache = None
+        if atlas is not False:
+            cache = GMTAtlasCache(tiles_dir=self.tiles_dir, max_lru=max_lru,
+                                  max_bytes=max_bytes)
+            if atlas or all(cache.has_atlas(l) for l in self.levels):
+                self.cache = cache
+        if self.cache is None:
+            self.cache = GMTCache(tiles_dir=self.tiles_dir, max_lru=max_lru,
+                                  max_bytes=max_bytes)
+
+        # no "tile available" callback until told
+        self.available_callback = None
+
+        # set up the decode queue and worker threads, if required
+        self.async_decode = async_decode
+        if async_decode:
+            self.placeholder_tile = self._make_placeholder()
+            self.stand_ins = {}         # see GetStandInTile()
+            self.decode_queue = Queue.Queue()  # entries are (level, x, y)
+            self.queued_requests = {}
+            self.workers = []
+            for _ in range(decode_threads):
+                worker = DecodeWorker(self.cache, self.decode_queue,
+                                      self._tile_decoded)
+                self.workers.append(worker)
+                worker.start()
 
     def SetAvailableCallback(self, callback):
         """Set the "tile now available" callback routine.
@@ -127,10 +436,10 @@ class GMTTiles(tiles.Tiles):
         where 'level' is the level of the tile, 'x' and 'y' are
         the coordinates of the tile and 'image' and 'bitmap' are tile data.
 
-        For GMT tiles we do nothing as they are all local.
+        The callback is only used if tiles are decoded asynchronously.
         """
 
-        pass
+        self.available_callback = callback
 
     def UseLevel(self, level):
         """Prepare to serve tiles from the required level.
@@ -153,6 +462,17 @@ class GMTTiles(tiles.Tiles):
         # store partial path to level dir (small speedup)
         self.tile_level_dir = os.path.join(self.tiles_dir, '%d' % level)
 
+        # don't decode queued tiles for the old level
+        if self.async_decode:
+            self.stand_ins.clear()
+            while True:
+                try:
+                    key = self.decode_queue.get_nowait()
+                except Queue.Empty:
+                    break
+                self.queued_requests.pop(key, None)
+                self.decode_queue.task_done()
+
     def GetInfo(self, level):
         """Get tile info for a particular level.
 
@@ -211,7 +531,60 @@ class GMTTiles(tiles.Tiles):
 #
 #        return bitmap
 
-        return self.cache[(self.level, x, y)]
+        tile_key = (self.level, x, y)
+        if not self.async_decode:
+            return self.cache[tile_key]
+
+        # in memory or known missing, don't queue
+        if tile_key in self.cache:
+            return self.cache[tile_key]
+        if self.cache._known_missing(tile_key):
+            return None
+
+        if tile_key not in self.queued_requests:
+            self.decode_queue.put(tile_key)
+            self.queued_requests[tile_key] = True
+        return self.GetStandInTile(x, y, self.placeholder_tile)
+
+    def _tile_decoded(self, level, x, y, image):
+        """A tile has been decoded.  Called on the main thread.
+
+        level  level for the tile
+        x      x coordinate of tile
+        y      y coordinate of tile
+        image  tile image data, None if tile doesn't exist
+        """
+
+        # remove the request from the queued requests
+        # note that it may not be there - a level change flushes the dict
+        self.queued_requests.pop((level, x, y), None)
+        self.stand_ins.pop((level, x, y), None)
+
+        if image is None:
+            # nothing new to draw
+            self.cache._note_missing((level, x, y))
+            return
+
+        # bitmaps must be made on the main thread
+        bitmap = image.ConvertToBitmap()
+        self.cache._put_to_memory((level, x, y), bitmap)
+
+        # tell the world a new tile is available
+        if self.available_callback:
+            self.available_callback(level, x, y, image, bitmap)
+
+    def _make_placeholder(self):
+        """Make the tile shown while a tile is being decoded.
+
+        A plain tile of the sea colour is least distracting.
+        """
+
+        bitmap = wx.EmptyBitmap(self.tile_size_x, self.tile_size_y)
+        dc = wx.MemoryDC(bitmap)
+        dc.SetBackground(wx.Brush(wx.Colour(*self.sea_colour)))
+        dc.Clear()
+        dc.SelectObject(wx.NullBitmap)
+        return bitmap
 
     def Geo2Tile(self, geo):
         """Convert geo to tile fractional coordinates for level in use.
@@ -262,6 +635,44 @@ class GMTTiles(tiles.Tiles):
 
         return (xgeo, ygeo)
 
+    def Geo2TileArray(self, xgeo, ygeo):
+        """Convert many geo positions to tile fractional coordinates.
+
+        xgeo  sequence of geo X coordinates (numpy array or list)
+        ygeo  sequence of geo Y coordinates
+
+        Returns (xtile, ytile), numpy arrays if numpy is installed, else lists.
+        """
+
+        if np is None:
+            return tiles.Tiles.Geo2TileArray(self, xgeo, ygeo)
+
+        (min_xgeo, max_xgeo, min_ygeo, max_ygeo) = self.extent
+        tdeg_x = self.tile_size_x / self.ppd_x
+        tdeg_y = self.tile_size_y / self.ppd_y
+
+        return ((np.asarray(xgeo, dtype=float) - min_xgeo) / tdeg_x,
+                (max_ygeo - np.asarray(ygeo, dtype=float)) / tdeg_y)
+
+    def Tile2GeoArray(self, xtile, ytile):
+        """Convert many tile fractional coordinates to geo positions.
+
+        xtile  sequence of tile fractional X coordinates (numpy array or list)
+        ytile  sequence of tile fractional Y coordinates
+
+        Returns (xgeo, ygeo), numpy arrays if numpy is installed, else lists.
+        """
+
+        if np is None:
+            return tiles.Tiles.Tile2GeoArray(self, xtile, ytile)
+
+        (min_xgeo, max_xgeo, min_ygeo, max_ygeo) = self.extent
+        tdeg_x = self.tile_size_x / self.ppd_x
+        tdeg_y = self.tile_size_y / self.ppd_y
+
+        return (np.asarray(xtile, dtype=float)*tdeg_x + min_xgeo,
+                max_ygeo - np.asarray(ytile, dtype=float)*tdeg_y)
+
 
 if __name__ == '__main__':
     import unittest
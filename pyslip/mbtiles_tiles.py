@@ -0,0 +1,549 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+A tile source that serves tiles packed into a single SQLite (MBTiles) file.
+
+Uses pyCacheBack to provide in-memory caching with the SQLite file as the
+backing store.  One file holds every tile of every level, so there is no
+open+stat+read of a small file per tile.
+
+The file follows the MBTiles layout (http://mbtiles.org):
+    metadata(name, value)
+    tiles(zoom_level, tile_column, tile_row, tile_data)
+where tile_row counts from the *bottom* of the map.  pySlip also stores
+per-level information in a 'pyslip_levels' table so that GMT tilesets,
+which don't have 2**level tiles on a side, can be served.
+
+ImportTiles() converts an existing GMT or OSM tile directory tree into an
+MBTiles file.  See tiles2mbtiles.py for a command-line interface.
+"""
+
+import os
+import glob
+import math
+import pickle
+import sqlite3
+import cStringIO
+import wx
+
+import tiles
+import pycacheback
+
+# numpy is optional, batch conversions are faster with it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# if we don't have log.py, don't crash
+try:
+    import log
+    log = log.Log('pyslip.log', log.Log.DEBUG)
+except ImportError:
+    def log(*args, **kwargs):
+        pass
+
+
+# attributes used for tileset introspection
+tileset_name = ''
+tileset_shortname = ''
+tileset_version = '1.0'
+
+# the projections we know about
+(ProjectionCartesian, ProjectionMercator) = ('cartesian', 'mercator')
+
+# SQL to create an empty tiles file
+CreateSQL = ['CREATE TABLE metadata (name TEXT, value TEXT)',
+             'CREATE UNIQUE INDEX metadata_index ON metadata (name)',
+             'CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, '
+                 'tile_row INTEGER, tile_data BLOB)',
+             'CREATE UNIQUE INDEX tile_index '
+                 'ON tiles (zoom_level, tile_row, tile_column)',
+             'CREATE TABLE pyslip_levels (zoom_level INTEGER PRIMARY KEY, '
+                 'num_tiles_x INTEGER, num_tiles_y INTEGER, '
+                 'ppd_x REAL, ppd_y REAL)']
+
+# SQL to get one tile and a row of tiles
+GetTileSQL = ('SELECT tile_data FROM tiles '
+              'WHERE zoom_level=? AND tile_column=? AND tile_row=?')
+GetRowSQL = ('SELECT tile_column, tile_data FROM tiles '
+             'WHERE zoom_level=? AND tile_row=? '
+             'AND tile_column BETWEEN ? AND ?')
+PutTileSQL = ('INSERT OR REPLACE INTO tiles '
+              '(zoom_level, tile_column, tile_row, tile_data) '
+              'VALUES (?, ?, ?, ?)')
+
+
+######
+# Override the pyCacheBack object to handle tiles in an SQLite file
+######
+
+class MBTilesCache(pycacheback.pyCacheBack):
+
+    def __init__(self, *args, **kwargs):
+        """Initialise the cache.
+
+        As for pyCacheBack plus these keyword arguments:
+            db          an open sqlite3 connection to the tiles file
+            num_rows    dictionary mapping level to number of tile rows
+        """
+
+        self._db = kwargs.pop('db')
+        self._num_rows = kwargs.pop('num_rows')
+        super(MBTilesCache, self).__init__(*args, **kwargs)
+
+    def _get_from_back(self, key):
+        """Retrieve value for 'key' from backing storage.
+
+        key  tuple (level, x, y)
+             where level is the level of the tile
+                   x, y  is the tile coordinates (integer)
+
+        Raises KeyError if key not in cache.
+        """
+
+        if self._known_missing(key):
+            raise KeyError
+
+        (level, x, y) = key
+        row = self._db.execute(GetTileSQL,
+                               (level, x, self._tms_row(level, y))).fetchone()
+        if row is None:
+            self._note_missing(key)
+            raise KeyError
+
+        return self._decode(row[0])
+
+    def _put_to_back(self, key, value):
+        """Put a tile into the tiles file.
+
+        key    a tuple: (level, x, y)
+        value  the wx.Image or wx.Bitmap to save, saved in PNG format
+        """
+
+        if isinstance(value, wx.Bitmap):
+            value = value.ConvertToImage()
+        stream = cStringIO.StringIO()
+        value.SaveStream(stream, wx.BITMAP_TYPE_PNG)
+
+        (level, x, y) = key
+        self._db.execute(PutTileSQL, (level, x, self._tms_row(level, y),
+                                      sqlite3.Binary(stream.getvalue())))
+        self._db.commit()
+
+    def load_row(self, level, y, x_list):
+        """Read a row of tiles into memory with one query.
+
+        level   level of the tiles
+        y       tile Y coordinate of the row
+        x_list  list of tile X coordinates wanted (left to right)
+
+        Tiles already in memory or known to be missing are not re-read.
+        """
+
+        wanted = [x for x in x_list
+                  if (level, x, y) not in self
+                      and not self._known_missing((level, x, y))]
+        if not wanted:
+            return
+
+        found = set()
+        for (x, data) in self._db.execute(GetRowSQL,
+                                          (level, self._tms_row(level, y),
+                                           min(wanted), max(wanted))):
+            key = (level, x, y)
+            found.add(x)
+            if key not in self:
+                self._put_to_memory(key, self._decode(data))
+
+        for x in wanted:
+            if x not in found:
+                self._note_missing((level, x, y))
+
+    def _tms_row(self, level, y):
+        """Convert a pySlip tile Y coordinate to an MBTiles row number."""
+
+        return self._num_rows[level] - 1 - y
+
+    @staticmethod
+    def _decode(data):
+        """Convert PNG or JPEG data from the tiles file to a bitmap."""
+
+        image = wx.ImageFromStream(cStringIO.StringIO(str(data)),
+                                   wx.BITMAP_TYPE_ANY)
+        return image.ConvertToBitmap()
+
+######
+# Class for tiles in an MBTiles file.   Builds on tiles.Tiles.
+######
+
+# the default tiles file
+DefaultTilesFile = 'tiles.mbtiles'
+
+# set maximum number of in-memory tiles for each level
+DefaultMaxLRU = 10000
+
+# set maximum bytes of in-memory tiles (None means no limit)
+DefaultMaxBytes = None
+
+# colour of the tile drawn where the file has no tile
+DefaultBlankColour = (255, 255, 255)
+
+class MBTiles(tiles.Tiles):
+    """An object to source tiles from an MBTiles file for pyslip."""
+
+    def __init__(self, tiles_file=DefaultTilesFile, tile_levels=None,
+                 max_lru=DefaultMaxLRU, max_bytes=DefaultMaxBytes):
+        """Initialise an MBTiles instance.
+
+        tiles_file   path to the MBTiles file
+        tile_levels  list of tile levels to be served
+        max_lru      maximum number of tiles held in memory
+        max_bytes    maximum estimated bytes of tiles held in memory
+        """
+
+        # sqlite3 will happily create a missing file, we don't want that
+        if not os.path.isfile(tiles_file):
+            raise IOError("'%s' doesn't appear to be a tiles file"
+                          % tiles_file)
+        self.tiles_file = tiles_file
+        self.db = sqlite3.connect(tiles_file)
+
+        metadata = dict(self.db.execute('SELECT name, value FROM metadata'))
+        self.projection = metadata.get('pyslip_projection',
+                                       ProjectionMercator)
+        tile_size = metadata.get('pyslip_tile_size', '256,256')
+        (self.tile_size_x, self.tile_size_y) = [int(s) for s
+                                                in tile_size.split(',')]
+        self.tile_size = (self.tile_size_x, self.tile_size_y)
+
+        # MBTiles 'bounds' is left,bottom,right,top
+        bounds = metadata.get('bounds', '-180.0,-85.0511,180.0,85.0511')
+        (left, bottom, right, top) = [float(b) for b in bounds.split(',')]
+        self.extent = (left, right, bottom, top)
+
+        # get level information, a foreign file won't have pyslip_levels
+        self.level_info = {}
+        try:
+            for (level, num_x, num_y, ppd_x, ppd_y) in self.db.execute(
+                    'SELECT zoom_level, num_tiles_x, num_tiles_y, ppd_x, ppd_y '
+                    'FROM pyslip_levels'):
+                self.level_info[level] = (num_x, num_y, ppd_x, ppd_y)
+        except sqlite3.OperationalError:
+            pass
+        if not self.level_info:
+            for (level,) in self.db.execute('SELECT DISTINCT zoom_level '
+                                            'FROM tiles'):
+                num_tiles = 2 ** level
+                self.level_info[level] = (num_tiles, num_tiles, None, None)
+
+        if tile_levels is None:
+            tile_levels = sorted(self.level_info.keys())
+        self.levels = tile_levels
+        self.min_level = min(self.levels)
+        self.max_level = max(self.levels)
+        self.level = None
+
+        num_rows = dict((level, info[1])
+                        for (level, info) in self.level_info.items())
+        self.cache = MBTilesCache(db=self.db, num_rows=num_rows,
+                                  max_lru=max_lru, max_bytes=max_bytes)
+
+        # a file imported from an OSM disk cache has holes, show these
+        # as a stand-in or blank tile, see GetTile()
+        self.blank_tile = self._make_blank()
+        self.stand_ins = {}
+
+    def SetAvailableCallback(self, callback):
+        """Set the "tile now available" callback routine.
+
+        callback  function with signature callback(level, x, y, image, bitmap)
+
+        For MBTiles we do nothing as they are all local.
+        """
+
+        pass
+
+    def UseLevel(self, level):
+        """Prepare to serve tiles from the required level.
+
+        level  the required level
+
+        Throws Exception if level not found.
+        """
+
+        info = self.GetInfo(level)
+        if level not in self.levels or info is None:
+            raise Exception("Level '%s' not used" % str(level))
+        self.level = level
+        (self.num_tiles_x, self.num_tiles_y, self.ppd_x, self.ppd_y) = info
+        self.stand_ins.clear()
+
+    def GetInfo(self, level):
+        """Get tile info for a particular level.
+
+        level  the level to get tile info for
+
+        Returns (num_tiles_x, num_tiles_y, ppd_x, ppd_y) or None if
+        the level doesn't exist.
+        """
+
+        return self.level_info.get(level, None)
+
+    def GetTile(self, x, y):
+        """Get bitmap for tile at tile coords (x, y) and current level.
+
+        x  X coord of tile required (tile coordinates)
+        y  Y coord of tile required (tile coordinates)
+
+        Return tile from the cache.  If the file has no tile there return
+        a stand-in made from tiles in memory, or else a blank tile.
+        """
+
+        try:
+            return self.cache[(self.level, x, y)]
+        except KeyError:
+            return self.GetStandInTile(x, y, self.blank_tile)
+
+    def SetVisibleTiles(self, x_list, y_list, velocity=(0, 0), zoom_dir=0):
+        """Read the visible tiles into memory, one query per row.
+
+        x_list    list of tile X coordinates (left to right)
+        y_list    list of tile Y coordinates (top to bottom)
+        velocity  view speed, ignored as local reads are fast enough
+        zoom_dir  zoom direction, ignored
+        """
+
+        self._prune_stand_ins(x_list, y_list)
+        if not x_list:
+            return
+        for y in y_list:
+            self.cache.load_row(self.level, y, x_list)
+
+    def _make_blank(self):
+        """Make the tile shown where the file has no tile."""
+
+        bitmap = wx.EmptyBitmap(self.tile_size_x, self.tile_size_y)
+        dc = wx.MemoryDC(bitmap)
+        dc.SetBackground(wx.Brush(wx.Colour(*DefaultBlankColour)))
+        dc.Clear()
+        dc.SelectObject(wx.NullBitmap)
+        return bitmap
+
+    def Geo2Tile(self, geo):
+        """Convert geo to tile fractional coordinates for level in use.
+
+        geo  a tuple of geo coordinates (xgeo, ygeo)
+
+        Returns (xtile, ytile).
+
+        Note that we assume the point *is* on the map!
+        """
+
+        (xgeo, ygeo) = geo
+
+        if self.projection == ProjectionMercator:
+            lat_rad = math.radians(ygeo)
+            n = 2.0 ** self.level
+            xtile = (xgeo + 180.0) / 360.0 * n
+            ytile = ((1.0 - math.log(math.tan(lat_rad)
+                                     + (1.0/math.cos(lat_rad))) / math.pi)
+                     / 2.0) * n
+            return (xtile, ytile)
+
+        (min_xgeo, max_xgeo, min_ygeo, max_ygeo) = self.extent
+        tdeg_x = self.tile_size_x / self.ppd_x
+        tdeg_y = self.tile_size_y / self.ppd_y
+        return ((xgeo - min_xgeo)/tdeg_x, (max_ygeo - ygeo)/tdeg_y)
+
+    def Tile2Geo(self, tile):
+        """Convert tile fractional coordinates to geo for level in use.
+
+        tile  a tuple (xtile,ytile) of tile fractional coordinates
+
+        Note that we assume the point *is* on the map!
+        """
+
+        (xtile, ytile) = tile
+
+        if self.projection == ProjectionMercator:
+            n = 2.0 ** self.level
+            xgeo = xtile / n * 360.0 - 180.0
+            yrad = math.atan(math.sinh(math.pi * (1 - 2 * ytile / n)))
+            return (xgeo, math.degrees(yrad))
+
+        (min_xgeo, max_xgeo, min_ygeo, max_ygeo) = self.extent
+        tdeg_x = self.tile_size_x / self.ppd_x
+        tdeg_y = self.tile_size_y / self.ppd_y
+        return (xtile*tdeg_x + min_xgeo, max_ygeo - ytile*tdeg_y)
+
+    def Geo2TileArray(self, xgeo, ygeo):
+        """Convert many geo positions to tile fractional coordinates.
+
+        xgeo  sequence of geo X coordinates (numpy array or list)
+        ygeo  sequence of geo Y coordinates
+
+        Returns (xtile, ytile), numpy arrays if numpy is installed, else lists.
+        """
+
+        if np is None:
+            return tiles.Tiles.Geo2TileArray(self, xgeo, ygeo)
+
+        xgeo = np.asarray(xgeo, dtype=float)
+        ygeo = np.asarray(ygeo, dtype=float)
+
+        if self.projection == ProjectionMercator:
+            lat_rad = np.radians(ygeo)
+            n = 2.0 ** self.level
+            xtile = (xgeo + 180.0) / 360.0 * n
+            ytile = ((1.0 - np.log(np.tan(lat_rad)
+                                   + (1.0/np.cos(lat_rad))) / np.pi)
+                     / 2.0) * n
+            return (xtile, ytile)
+
+        (min_xgeo, max_xgeo, min_ygeo, max_ygeo) = self.extent
+        tdeg_x = self.tile_size_x / self.ppd_x
+        tdeg_y = self.tile_size_y / self.ppd_y
+        return ((xgeo - min_xgeo)/tdeg_x, (max_ygeo - ygeo)/tdeg_y)
+
+    def Tile2GeoArray(self, xtile, ytile):
+        """Convert many tile fractional coordinates to geo positions.
+
+        xtile  sequence of tile fractional X coordinates (numpy array or list)
+        ytile  sequence of tile fractional Y coordinates
+
+        Returns (xgeo, ygeo), numpy arrays if numpy is installed, else lists.
+        """
+
+        if np is None:
+            return tiles.Tiles.Tile2GeoArray(self, xtile, ytile)
+
+        xtile = np.asarray(xtile, dtype=float)
+        ytile = np.asarray(ytile, dtype=float)
+
+        if self.projection == ProjectionMercator:
+            n = 2.0 ** self.level
+            xgeo = xtile / n * 360.0 - 180.0
+            yrad = np.arctan(np.sinh(np.pi * (1 - 2 * ytile / n)))
+            return (xgeo, np.degrees(yrad))
+
+        (min_xgeo, max_xgeo, min_ygeo, max_ygeo) = self.extent
+        tdeg_x = self.tile_size_x / self.ppd_x
+        tdeg_y = self.tile_size_y / self.ppd_y
+        return (xtile*tdeg_x + min_xgeo, max_ygeo - ytile*tdeg_y)
+
+######
+# Convert a tile directory tree to an MBTiles file
+######
+
+# tile info filename in GMT tile directories
+TileInfoFilename = 'tile.info'
+
+# extent of OSM tiles (left, right, bottom, top)
+OSMExtent = (-180.0, 180.0, -85.0511, 85.0511)
+
+def ImportTiles(tiles_dir, tiles_file, source, name=None, progress=None):
+    """Convert a GMT or OSM tile directory tree into an MBTiles file.
+
+    tiles_dir   path to the tile directory tree (<level>/<x>/<y>.png)
+    tiles_file  path to the MBTiles file to create (must not exist)
+    source      'gmt' or 'osm'
+    name        tileset name stored in the file metadata
+    progress    if not None, function called as progress(level, count)
+                after each level is imported
+
+    Returns the number of tiles imported.
+
+    The tile files are copied into the new file as-is, they aren't decoded.
+    """
+
+    source = source.lower()
+    if source not in ('gmt', 'osm'):
+        raise Exception("Tile source must be 'gmt' or 'osm', got '%s'"
+                        % source)
+    if os.path.exists(tiles_file):
+        raise IOError("Tiles file '%s' already exists" % tiles_file)
+
+    # find the levels in the tile directory
+    levels = []
+    for path in glob.glob(os.path.join(tiles_dir, '[0-9]*')):
+        if os.path.isdir(path):
+            levels.append(int(os.path.basename(path)))
+    levels.sort()
+    if not levels:
+        raise IOError("'%s' doesn't appear to be a tile directory"
+                      % tiles_dir)
+
+    # get the tileset extent and per-level information
+    level_info = {}
+    if source == 'gmt':
+        info_file = os.path.join(tiles_dir, TileInfoFilename)
+        with open(info_file, 'rb') as fd:
+            (extent, tile_size, _, _) = pickle.load(fd)
+        for level in levels:
+            info_file = os.path.join(tiles_dir, '%d' % level,
+                                     TileInfoFilename)
+            with open(info_file, 'rb') as fd:
+                level_info[level] = pickle.load(fd)
+        projection = ProjectionCartesian
+    else:
+        extent = OSMExtent
+        tile_size = (256, 256)
+        for level in levels:
+            num_tiles = 2 ** level
+            level_info[level] = (num_tiles, num_tiles, None, None)
+        projection = ProjectionMercator
+
+    db = sqlite3.connect(tiles_file)
+    for sql in CreateSQL:
+        db.execute(sql)
+
+    # copy tiles, level by level
+    count = 0
+    tile_format = None
+    for level in levels:
+        (num_tiles_x, num_tiles_y, ppd_x, ppd_y) = level_info[level]
+        db.execute('INSERT INTO pyslip_levels VALUES (?, ?, ?, ?, ?)',
+                   (level, num_tiles_x, num_tiles_y, ppd_x, ppd_y))
+
+        level_count = 0
+        pattern = os.path.join(tiles_dir, '%d' % level, '*', '*.*')
+        for tile_path in glob.glob(pattern):
+            (x_dir, y_file) = os.path.split(tile_path)
+            try:
+                x = int(os.path.basename(x_dir))
+                y = int(os.path.splitext(y_file)[0])
+            except ValueError:
+                continue        # not a tile file
+
+            with open(tile_path, 'rb') as fd:
+                data = fd.read()
+            if tile_format is None:
+                tile_format = 'png' if data[:4] == '\x89PNG' else 'jpg'
+
+            db.execute(PutTileSQL, (level, x, num_tiles_y - 1 - y,
+                                    sqlite3.Binary(data)))
+            level_count += 1
+
+        db.commit()
+        count += level_count
+        log('ImportTiles: level %d, %d tiles' % (level, level_count))
+        if progress:
+            progress(level, level_count)
+
+    # now the metadata
+    (left, right, bottom, top) = extent
+    metadata = {'name': name or os.path.basename(tiles_dir.rstrip(os.sep)),
+                'format': tile_format or 'png',
+                'bounds': '%f,%f,%f,%f' % (left, bottom, right, top),
+                'minzoom': str(min(levels)),
+                'maxzoom': str(max(levels)),
+                'pyslip_projection': projection,
+                'pyslip_tile_size': '%d,%d' % tuple(tile_size)}
+    db.executemany('INSERT INTO metadata VALUES (?, ?)', metadata.items())
+    db.commit()
+    db.close()
+
+    return count
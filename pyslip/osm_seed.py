@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Fetch OSM tiles into the on-disk tile cache before they are needed.
+
+Usage: osm_seed.py [-h] [-c <num>] [-d <tiles_dir>] [-p <proxy>]
+                   -b <bbox> -l <levels>
+
+where -h              prints this help and exits
+      -b <bbox>       is the area to fetch, 'min_lon,min_lat,max_lon,max_lat'
+      -l <levels>     is the levels to fetch, eg, '3-10' or '3,5,7'
+      -c <num>        is the number of tiles fetched at once (default 4)
+      -d <tiles_dir>  is the tile cache directory (default 'osm_tiles')
+      -p <proxy>      is an HTTP proxy to fetch through
+
+Tiles already in the cache are skipped, so an interrupted run can just be
+started again.  Please respect the usage policy of the tile servers.
+"""
+
+import os
+import sys
+import math
+import time
+import getopt
+import threading
+import Queue
+
+import osm_tiles
+
+
+# seconds between progress reports
+ProgressInterval = 5
+
+# latitude limits of the OSM map
+MaxLatitude = 85.0511
+
+
+def usage(msg=None):
+    if msg:
+        print(('*'*80 + '\n%s\n' + '*'*80) % msg)
+    print(__doc__)
+
+def TileRanges(bbox, levels):
+    """Get the range of tiles covering an area at each level.
+
+    bbox    tuple (min_lon, min_lat, max_lon, max_lat)
+    levels  list of levels
+
+    Returns a list of (level, min_x, max_x, min_y, max_y), all inclusive.
+    """
+
+    (min_lon, min_lat, max_lon, max_lat) = bbox
+    min_lat = max(min_lat, -MaxLatitude)
+    max_lat = min(max_lat, MaxLatitude)
+
+    result = []
+    for level in levels:
+        last = 2**level - 1
+        (min_x, min_y) = osm_tiles.LevelGeo2Tile(level, (min_lon, max_lat))
+        (max_x, max_y) = osm_tiles.LevelGeo2Tile(level, (max_lon, min_lat))
+        result.append((level,
+                       max(0, int(min_x)), min(last, int(max_x)),
+                       max(0, int(min_y)), min(last, int(max_y))))
+    return result
+
+class Seeder(object):
+    """Fetch every tile in a set of tile ranges that isn't already cached."""
+
+    def __init__(self, tiles_dir, concurrency, proxy=None):
+        """Prepare the seeder.
+
+        tiles_dir    the tile cache directory
+        concurrency  number of tiles fetched at once
+        proxy        HTTP proxy to fetch through
+        """
+
+        self.tiles_dir = tiles_dir
+        self.concurrency = concurrency
+        # each pool keeps a connection open for every thread sharing it
+        servers = osm_tiles.OSMTiles.TileServers
+        pool_size = int(math.ceil(float(concurrency) / len(servers)))
+        self.pools = [osm_tiles.ConnectionPool(server, size=pool_size,
+                                               proxy=proxy)
+                      for server in servers]
+        self.requests = Queue.Queue(concurrency * 4)
+
+        self.lock = threading.Lock()
+        self.fetched = 0
+        self.skipped = 0
+        self.errors = 0
+        self.bytes = 0
+
+    def seed(self, ranges, progress=None):
+        """Fetch the tiles.
+
+        ranges    list of (level, min_x, max_x, min_y, max_y), as
+                  returned by TileRanges()
+        progress  if not None, function called as progress(seeder) every
+                  ProgressInterval seconds and at the end
+
+        Returns the number of tiles that couldn't be fetched.
+        """
+
+        for i in range(self.concurrency):
+            worker = threading.Thread(target=self.fetch_tiles,
+                                      args=(self.pools[i % len(self.pools)],))
+            worker.daemon = True
+            worker.start()
+
+        self.start = time.time()
+        last_report = self.start
+        for (level, min_x, max_x, min_y, max_y) in ranges:
+            for x in xrange(min_x, max_x+1):
+                for y in xrange(min_y, max_y+1):
+                    tile_path = os.path.join(self.tiles_dir,
+                                             osm_tiles.TilePath % (level, x, y))
+                    if os.path.exists(tile_path):
+                        # tile files are renamed into place, so are complete
+                        with self.lock:
+                            self.skipped += 1
+                    else:
+                        self.queue_tile((level, x, y))
+                    if progress and time.time() - last_report > ProgressInterval:
+                        progress(self)
+                        last_report = time.time()
+
+        # wait for the last fetches, with a Ctrl-C friendly timeout
+        while self.requests.unfinished_tasks:
+            time.sleep(0.1)
+        if progress:
+            progress(self)
+
+        return self.errors
+
+    def queue_tile(self, key):
+        """Queue a tile request, waiting in a way Ctrl-C can interrupt."""
+
+        while True:
+            try:
+                self.requests.put(key, timeout=0.5)
+                return
+            except Queue.Full:
+                pass
+
+    def fetch_tiles(self, pool):
+        """Fetch tiles from the request queue, forever."""
+
+        path = osm_tiles.OSMTiles.TileURLPath
+        while True:
+            key = self.requests.get()
+            try:
+                (status, headers, data) = pool.fetch_response(path % key)
+                if (status == 200
+                        and headers.get('content-type', None) == 'image/jpeg'):
+                    osm_tiles.WriteTileFile(self.tiles_dir, key, data)
+                    osm_tiles.WriteTileMeta(self.tiles_dir, key,
+                                      osm_tiles.TileMetaFromResponse(headers))
+                    with self.lock:
+                        self.fetched += 1
+                        self.bytes += len(data)
+                else:
+                    with self.lock:
+                        self.errors += 1
+            except Exception:
+                with self.lock:
+                    self.errors += 1
+            self.requests.task_done()
+
+def main(argv):
+    try:
+        (opts, args) = getopt.getopt(argv, 'hb:c:d:l:p:',
+                                     ['help', 'bbox=', 'concurrency=',
+                                      'tiles_dir=', 'levels=', 'proxy='])
+    except getopt.error:
+        usage()
+        return 1
+
+    bbox = None
+    levels = None
+    concurrency = 4
+    tiles_dir = osm_tiles.DefaultTilesDir
+    proxy = None
+    try:
+        for (opt, param) in opts:
+            if opt in ['-h', '--help']:
+                usage()
+                return 0
+            elif opt in ['-b', '--bbox']:
+                bbox = [float(v) for v in param.split(',')]
+                if len(bbox) != 4:
+                    raise ValueError
+            elif opt in ['-c', '--concurrency']:
+                concurrency = int(param)
+                if concurrency < 1:
+                    raise ValueError
+            elif opt in ['-d', '--tiles_dir']:
+                tiles_dir = param
+            elif opt in ['-l', '--levels']:
+                if '-' in param:
+                    (first, last) = param.split('-')
+                    levels = range(int(first), int(last)+1)
+                else:
+                    levels = [int(l) for l in param.split(',')]
+            elif opt in ['-p', '--proxy']:
+                proxy = param
+    except ValueError:
+        usage("Bad value for option '%s': '%s'" % (opt, param))
+        return 1
+
+    if bbox is None or levels is None:
+        usage('You must give the area with -b and the levels with -l')
+        return 1
+    if args:
+        usage()
+        return 1
+
+    ranges = TileRanges(bbox, levels)
+    total = sum([(max_x-min_x+1) * (max_y-min_y+1)
+                 for (_, min_x, max_x, min_y, max_y) in ranges])
+    print('%d tiles in levels %s' % (total, ','.join([str(l) for l in levels])))
+
+    def progress(seeder):
+        delta = max(time.time() - seeder.start, 0.001)
+        done = seeder.fetched + seeder.skipped + seeder.errors
+        print('%d/%d tiles (%.1f%%): %d fetched, %d skipped, %d errors, '
+              '%.1f tiles/s, %.1f KB/s'
+              % (done, total, 100.0*done/max(total, 1), seeder.fetched,
+                 seeder.skipped, seeder.errors, seeder.fetched/delta,
+                 seeder.bytes/delta/1024))
+
+    seeder = Seeder(tiles_dir, concurrency, proxy=proxy)
+    try:
+        errors = seeder.seed(ranges, progress=progress)
+    except KeyboardInterrupt:
+        print('Interrupted, run again to resume')
+        return 1
+
+    if errors:
+        print('Some tiles not fetched, run again to retry them')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
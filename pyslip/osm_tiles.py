@@ -8,10 +8,24 @@ Uses pyCacheBack to provide in-memory and on-disk caching.
 """
 
 import os
+import re
+import sys
 import glob
+import json
 import math
+import time
+import rfc822
+import collections
+import heapq
+import tempfile
+import itertools
+import socket
+import asyncore
+import httplib
+import urlparse
 import threading
 import traceback
+import cStringIO
 import urllib2
 import Queue
 import wx
@@ -20,6 +34,12 @@ from wx.lib.embeddedimage import PyEmbeddedImage
 import tiles
 import pycacheback
 
+# numpy is optional, batch conversions are faster with it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 # if we don't have log.py, don't crash
 try:
@@ -336,6 +356,18 @@ def getErrorImage():
 
 class OSMCache(pycacheback.pyCacheBack):
 
+    def __init__(self, *args, **kwargs):
+        # lifetime of a tile if the server didn't give one (None: forever)
+        self.max_age = kwargs.pop('max_age', DefaultTileMaxAge)
+
+        # function called as stale_callback(key) for an expired disk tile
+        self.stale_callback = None
+
+        # tiles loaded from disk whose freshness hasn't been checked
+        self.unchecked = set()
+
+        super(OSMCache, self).__init__(*args, **kwargs)
+
     def _get_from_back(self, key):
         """Retrieve value for 'key' from backing storage.
 
@@ -346,17 +378,69 @@ class OSMCache(pycacheback.pyCacheBack):
         Raises KeyError if tile not found.
         """
 
+        # don't look on disk for tiles we know aren't there
+        if self._known_missing(key):
+            raise KeyError
+
         # look for item in disk cache
         tile_path = os.path.join(self._tiles_dir, TilePath % key)
         if not os.path.exists(tile_path):
-            # tile not there, raise KeyError
+            # tile not there, remember that and raise KeyError
+            self._note_missing(key)
             raise KeyError
 
         # we have the tile file - read into memory, cache it & return
         image = wx.Image(tile_path, wx.BITMAP_TYPE_ANY)
         bitmap = image.ConvertToBitmap()
+
+        # check freshness after the tile is drawn, not while loading it
+        if self.stale_callback:
+            if not self.unchecked:
+                wx.CallAfter(self.check_stale)
+            self.unchecked.add(key)
+
         return bitmap
 
+    def check_stale(self):
+        """Check tiles loaded from disk since the last check for expiry.
+
+        Expired tiles are still used, but stale_callback(key) is called
+        for each to have it revalidated.  Reading the tile metadata here
+        keeps it out of the tile loading path.
+        """
+
+        unchecked = self.unchecked
+        self.unchecked = set()
+        if not self.stale_callback:
+            return
+        for key in unchecked:
+            if self.is_stale(key):
+                self.stale_callback(key)
+
+    def is_stale(self, key):
+        """Return True if the on-disk tile at 'key' has expired.
+
+        Tiles without metadata (cached before metadata was kept, or written
+        by re-encoding) expire 'max_age' seconds after the file was written.
+        """
+
+        meta = ReadTileMeta(self._tiles_dir, key)
+        if meta:
+            fetched = meta.get('fetched', 0)
+            max_age = meta.get('max_age', None)
+        else:
+            try:
+                fetched = os.path.getmtime(os.path.join(self._tiles_dir,
+                                                        TilePath % key))
+            except OSError:
+                return False
+            max_age = None
+        if max_age is None:
+            max_age = self.max_age
+        if max_age is None:
+            return False
+        return time.time() - fetched > max_age
+
     def _put_to_back(self, key, value):
         """Put a bitmap into on-disk cache.
 
@@ -367,6 +451,8 @@ class OSMCache(pycacheback.pyCacheBack):
                       y      integer tile coordinate
         """
 
+        self._forget_missing(key)
+
         tile_path = os.path.join(self._tiles_dir, TilePath % key)
         dir_path = os.path.dirname(tile_path)
         try:
@@ -376,6 +462,383 @@ class OSMCache(pycacheback.pyCacheBack):
             pass
         value.SaveFile(tile_path, wx.BITMAP_TYPE_JPEG)
 
+def WriteTileFile(tiles_dir, key, data, suffix=''):
+    """Write tile file data to the on-disk cache.
+
+    tiles_dir  the tile cache directory
+    key        tuple (level, x, y) of the tile
+    data       the tile file data, as fetched from the server
+    suffix     appended to the tile file path, to write tile metadata
+
+    The data is written to a temporary file which is renamed into place, so
+    a reader never sees a partly written tile.  Safe to call from any thread.
+    """
+
+    tile_path = os.path.join(tiles_dir, TilePath % key) + suffix
+    dir_path = os.path.dirname(tile_path)
+    try:
+        os.makedirs(dir_path)
+    except OSError:
+        # we assume it's a "directory exists' error, which we ignore
+        pass
+
+    (fd, tmp_path) = tempfile.mkstemp(dir=dir_path, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        if os.name == 'nt' and os.path.exists(tile_path):
+            os.remove(tile_path)    # Windows won't rename over a file
+        os.rename(tmp_path, tile_path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+# tile metadata stored at <basepath>/<level>/<x>/<y>.png.meta
+MetaSuffix = '.meta'
+
+# default lifetime (seconds) of a cached tile if the server doesn't say
+DefaultTileMaxAge = 7 * 24 * 60 * 60
+
+def ReadTileMeta(tiles_dir, key):
+    """Read the metadata for a tile in the on-disk cache.
+
+    tiles_dir  the tile cache directory
+    key        tuple (level, x, y) of the tile
+
+    Returns a dictionary with keys:
+        'etag'           the ETag header of the tile response, or None
+        'last_modified'  the Last-Modified header, or None
+        'fetched'        time the tile was fetched or revalidated
+        'max_age'        lifetime in seconds given by the server, or None
+    or None if the tile has no metadata.
+    """
+
+    meta_path = os.path.join(tiles_dir, TilePath % key) + MetaSuffix
+    try:
+        with open(meta_path, 'rb') as fd:
+            return json.load(fd)
+    except (IOError, ValueError):
+        return None
+
+def WriteTileMeta(tiles_dir, key, meta):
+    """Write the metadata for a tile in the on-disk cache.
+
+    tiles_dir  the tile cache directory
+    key        tuple (level, x, y) of the tile
+    meta       metadata dictionary, as returned by ReadTileMeta()
+    """
+
+    WriteTileFile(tiles_dir, key, json.dumps(meta), suffix=MetaSuffix)
+
+def TileMetaFromResponse(headers, old_meta=None):
+    """Make tile metadata from the headers of a tile response.
+
+    headers   dictionary of response headers with lower case names
+    old_meta  metadata of the cached tile, if revalidating
+
+    A 304 response may leave out headers, so values not in 'headers' are
+    taken from 'old_meta'.
+    """
+
+    meta = {'etag': None, 'last_modified': None, 'max_age': None}
+    if old_meta:
+        meta.update(old_meta)
+    meta['fetched'] = time.time()
+
+    if 'etag' in headers:
+        meta['etag'] = headers['etag']
+    if 'last-modified' in headers:
+        meta['last_modified'] = headers['last-modified']
+
+    match = re.search(r'max-age\s*=\s*(\d+)', headers.get('cache-control', ''))
+    if match:
+        meta['max_age'] = int(match.group(1))
+    elif 'expires' in headers:
+        expires = rfc822.parsedate_tz(headers['expires'])
+        date = rfc822.parsedate_tz(headers.get('date', ''))
+        if expires:
+            now = rfc822.mktime_tz(date) if date else time.time()
+            meta['max_age'] = max(0, int(rfc822.mktime_tz(expires) - now))
+
+    return meta
+
+def ConditionalHeaders(tiles_dir, key):
+    """Get headers to revalidate a tile in the on-disk cache.
+
+    tiles_dir  the tile cache directory, may be None
+    key        tuple (level, x, y) of the tile
+
+    Returns a dictionary of request headers, empty if there is no cached
+    tile or it has no validators.
+    """
+
+    headers = {}
+    if tiles_dir is None:
+        return headers
+    if not os.path.exists(os.path.join(tiles_dir, TilePath % key)):
+        return headers
+    meta = ReadTileMeta(tiles_dir, key)
+    if meta:
+        if meta.get('etag'):
+            headers['If-None-Match'] = str(meta['etag'])
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = str(meta['last_modified'])
+    return headers
+
+def ProcessTileResponse(tiles_dir, key, status, headers, data, error_tile):
+    """Get the tile image from a response and update the on-disk cache.
+
+    tiles_dir   tile cache directory to write the tile to, or None
+    key         tuple (level, x, y) of the tile
+    status      the HTTP status of the response
+    headers     dictionary of response headers with lower case names
+    data        the response body
+    error_tile  image to use if there is no tile image
+
+    Returns a tuple (image, error) as TileFromResponse() does.  'image' is
+    None if the server says the cached tile is still good (a 304 response).
+    """
+
+    if status == httplib.NOT_MODIFIED and tiles_dir:
+        WriteTileMeta(tiles_dir, key,
+                      TileMetaFromResponse(headers,
+                                           ReadTileMeta(tiles_dir, key)))
+        return (None, False)
+
+    (image, error) = TileFromResponse(status, headers.get('content-type', None),
+                                      data, error_tile)
+    if tiles_dir and not error and image is not error_tile:
+        WriteTileFile(tiles_dir, key, data)
+        WriteTileMeta(tiles_dir, key, TileMetaFromResponse(headers))
+    return (image, error)
+
+################################################################################
+# Priority queue of tile requests
+################################################################################
+
+class TileRequestQueue(object):
+    """A thread-safe priority queue of tile requests.
+
+    Lower priority values are got first, equal priorities in the order put.
+    Unlike Queue.Queue, requests still queued may be cancelled or given a
+    new priority.  Cancelled entries are left in the heap and skipped when
+    they reach the top.
+    """
+
+    def __init__(self):
+        self.heap = []                  # entries are [priority, seq, key]
+        self.entries = {}               # key -> heap entry
+        self.counter = itertools.count()
+        self.unfinished = 0
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.all_done = threading.Condition(self.lock)
+
+    def put(self, key, priority=0):
+        """Queue request 'key', or change its priority if already queued."""
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                entry[-1] = None        # cancel the old entry
+                self.unfinished -= 1
+            entry = [priority, next(self.counter), key]
+            self.entries[key] = entry
+            heapq.heappush(self.heap, entry)
+            self.unfinished += 1
+            self.not_empty.notify()
+
+    def get(self, block=True):
+        """Remove and return the highest priority request.
+
+        block  if True wait for a request, else raise Queue.Empty if none
+        """
+
+        with self.lock:
+            while True:
+                while self.heap:
+                    (_, _, key) = heapq.heappop(self.heap)
+                    if key is not None:
+                        del self.entries[key]
+                        return key
+                if not block:
+                    raise Queue.Empty
+                self.not_empty.wait()
+
+    def task_done(self):
+        """Indicate that a request got with get() is finished."""
+
+        with self.lock:
+            self.unfinished -= 1
+            if self.unfinished <= 0:
+                self.all_done.notify_all()
+
+    def join(self):
+        """Wait until every queued request is finished or cancelled."""
+
+        with self.lock:
+            while self.unfinished > 0:
+                self.all_done.wait()
+
+    def reprioritise(self, priority):
+        """Give every queued request a new priority.
+
+        priority  function with signature priority(key) returning the new
+                  priority for the request 'key', or None to cancel it
+
+        Returns a list of the cancelled keys.
+        """
+
+        cancelled = []
+        with self.lock:
+            heap = []
+            for (key, entry) in self.entries.items():
+                new_priority = priority(key)
+                if new_priority is None:
+                    cancelled.append(key)
+                    del self.entries[key]
+                else:
+                    entry[0] = new_priority
+                    heap.append(entry)
+            heapq.heapify(heap)
+            self.heap = heap
+            self.unfinished -= len(cancelled)
+            if self.unfinished <= 0:
+                self.all_done.notify_all()
+        return cancelled
+
+    def qsize(self):
+        """Return the number of requests queued (not cancelled)."""
+
+        with self.lock:
+            return len(self.entries)
+
+################################################################################
+# Pool of persistent connections to a tile server
+################################################################################
+
+# default number of idle connections kept open to each tile server
+DefaultPoolSize = 2
+
+# default socket timeout (seconds) for tile server connections
+DefaultTimeout = 30
+
+class ConnectionPool(object):
+    """A pool of keep-alive HTTP connections to one tile server.
+
+    Connections are reused across tile requests, so the TCP (and TLS)
+    handshake is paid once per connection rather than once per tile.
+    """
+
+    def __init__(self, server, size=DefaultPoolSize, proxy=None,
+                 timeout=DefaultTimeout):
+        """Prepare the connection pool.
+
+        server   server URL, eg, 'http://tile.example.com'
+        size     maximum number of idle connections kept open
+        proxy    HTTP proxy to connect through, eg, 'http://proxy:3128'
+        timeout  socket timeout in seconds
+        """
+
+        self.server = server
+        self.size = size
+        self.timeout = timeout
+
+        (self.scheme, self.host) = urlparse.urlsplit(server)[:2]
+        self.proxy_host = None
+        if proxy:
+            self.proxy_host = urlparse.urlsplit(proxy)[1] or proxy
+
+        self.idle = Queue.LifoQueue(size)
+        self.connects = 0               # number of connections made
+
+    def fetch(self, path):
+        """Get 'path' from the server.
+
+        path  the path to get, eg, '/tiles/1/0/0.png'
+
+        Returns a tuple (status, content_type, data).
+        """
+
+        (status, headers, data) = self.fetch_response(path)
+        return (status, headers.get('content-type', None), data)
+
+    def fetch_response(self, path, headers=None):
+        """Get 'path' from the server, with extra request headers.
+
+        path     the path to get, eg, '/tiles/1/0/0.png'
+        headers  dictionary of extra request headers
+
+        Returns a tuple (status, headers, data) where 'headers' is a
+        dictionary of response headers with lower case names.
+
+        A request that fails on a reused connection is tried once more on a
+        new connection, as the server may have closed an idle connection.
+        Raises httplib.HTTPException or socket.error if that fails too.
+        """
+
+        if self.proxy_host:
+            path = self.server + path
+
+        request_headers = {'Connection': 'keep-alive'}
+        if headers:
+            request_headers.update(headers)
+
+        try:
+            conn = self.idle.get_nowait()
+            reused = True
+        except Queue.Empty:
+            conn = self._connect()
+            reused = False
+
+        while True:
+            try:
+                conn.request('GET', path, headers=request_headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if not reused:
+                    raise
+                conn = self._connect()
+                reused = False
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+        return (response.status, dict(response.getheaders()), data)
+
+    def close(self):
+        """Close all idle connections."""
+
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                break
+
+    def _connect(self):
+        """Make a new connection to the server (or proxy)."""
+
+        self.connects += 1
+        if self.proxy_host:
+            return httplib.HTTPConnection(self.proxy_host,
+                                          timeout=self.timeout)
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(self.host, timeout=self.timeout)
+        return httplib.HTTPConnection(self.host, timeout=self.timeout)
+
+    def _release(self, conn):
+        """Return a connection to the pool, closing it if the pool is full."""
+
+        try:
+            self.idle.put_nowait(conn)
+        except Queue.Full:
+            conn.close()
+
 ################################################################################
 # Worker class for internet tile retrieval
 ################################################################################
@@ -383,24 +846,29 @@ class OSMCache(pycacheback.pyCacheBack):
 class TileWorker(threading.Thread):
     """Thread class that gets request from queue, loads tile, calls callback."""
 
-    def __init__(self, server, tilepath, requests, callafter, error_tile):
+    def __init__(self, pool, tilepath, requests, callafter, error_tile,
+                 tiles_dir=None):
         """Prepare the tile worker.
 
-        server     server URL
+        pool       ConnectionPool for the tile server
         tilepath   path to tile on server
         requests   the request queue
         callafter  function to CALL AFTER tile available
+        tiles_dir  if not None, tile cache directory to write fetched
+                   tile files to, as fetched, and to revalidate tiles in
 
-        Results are returned in the CallAfter() params.
+        Results are returned in the CallAfter() params.  The image is None
+        if a revalidated tile hasn't changed.
         """
 
         threading.Thread.__init__(self)
 
-        self.server = server
+        self.pool = pool
         self.tilepath = tilepath
         self.requests = requests
         self.callafter = callafter
         self.error_tile_image = error_tile
+        self.tiles_dir = tiles_dir
         self.daemon = True
 
     def run(self):
@@ -408,26 +876,397 @@ class TileWorker(threading.Thread):
             # get zoom level and tile coordinates to retrieve
             (level, x, y) = self.requests.get()
 
-            image = self.error_tile_image
-            error = False       # True if we get an error
+            tile_url = self.pool.server + self.tilepath % (level, x, y)
             try:
-                tile_url = self.server + self.tilepath % (level, x, y)
-                f = urllib2.urlopen(urllib2.Request(tile_url))
-                if f.info().getheader('Content-Type') == 'image/jpeg':
-                    image = wx.ImageFromStream(f, wx.BITMAP_TYPE_JPEG)
-            except urllib2.HTTPError as e:
-                error = True
-                log('HTTPError exception getting tile %d,%d,%d from %s\n%s'
-                    % (level, x, y, tile_url, str(e)))
+                headers = ConditionalHeaders(self.tiles_dir, (level, x, y))
+                (status, headers, data) = self.pool.fetch_response(
+                                              self.tilepath % (level, x, y),
+                                              headers)
+                (image, error) = ProcessTileResponse(self.tiles_dir,
+                                                     (level, x, y), status,
+                                                     headers, data,
+                                                     self.error_tile_image)
+                if error:
+                    log('HTTP status %d getting tile %d,%d,%d from %s'
+                        % (status, level, x, y, tile_url))
             except Exception as e:
                 # some sort of generic exception
-                error = True
+                (image, error) = (self.error_tile_image, True)
                 log("'%s' exception getting tile %d,%d,%d from %s\n%s"
-                    % (e.__class__.__name__level, x, y, tile_url, str(e)))
+                    % (e.__class__.__name__, level, x, y, tile_url, str(e)))
 
             wx.CallAfter(self.callafter, level, x, y, image, error)
             self.requests.task_done()
 
+def TileFromResponse(status, content_type, data, error_tile):
+    """Get the tile image from a tile server response.
+
+    status        the HTTP status of the response
+    content_type  the response Content-Type
+    data          the response body
+    error_tile    image to use if there is no tile image
+
+    Returns a tuple (image, error) where 'error' is True if the server
+    returned an error status.
+    """
+
+    if status != httplib.OK:
+        return (error_tile, True)
+    if content_type == 'image/jpeg':
+        return (wx.ImageFromStream(cStringIO.StringIO(data),
+                                   wx.BITMAP_TYPE_JPEG), False)
+    return (error_tile, False)
+
+################################################################################
+# Single thread fetcher for many concurrent internet tile requests
+################################################################################
+
+# how long (seconds) the async fetcher waits in one poll of its sockets
+AsyncPollTime = 0.01
+
+class AsyncTileChannel(asyncore.dispatcher):
+    """A keep-alive HTTP connection to a tile server, used by AsyncTileFetcher.
+
+    Requests are sent as HTTP/1.0 asking for keep-alive, so a response is
+    never chunked: it has a Content-Length or ends when the server closes.
+    """
+
+    def __init__(self, fetcher, server, socket_map):
+        """Start connecting to a tile server.
+
+        fetcher     the owning AsyncTileFetcher
+        server      the AsyncTileServer to connect to
+        socket_map  the asyncore socket map of the fetcher
+        """
+
+        asyncore.dispatcher.__init__(self, map=socket_map)
+        self.fetcher = fetcher
+        self.server = server
+        self.key = None             # (level, x, y) of request in flight
+        self.requests_done = 0      # requests completed on this connection
+        self.outbuf = ''
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect(server.address())
+
+    def start(self, key, path, headers=None):
+        """Send a request for tile 'key' at 'path' with extra 'headers'."""
+
+        self.key = key
+        self.started = time.time()
+        extra = ''.join(['%s: %s\r\n' % item
+                         for item in (headers or {}).items()])
+        self.outbuf = ('GET %s HTTP/1.0\r\nHost: %s\r\n'
+                       'Connection: keep-alive\r\n%s\r\n'
+                       % (path, self.server.host, extra))
+        self.response = []
+        self.received = 0
+        self.body_start = None
+        self.length = None
+
+    def writable(self):
+        return bool(self.outbuf) or not self.connected
+
+    def handle_connect(self):
+        pass
+
+    def handle_write(self):
+        sent = self.send(self.outbuf)
+        self.outbuf = self.outbuf[sent:]
+
+    def handle_read(self):
+        data = self.recv(65536)
+        if not data:
+            return              # recv() has called handle_close()
+        if self.key is None:
+            # nothing asked for, the connection is confused
+            self.handle_close()
+            return
+        self.response.append(data)
+        self.received += len(data)
+        self.check_response()
+
+    def check_response(self, closed=False):
+        """Finish the request if the whole response has been read."""
+
+        if self.body_start is None:
+            response = ''.join(self.response)
+            header_end = response.find('\r\n\r\n')
+            if header_end < 0:
+                return
+            self.response = [response]
+            self.parse_headers(response[:header_end])
+            self.body_start = header_end + 4
+
+        if (self.length is not None
+                and self.received - self.body_start >= self.length):
+            body_end = self.body_start + self.length
+        elif closed and self.length is None:
+            body_end = self.received
+        else:
+            return
+
+        response = ''.join(self.response)
+        self.fetcher.request_done(self, self.status, self.headers,
+                                  response[self.body_start:body_end])
+
+    def parse_headers(self, header):
+        """Get status, content type, length and keep-alive from 'header'."""
+
+        lines = header.split('\r\n')
+        try:
+            self.status = int(lines[0].split()[1])
+        except (IndexError, ValueError):
+            self.status = 0
+        self.headers = headers = {}
+        for line in lines[1:]:
+            (name, _, value) = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            self.length = int(headers['content-length'])
+        except (KeyError, ValueError):
+            self.length = None
+        if self.status in (httplib.NO_CONTENT, httplib.NOT_MODIFIED):
+            self.length = 0             # never a body
+        self.keep_alive = (self.length is not None
+                           and headers.get('connection', '').lower()
+                                   == 'keep-alive')
+
+    def handle_close(self):
+        self.close()
+        if self.key is None:
+            self.fetcher.channel_closed(self)
+        elif self.body_start is not None and self.length is None:
+            self.check_response(closed=True)
+        else:
+            self.fetcher.request_failed(self, 'connection closed')
+
+    def handle_error(self):
+        (_, e, _) = sys.exc_info()
+        self.close()
+        if self.key is None:
+            self.fetcher.channel_closed(self)
+        else:
+            self.fetcher.request_failed(self, "'%s' exception: %s"
+                                              % (e.__class__.__name__, str(e)))
+
+class AsyncTileServer(object):
+    """Connection state for one tile server used by AsyncTileFetcher."""
+
+    def __init__(self, server, max_requests, proxy=None):
+        """Prepare the server state.
+
+        server        server URL
+        max_requests  maximum concurrent requests to the server
+        proxy         HTTP proxy to connect through
+        """
+
+        self.server = server
+        self.max_requests = max_requests
+        (_, self.host) = urlparse.urlsplit(server)[:2]
+        self.connect_host = self.host
+        self.path_prefix = ''
+        if proxy:
+            self.connect_host = urlparse.urlsplit(proxy)[1] or proxy
+            self.path_prefix = server
+        self.addr = None
+        self.active = 0             # requests in flight
+        self.idle = []              # idle keep-alive channels
+
+    def address(self):
+        """Get the (ip, port) to connect to, looked up once."""
+
+        if self.addr is None:
+            (host, _, port) = self.connect_host.partition(':')
+            self.addr = (socket.gethostbyname(host), int(port or 80))
+        return self.addr
+
+class AsyncTileFetcher(threading.Thread):
+    """Thread that keeps many tile requests in flight on one asyncore loop.
+
+    An alternative to a TileWorker thread for each concurrent request.
+    Results are delivered exactly as TileWorker does.
+    """
+
+    def __init__(self, servers, tilepath, requests, callafter, error_tile,
+                 max_server_requests, proxy=None, timeout=DefaultTimeout,
+                 tiles_dir=None):
+        """Prepare the fetcher.
+
+        servers              list of server URLs, all serving the same tiles
+        tilepath             path to tile on server
+        requests             the request queue, a TileRequestQueue
+        callafter            function to CALL AFTER tile available
+        error_tile           image to return if there is an error
+        max_server_requests  maximum concurrent requests to each server
+        proxy                HTTP proxy to connect through
+        timeout              seconds to wait for a tile
+        tiles_dir            if not None, tile cache directory to write
+                             fetched tile files to, as fetched, and to
+                             revalidate tiles in
+
+        Only 'http' servers are supported.
+        """
+
+        threading.Thread.__init__(self)
+
+        for server in servers:
+            if urlparse.urlsplit(server)[0] != 'http':
+                raise Exception("Async fetcher can't use server '%s'" % server)
+
+        self.servers = [AsyncTileServer(server, max_server_requests, proxy)
+                        for server in servers]
+        self.tilepath = tilepath
+        self.requests = requests
+        self.callafter = callafter
+        self.error_tile_image = error_tile
+        self.timeout = timeout
+        self.tiles_dir = tiles_dir
+        self.socket_map = {}
+        self.busy = set()           # channels with a request in flight
+        self.connects = 0           # number of connections made
+        self.daemon = True
+
+    def run(self):
+        while True:
+            if not self.busy:
+                # nothing in flight, wait for a request
+                self.start_request(self.requests.get())
+
+            # start as many queued requests as servers will take
+            while self.free_server() is not None:
+                try:
+                    key = self.requests.get(block=False)
+                except Queue.Empty:
+                    break
+                self.start_request(key)
+
+            asyncore.loop(timeout=AsyncPollTime, map=self.socket_map, count=1)
+            self.check_timeouts()
+
+    def free_server(self):
+        """Return the least busy server that can take a request, or None."""
+
+        server = min(self.servers, key=lambda s: s.active)
+        if server.active >= server.max_requests:
+            return None
+        return server
+
+    def start_request(self, key, server=None):
+        """Start fetching tile 'key' on a connection to 'server'.
+
+        If 'server' is None use the least busy server.  A new connection
+        is made if the server has no idle connection.
+        """
+
+        if server is None:
+            server = min(self.servers, key=lambda s: s.active)
+        if server.idle:
+            channel = server.idle.pop()
+        else:
+            self.connects += 1
+            try:
+                channel = AsyncTileChannel(self, server, self.socket_map)
+            except socket.error as e:
+                self.deliver(key, self.error_tile_image, True,
+                             "'%s' exception connecting to %s: %s"
+                             % (e.__class__.__name__, server.server, str(e)))
+                return
+        server.active += 1
+        self.busy.add(channel)
+        channel.start(key, server.path_prefix + self.tilepath % key,
+                      ConditionalHeaders(self.tiles_dir, key))
+
+    def request_done(self, channel, status, headers, data):
+        """A channel has the response for its request."""
+
+        key = self.release(channel)
+        if channel.keep_alive and channel.connected:
+            channel.requests_done += 1
+            channel.server.idle.append(channel)
+        else:
+            channel.close()
+
+        try:
+            (image, error) = ProcessTileResponse(self.tiles_dir, key, status,
+                                                 headers, data,
+                                                 self.error_tile_image)
+        except Exception as e:
+            (image, error) = (self.error_tile_image, True)
+            status = str(e)
+        msg = None
+        if error:
+            msg = 'HTTP status %s getting tile from %s' % (str(status),
+                                                           channel.server.server)
+        self.deliver(key, image, error, msg)
+
+    def request_failed(self, channel, reason):
+        """A channel failed before its response was complete."""
+
+        key = self.release(channel)
+        channel.close()
+
+        # a reused connection may have been closed by the server while idle
+        if channel.requests_done and not channel.received:
+            self.start_request(key, channel.server)
+            return
+
+        self.deliver(key, self.error_tile_image, True,
+                     '%s getting tile from %s' % (reason, channel.server.server))
+
+    def channel_closed(self, channel):
+        """An idle channel was closed."""
+
+        try:
+            channel.server.idle.remove(channel)
+        except ValueError:
+            pass
+
+    def release(self, channel):
+        """Take the request from a channel, return the request key."""
+
+        key = channel.key
+        channel.key = None
+        channel.server.active -= 1
+        self.busy.discard(channel)
+        return key
+
+    def check_timeouts(self):
+        """Fail requests that have waited too long."""
+
+        now = time.time()
+        for channel in list(self.busy):
+            if now - channel.started > self.timeout:
+                channel.received = 1        # don't retry
+                self.request_failed(channel, 'timeout')
+
+    def deliver(self, key, image, error, msg=None):
+        """Return the result for request 'key' as TileWorker does."""
+
+        (level, x, y) = key
+        if msg:
+            log('%s, tile %d,%d,%d' % (msg, level, x, y))
+        wx.CallAfter(self.callafter, level, x, y, image, error)
+        self.requests.task_done()
+
+def LevelGeo2Tile(level, geo):
+    """Convert geo to tile fractional coordinates for a level.
+
+    level  the zoom level
+    geo    tuple of geo coordinates (xgeo, ygeo)
+
+    Note that we assume the point *is* on the map!
+
+    Code taken from [http://wiki.openstreetmap.org/wiki/Slippy_map_tilenames]
+    """
+
+    (xgeo, ygeo) = geo
+    lat_rad = math.radians(ygeo)
+    n = 2.0 ** level
+    xtile = (xgeo + 180.0) / 360.0 * n
+    ytile = ((1.0 - math.log(math.tan(lat_rad) + (1.0/math.cos(lat_rad))) / math.pi) / 2.0) * n
+
+    return (xtile, ytile)
+
 ################################################################################
 # Class for OSM tiles.   Builds on tiles.Tiles.
 ################################################################################
@@ -439,6 +1278,9 @@ DefaultTilesDir = 'osm_tiles'
 # set maximum number of in-memory tiles for each level
 DefaultMaxLRU = 10000
 
+# set maximum bytes of in-memory tiles (None means no limit)
+DefaultMaxBytes = None
+
 class OSMTiles(tiles.Tiles):
     """An object to source OSM tiles for pySlip."""
 
@@ -464,8 +1306,33 @@ class OSMTiles(tiles.Tiles):
     # maximum pending requests for each tile server
     MaxServerRequests = 2
 
+    # maximum pending requests for each tile server with the async fetcher
+    MaxAsyncServerRequests = 32
+
+    # queued requests for tiles this many tiles outside the view are kept
+    CancelMargin = 1
+
+    # width in tiles of the ring of tiles prefetched around the view
+    PrefetchRing = 1
+
+    # view speed (pixels/second) above which the ring is widened ahead
+    PrefetchSpeed = 256
+
+    # number of arrived prefetched tiles remembered for hit statistics
+    PrefetchMemory = 10000
+
+    # number of tiles remembered as on disk, so prefetch needn't look again
+    PrefetchOnDisk = 10000
+
+    # request priority classes, lowest fetched first
+    (VisiblePriority, RingPriority, ZoomPriority, OtherLevelPriority) = range(4)
+
     def __init__(self, tiles_dir=None, tile_levels=None, callback=None,
-                 http_proxy=None, pending_file=None, error_file=None):
+                 http_proxy=None, pending_file=None, error_file=None,
+                 max_lru=DefaultMaxLRU, max_bytes=DefaultMaxBytes,
+                 pool_size=DefaultPoolSize, fetcher='threads',
+                 store_raw=True, max_age=DefaultTileMaxAge,
+                 prefetch=True, prefetch_ring=None):
         """Override the base class for local tiles.
 
         tiles_dir     tile cache directory, may contain tiles
@@ -474,6 +1341,21 @@ class OSMTiles(tiles.Tiles):
         http_proxy    HTTP proxy to use if there is a firewall
         pending_file  path to picture file for the 'pending' tile
         error_file    path to picture file for the 'error' tile
+        max_lru       maximum number of tiles held in memory
+        max_bytes     maximum estimated bytes of tiles held in memory
+        pool_size     number of idle connections kept open to each server
+        fetcher       'threads' to fetch tiles with a thread per request,
+                      'async' to fetch all tiles on one asyncore thread
+        store_raw     if True, fetched tile files are written to the
+                      on-disk cache as fetched by the fetcher threads,
+                      else tiles are re-encoded and written by the main
+                      thread
+        max_age       seconds a cached tile is used before it is
+                      revalidated, if the server didn't say (None: forever)
+        prefetch      if True, fetch tiles around the view and at the
+                      next levels before they are needed
+        prefetch_ring width in tiles of the ring of tiles prefetched
+                      around the view (default PrefetchRing)
         """
 
         # check tiles_dir & tile_levels
@@ -509,11 +1391,16 @@ class OSMTiles(tiles.Tiles):
                 os.makedirs(level_dir)
 
         # setup the tile cache (note, no callback set since net unused)
-        self.cache = OSMCache(tiles_dir=self.tiles_dir, max_lru=DefaultMaxLRU)
+        self.cache = OSMCache(tiles_dir=self.tiles_dir, max_lru=max_lru,
+                              max_bytes=max_bytes, max_age=max_age)
+        self.cache.stale_callback = self._tile_stale
 
         # set the list of queued unsatisfied requests to 'empty'
         self.queued_requests = {}
 
+        # tiles shown while real tiles load, see GetStandInTile()
+        self.stand_ins = {}
+
         # OSM tiles always (256, 256)
         self.tile_size_x = self.TileSize
         self.tile_size_y = self.TileSize
@@ -533,6 +1420,7 @@ class OSMTiles(tiles.Tiles):
 
         # test for firewall - use proxy (if supplied)
         test_url = self.TileServers[0] + self.TileURLPath % (0, 0, 0)
+        proxy_url = None
         try:
             urllib2.urlopen(test_url)
         except:
@@ -549,21 +1437,64 @@ class OSMTiles(tiles.Tiles):
                     msg = ("Using HTTP proxy %s, "
                            "but still can't get through a firewall!")
                     raise Exception(msg)
+                proxy_url = http_proxy
             else:
                 msg = ("There is a firewall but you didn't "
                        "give me an HTTP proxy to get through it?")
                 raise Exception(msg)
 
+        # the visible tiles, (level, min_x, max_x, min_y, max_y)
+        self.visible = None
+
+        # prefetch state
+        self.prefetch = prefetch
+        if prefetch_ring is None:
+            prefetch_ring = self.PrefetchRing
+        self.prefetch_ring = prefetch_ring
+        self.view_hint = None           # (visible, lead_x, lead_y, zoom_dir)
+        self.prefetch_wanted = {}       # tile key -> request priority
+        self.prefetch_pending = set()   # prefetch requests not yet satisfied
+        self.prefetched = collections.OrderedDict()    # arrived, not yet used
+        self.on_disk = collections.OrderedDict()       # seen in disk cache
+
+        # request queue statistics
+        self.cancelled_requests = 0
+        self.fetched_tiles = 0
+        self.wasted_fetches = 0
+        self.stale_tiles = 0
+        self.unchanged_tiles = 0
+        self.prefetch_requests = 0
+        self.prefetch_arrived = 0
+        self.prefetch_hits = 0
+
         # set up the request queue and worker threads
-        self.request_queue = Queue.Queue()  # entries are (level, x, y)
+        self.store_raw = store_raw
+        raw_dir = tiles_dir if store_raw else None
+        self.request_queue = TileRequestQueue() # entries are (level, x, y)
+        self.pools = []
         self.workers = []
-        for server in self.TileServers:
-            for num_threads in range(self.MaxServerRequests):
-                worker = TileWorker(server, self.TileURLPath,
-                                    self.request_queue, self._tile_available,
-                                    self.error_tile_image)
-                self.workers.append(worker)
-                worker.start()
+        if fetcher == 'threads':
+            for server in self.TileServers:
+                pool = ConnectionPool(server, size=pool_size, proxy=proxy_url)
+                self.pools.append(pool)
+                for num_threads in range(self.MaxServerRequests):
+                    worker = TileWorker(pool, self.TileURLPath,
+                                        self.request_queue,
+                                        self._tile_available,
+                                        self.error_tile_image,
+                                        tiles_dir=raw_dir)
+                    self.workers.append(worker)
+                    worker.start()
+        elif fetcher == 'async':
+            worker = AsyncTileFetcher(self.TileServers, self.TileURLPath,
+                                      self.request_queue, self._tile_available,
+                                      self.error_tile_image,
+                                      self.MaxAsyncServerRequests,
+                                      proxy=proxy_url, tiles_dir=raw_dir)
+            self.workers.append(worker)
+            worker.start()
+        else:
+            raise Exception("Unknown tile fetcher '%s'" % fetcher)
 
     def SetAvailableCallback(self, callback):
         """Set the "tile now available" callback routine.
@@ -585,6 +1516,7 @@ class OSMTiles(tiles.Tiles):
         if level not in self.levels:
             return None
         self.level = level
+        self.stand_ins.clear()
 
         # get tile info
         info = self.GetInfo(level)
@@ -630,9 +1562,13 @@ class OSMTiles(tiles.Tiles):
         try:
             tile = self.cache[(self.level, x, y)]
         except KeyError:
-            # start process of getting tile from 'net, return 'pending' image
+            # start process of getting tile from 'net, return a stand-in
             self.GetInternetTile(self.level, x, y)
-            tile = self.pending_tile
+            tile = self.GetStandInTile(x, y, self.pending_tile)
+        else:
+            if self.prefetched and (self.level, x, y) in self.prefetched:
+                del self.prefetched[(self.level, x, y)]
+                self.prefetch_hits += 1
 
         return tile
 
@@ -649,25 +1585,233 @@ class OSMTiles(tiles.Tiles):
         tile_key = (level, x, y)
         if tile_key not in self.queued_requests:
             # add tile request to the server request queue
-            self.request_queue.put(tile_key)
+            priority = self._request_priority(tile_key)
+            if priority is None:
+                # asked for explicitly, so wanted now
+                priority = (self.VisiblePriority, 0)
+            self.request_queue.put(tile_key, priority)
             self.queued_requests[tile_key] = True
 
+    def SetVisibleTiles(self, x_list, y_list, velocity=(0, 0), zoom_dir=0):
+        """Note the visible tiles and reorder queued requests to suit.
+
+        x_list    list of tile X coordinates (left to right)
+        y_list    list of tile Y coordinates (top to bottom)
+        velocity  tuple (x, y) of the speed the view is moving over the
+                  map, in pixels/second
+        zoom_dir  1 if the view last zoomed in, -1 if out, else 0
+
+        Queued requests are reordered by distance from the view centre.
+        Requests for other levels, or for tiles more than CancelMargin tiles
+        outside the view, are cancelled unless they are prefetch requests.
+
+        If prefetching, a ring of tiles around the view (wider in the
+        direction the view is moving) and the tiles at the next level in
+        the zoom direction are requested at lower priority than visible tiles.
+        """
+
+        if not x_list or not y_list:
+            return
+
+        visible = (self.level, x_list[0], x_list[-1], y_list[0], y_list[-1])
+        (vx, vy) = velocity
+        lead_x = cmp(vx, 0) if abs(vx) > self.PrefetchSpeed else 0
+        lead_y = cmp(vy, 0) if abs(vy) > self.PrefetchSpeed else 0
+        view_hint = (visible, lead_x, lead_y, zoom_dir)
+        if view_hint == self.view_hint:
+            return
+        self.view_hint = view_hint
+        self.visible = visible
+        self._prune_stand_ins(x_list, y_list)
+
+        if self.prefetch:
+            self.prefetch_wanted = self._prefetch_tiles(lead_x, lead_y,
+                                                        zoom_dir)
+
+        cancelled = self.request_queue.reprioritise(self._request_priority)
+        for key in cancelled:
+            self.queued_requests.pop(key, None)
+            self.prefetch_pending.discard(key)
+        self.cancelled_requests += len(cancelled)
+
+        # request prefetch tiles we don't have, only looking on disk
+        # for tiles we don't already know about
+        for (key, priority) in self.prefetch_wanted.iteritems():
+            if (key in self.queued_requests or key in self.cache
+                    or key in self.on_disk):
+                continue
+            if os.path.exists(os.path.join(self.tiles_dir, TilePath % key)):
+                self.on_disk[key] = True
+                if len(self.on_disk) > self.PrefetchOnDisk:
+                    self.on_disk.popitem(last=False)
+                continue
+            self.request_queue.put(key, priority)
+            self.queued_requests[key] = True
+            self.prefetch_pending.add(key)
+            self.prefetch_requests += 1
+
+    def _prefetch_tiles(self, lead_x, lead_y, zoom_dir):
+        """Get the tiles to prefetch for the visible tiles.
+
+        lead_x, lead_y  -1, 0 or 1, the direction the view is moving
+        zoom_dir        1 if the view last zoomed in, -1 if out, else 0
+
+        Returns a dictionary mapping tile key to request priority.
+        """
+
+        (level, min_x, max_x, min_y, max_y) = self.visible
+        (centre_x, centre_y) = ((min_x + max_x) / 2.0, (min_y + max_y) / 2.0)
+        result = {}
+
+        def add(key, priority_class, dx, dy):
+            result[key] = (priority_class, dx*dx + dy*dy)
+
+        # the ring around the view, widened in the direction of movement
+        ring = self.prefetch_ring
+        if ring:
+            last = 2**level - 1
+            x_from = max(0, min_x - ring - (ring if lead_x < 0 else 0))
+            x_to = min(last, max_x + ring + (ring if lead_x > 0 else 0))
+            y_from = max(0, min_y - ring - (ring if lead_y < 0 else 0))
+            y_to = min(last, max_y + ring + (ring if lead_y > 0 else 0))
+            for x in range(x_from, x_to+1):
+                for y in range(y_from, y_to+1):
+                    if not (min_x <= x <= max_x and min_y <= y <= max_y):
+                        add((level, x, y), self.RingPriority,
+                            x - centre_x, y - centre_y)
+
+        # the 4 children of each visible tile if zooming in,
+        # else the parent of each visible tile
+        if zoom_dir > 0 and level + 1 in self.levels:
+            for x in range(min_x*2, max_x*2 + 2):
+                for y in range(min_y*2, max_y*2 + 2):
+                    add((level+1, x, y), self.ZoomPriority,
+                        x/2.0 - centre_x, y/2.0 - centre_y)
+        elif level - 1 in self.levels:
+            priority_class = self.ZoomPriority
+            if zoom_dir == 0:
+                priority_class = self.OtherLevelPriority
+            for x in range(min_x/2, max_x/2 + 1):
+                for y in range(min_y/2, max_y/2 + 1):
+                    add((level-1, x, y), priority_class,
+                        x*2.0 - centre_x, y*2.0 - centre_y)
+
+        return result
+
+    def GetQueueStats(self):
+        """Return a dictionary of tile request statistics.
+
+        The keys are:
+            'depth'      number of requests waiting for a worker
+            'pending'    number of requests not yet satisfied, including
+                         those a worker is fetching
+            'cancelled'  number of requests cancelled before fetching
+            'fetched'    number of tiles fetched
+            'wasted'     number of tiles fetched that were no longer
+                         wanted when they arrived
+            'stale'      number of expired tiles asked to be revalidated
+            'unchanged'  number of revalidated tiles that hadn't changed
+            'prefetch_requests'  number of prefetch requests made
+            'prefetched'         number of prefetched tiles that arrived
+            'prefetch_hits'      number of prefetched tiles later drawn
+        """
+
+        return {'depth': self.request_queue.qsize(),
+                'pending': len(self.queued_requests),
+                'cancelled': self.cancelled_requests,
+                'fetched': self.fetched_tiles,
+                'wasted': self.wasted_fetches,
+                'stale': self.stale_tiles,
+                'unchanged': self.unchanged_tiles,
+                'prefetch_requests': self.prefetch_requests,
+                'prefetched': self.prefetch_arrived,
+                'prefetch_hits': self.prefetch_hits}
+
+    def _request_priority(self, tile_key):
+        """Get the priority of a request for a tile.
+
+        tile_key  tuple (level, x, y) of the requested tile
+
+        Returns a tuple (priority class, squared distance in tiles from the
+        view centre), lower is more urgent, or None if the tile is no longer
+        wanted.  Visible tiles are in class VisiblePriority.
+        """
+
+        if self.visible is None:
+            return (self.VisiblePriority, 0)
+
+        (level, x, y) = tile_key
+        (vis_level, min_x, max_x, min_y, max_y) = self.visible
+        dx = x - (min_x + max_x) / 2.0
+        dy = y - (min_y + max_y) / 2.0
+        if level == vis_level and min_x <= x <= max_x and min_y <= y <= max_y:
+            return (self.VisiblePriority, dx*dx + dy*dy)
+
+        priority = self.prefetch_wanted.get(tile_key, None)
+        if priority is not None:
+            return priority
+
+        margin = self.CancelMargin
+        if (level == vis_level
+                and min_x - margin <= x <= max_x + margin
+                and min_y - margin <= y <= max_y + margin):
+            return (self.RingPriority, dx*dx + dy*dy)
+
+        return None
+
+    def _tile_stale(self, key):
+        """A tile loaded from the on-disk cache has expired.
+
+        key  tuple (level, x, y) of the tile
+
+        The expired tile is still used, but is fetched again (or just
+        revalidated) in the background.
+        """
+
+        self.stale_tiles += 1
+        self.GetInternetTile(*key)
+
     def _tile_available(self, level, x, y, image, error):
         """A tile is available.
 
         level  level for the tile
         x      x coordinate of tile
         y      y coordinate of tile
-        image  tile image data
+        image  tile image data, None if a revalidated tile hasn't changed
         error  True if image is 'error' image
         """
 
+        # a tile that has left the view was fetched for nothing
+        self.fetched_tiles += 1
+        priority = self._request_priority((level, x, y))
+        if priority is None:
+            self.wasted_fetches += 1
+        visible = (priority is not None
+                   and priority[0] == self.VisiblePriority)
+
+        if image is None:
+            # the tile we have is still good, nothing to redraw
+            self.unchanged_tiles += 1
+            self.queued_requests.pop((level, x, y), None)
+            self.prefetch_pending.discard((level, x, y))
+            return
+
+        # remember prefetched tiles to see if they are used
+        if (level, x, y) in self.prefetch_pending:
+            self.prefetch_pending.discard((level, x, y))
+            if not error:
+                self.prefetch_arrived += 1
+                self.prefetched[(level, x, y)] = True
+                while len(self.prefetched) > self.PrefetchMemory:
+                    self.prefetched.popitem(last=False)
+
         # convert image to bitmap, save in cache
         bitmap = image.ConvertToBitmap()
 
         # don't cche error images, maybe we can get it again later
         if not error:
             self._cache_tile(image, bitmap, level, x, y)
+        self.stand_ins.pop((level, x, y), None)
 
         # remove the request from the queued requests
         # note that it may not be there - a level change can flush the dict
@@ -676,8 +1820,9 @@ class OSMTiles(tiles.Tiles):
         except KeyError:
             pass
 
-        # tell the world a new tile is available
-        wx.CallAfter(self.available_callback, level, x, y, image, bitmap)
+        # tell the world a new tile is available, if it's to be drawn now
+        if visible:
+            wx.CallAfter(self.available_callback, level, x, y, image, bitmap)
 
     def _cache_tile(self, image, bitmap, level, x, y):
         """Save a tile update from the internet.
@@ -689,11 +1834,13 @@ class OSMTiles(tiles.Tiles):
         y       tile Y coordinate
 
         We may already have a tile at (level, x, y).  Update in-memory cache
-        and on-disk cache with this new one.
+        and on-disk cache with this new one.  If the fetcher has already
+        written the tile file only the in-memory cache is updated.
         """
 
-        self.cache[(level, x, y)] = bitmap
-        self.cache._put_to_back((level, x, y), image)
+        self.cache._put_to_memory((level, x, y), bitmap)
+        if not self.store_raw:
+            self.cache._put_to_back((level, x, y), image)
 
     def Geo2Tile(self, geo):
         """Convert geo to tile fractional coordinates for level in use.
@@ -705,13 +1852,7 @@ class OSMTiles(tiles.Tiles):
         Code taken from [http://wiki.openstreetmap.org/wiki/Slippy_map_tilenames]
         """
 
-        (xgeo, ygeo) = geo
-        lat_rad = math.radians(ygeo)
-        n = 2.0 ** self.level
-        xtile = (xgeo + 180.0) / 360.0 * n
-        ytile = ((1.0 - math.log(math.tan(lat_rad) + (1.0/math.cos(lat_rad))) / math.pi) / 2.0) * n
-
-        return (xtile, ytile)
+        return LevelGeo2Tile(self.level, geo)
 
     def Tile2Geo(self, tile):
         """Convert tile fractional coordinates to geo for level in use.
@@ -731,6 +1872,45 @@ class OSMTiles(tiles.Tiles):
 
         return (xgeo, ygeo)
 
+    def Geo2TileArray(self, xgeo, ygeo):
+        """Convert many geo positions to tile fractional coordinates.
+
+        xgeo  sequence of geo X coordinates (numpy array or list)
+        ygeo  sequence of geo Y coordinates
+
+        Returns (xtile, ytile), numpy arrays if numpy is installed, else lists.
+        """
+
+        if np is None:
+            return tiles.Tiles.Geo2TileArray(self, xgeo, ygeo)
+
+        lat_rad = np.radians(np.asarray(ygeo, dtype=float))
+        n = 2.0 ** self.level
+        xtile = (np.asarray(xgeo, dtype=float) + 180.0) / 360.0 * n
+        ytile = ((1.0 - np.log(np.tan(lat_rad) + (1.0/np.cos(lat_rad))) / np.pi)
+                 / 2.0) * n
+
+        return (xtile, ytile)
+
+    def Tile2GeoArray(self, xtile, ytile):
+        """Convert many tile fractional coordinates to geo positions.
+
+        xtile  sequence of tile fractional X coordinates (numpy array or list)
+        ytile  sequence of tile fractional Y coordinates
+
+        Returns (xgeo, ygeo), numpy arrays if numpy is installed, else lists.
+        """
+
+        if np is None:
+            return tiles.Tiles.Tile2GeoArray(self, xtile, ytile)
+
+        n = 2.0 ** self.level
+        xgeo = np.asarray(xtile, dtype=float) / n * 360.0 - 180.0
+        ytile = np.asarray(ytile, dtype=float)
+        ygeo = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * ytile / n))))
+
+        return (xgeo, ygeo)
+
 
 if __name__ == '__main__':
     import unittest
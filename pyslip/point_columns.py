@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Columnar storage for big pySlip point layers.
+
+A layer made by AddPointLayer() holds a tuple of Python objects for every
+point.  PointColumns holds the point coordinates in two array('d') columns
+and one set of attributes shared by all points, except for the few points
+that override them.  It behaves like the usual list of point tuples, so
+pySlip draws and selects it as before, making a tuple only for each point
+it looks at.  It is indexed straight from the columns with a
+spatial_index.PointGridIndex.
+"""
+
+import array
+
+
+class PointColumns(object):
+    """Point layer data held as coordinate columns and shared attributes."""
+
+    def __init__(self, xs, ys, defaults, overrides=None):
+        """Build the columns.
+
+        xs, ys     sequences of the point X and Y coordinates
+        defaults   tuple (placement, radius, colour, offset_x, offset_y, udata)
+                   of the attributes shared by all points
+        overrides  dict mapping a point index to its own attributes tuple,
+                   like 'defaults'
+        """
+
+        if len(xs) != len(ys):
+            msg = ('Point X and Y columns must be the same length, '
+                   'got %d and %d' % (len(xs), len(ys)))
+            raise Exception(msg)
+
+        self.xs = array.array('d', xs)
+        self.ys = array.array('d', ys)
+        self.defaults = tuple(defaults)
+        self.overrides = dict(overrides or {})
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __getitem__(self, i):
+        """Get point 'i' as the tuple AddPointLayer() would have made.
+
+        Returns (x, y, placement, radius, colour, offset_x, offset_y, udata).
+        """
+
+        if i < 0:
+            i += len(self.xs)
+        return (self.xs[i], self.ys[i]) + self.overrides.get(i, self.defaults)
+
+    def __iter__(self):
+        (xs, ys) = (self.xs, self.ys)
+        (defaults, overrides) = (self.defaults, self.overrides)
+        for i in xrange(len(xs)):
+            yield (xs[i], ys[i]) + overrides.get(i, defaults)
+
+    def margin(self):
+        """Get the most pixels any point is drawn away from its position."""
+
+        margin = 0
+        for (place, radius, colour, x_off, y_off, udata) in \
+                [self.defaults] + self.overrides.values():
+            margin = max(margin, radius + abs(x_off), radius + abs(y_off))
+        return margin
@@ -5,9 +5,28 @@
 An extended dictionary offering limited LRU entries in the dictionary
 and an interface to an unlimited backing store.
 
+The LRU order is kept in a circular doubly-linked list of [prev, next, key]
+links with a dictionary mapping each key to its link, so a cache hit, an
+insert and an eviction are all O(1) no matter how many entries are held.
+
+The in-memory store may be limited by number of entries ('max_lru') or by
+the estimated memory footprint of the values held ('max_bytes'), or both.
+
+Backing store implementations may also remember keys known to be absent
+from the backing store (a 'negative cache') to avoid repeated expensive
+lookups of the same missing keys.  See _known_missing() and _note_missing().
+
 https://github.com/rzzzwilson/pyCacheBack
 """
 
+import sys
+import time
+import collections
+
+
+# indices into a link of the LRU list
+(PREV, NEXT, KEY) = range(3)
+
 
 class pyCacheBack(dict):
     """An LRU limited in-memory store fronting an unlimited on-disk store."""
@@ -15,77 +34,253 @@ class pyCacheBack(dict):
     # default maximum number of key/value pairs for pyCacheBack
     DefaultMaxLRU = 1000
 
+    # default maximum bytes held in memory (None means no limit)
+    DefaultMaxBytes = None
+
+    # default maximum number of remembered missing keys (0 disables)
+    DefaultMaxMissing = 10000
+
+    # default lifetime in seconds of a remembered missing key (None: forever)
+    DefaultMissingTTL = None
+
     # default path to tiles directory
     DefaultTilesDir = 'tiles'
 
     def __init__(self, *args, **kwargs):
-        self._lru_list = []
         self._max_lru = kwargs.pop('max_lru', self.DefaultMaxLRU)
+        self._max_bytes = kwargs.pop('max_bytes', self.DefaultMaxBytes)
         self._tiles_dir = kwargs.pop('tiles_dir', self.DefaultTilesDir)
+        self._sizes = {}                # maps key to estimated value size
+        self._total_bytes = 0           # sum of values in self._sizes
+        self._high_water_bytes = 0      # maximum value of self._total_bytes
+        self._max_missing = kwargs.pop('max_missing', self.DefaultMaxMissing)
+        self._missing_ttl = kwargs.pop('missing_ttl', self.DefaultMissingTTL)
+        self._missing = collections.OrderedDict()   # missing key -> time noted
+        self._missing_hits = 0          # lookups answered by self._missing
+        self._missing_noted = 0         # number of calls to _note_missing()
+        self._lru_clear()
         super(pyCacheBack, self).__init__(*args, **kwargs)
+        for (key, value) in super(pyCacheBack, self).items():
+            self._reorder_lru(key)
+            self._account(key, value)
+        self._enforce_lru_size()
 
     def __getitem__(self, key):
         if key in self:
             value = super(pyCacheBack, self).__getitem__(key)
         else:
             value = self._get_from_back(key)
+            if value is None:
+                # backing store has nothing, don't fill the LRU with that
+                if key not in self._missing:
+                    self._note_missing(key)
+                return value
+            super(pyCacheBack, self).__setitem__(key, value)
+            self._account(key, value)
         self._reorder_lru(key)
+        self._enforce_lru_size()
         return value
 
     def __setitem__(self, key, value):
-        super(pyCacheBack, self).__setitem__(key, value)
+        self._put_to_memory(key, value)
         self._put_to_back(key, value)
-        self._reorder_lru(key)
-        self._enforce_lru_size()
 
     def __delitem__(self, key):
         super(pyCacheBack, self).__delitem__(key)
         self._reorder_lru(key, remove=True)
+        self._unaccount(key)
 
     def clear(self):
         super(pyCacheBack, self).clear()
-        self._lru_list = []
+        self._lru_clear()
+        self._sizes = {}
+        self._total_bytes = 0
 
     def pop(self, *args):
-        k = args[0]
-        try:
-            self._lru_list.remove(k)
-        except ValueError:
-            pass
+        self._reorder_lru(args[0], remove=True)
+        self._unaccount(args[0])
         return super(pyCacheBack, self).pop(*args)
 
     def popitem(self):
         kv_return = super(pyCacheBack, self).popitem()
-        try:
-            self._lru_list.remove(kv_return[0])
-        except ValueError:
-            pass
+        self._reorder_lru(kv_return[0], remove=True)
+        self._unaccount(kv_return[0])
         return kv_return
 
+    def stats(self):
+        """Return a dictionary of in-memory cache statistics.
+
+        The keys are:
+            'entries'     number of entries held in memory
+            'bytes'       estimated size of all values held in memory
+            'high_water'  maximum value 'bytes' has reached
+            'max_lru'     entry limit (None or 0 if no limit)
+            'max_bytes'   byte limit (None if no limit)
+            'missing'     number of keys remembered as missing
+            'missing_hits'   backing store lookups saved by remembering
+                             missing keys
+            'missing_noted'  backing store lookups that found nothing
+        """
+
+        return {'entries': len(self),
+                'bytes': self._total_bytes,
+                'high_water': self._high_water_bytes,
+                'max_lru': self._max_lru,
+                'max_bytes': self._max_bytes,
+                'missing': len(self._missing),
+                'missing_hits': self._missing_hits,
+                'missing_noted': self._missing_noted}
+
+    def _put_to_memory(self, key, value):
+        """Store 'value' in the in-memory store only.
+
+        Used when the value came from (or has already been written to) the
+        backing store.
+        """
+
+        super(pyCacheBack, self).__setitem__(key, value)
+        self._forget_missing(key)
+        self._account(key, value)
+        self._reorder_lru(key)
+        self._enforce_lru_size()
+
+    def _lru_clear(self):
+        """Empty the LRU list.
+
+        The list root is a sentinel link that points at itself when empty.
+        root[NEXT] is the most recently used key, root[PREV] the least.
+        """
+
+        self._lru_root = root = []
+        root[:] = [root, root, None]
+        self._lru_map = {}
+
     def _reorder_lru(self, key, remove=False):
         """Move key in LRU (if it exists) to 'recent' end.
 
         If 'remove' is True just remove from the LRU.
         """
 
-        try:
-            self._lru_list.remove(key)
-        except ValueError:
-            pass
+        link = self._lru_map.pop(key, None)
+        if link is not None:
+            # unlink from current position
+            (link_prev, link_next, _) = link
+            link_prev[NEXT] = link_next
+            link_next[PREV] = link_prev
         if remove:
             return
-        self._lru_list.insert(0, key)
+
+        # link in at the 'recent' end
+        root = self._lru_root
+        first = root[NEXT]
+        if link is None:
+            link = [root, first, key]
+        else:
+            link[PREV] = root
+            link[NEXT] = first
+        first[PREV] = link
+        root[NEXT] = link
+        self._lru_map[key] = link
 
     def _enforce_lru_size(self):
-        """Enforce LRU size limit in cache dictionary."""
+        """Enforce LRU size and memory limits in cache dictionary.
+
+        The most recently used entry is never evicted, even if it alone
+        is bigger than the memory limit.
+        """
+
+        root = self._lru_root
+        while ((self._max_lru and len(self._lru_map) > self._max_lru)
+                or (self._max_bytes is not None
+                        and self._total_bytes > self._max_bytes
+                        and len(self._lru_map) > 1)):
+            # drop the least recently used key
+            key = root[PREV][KEY]
+            self._reorder_lru(key, remove=True)
+            self._unaccount(key)
+            super(pyCacheBack, self).pop(key, None)
+
+    def _account(self, key, value):
+        """Record the estimated size of 'value' stored at 'key'."""
+
+        self._unaccount(key)
+        size = self._size_of(value)
+        self._sizes[key] = size
+        self._total_bytes += size
+        if self._total_bytes > self._high_water_bytes:
+            self._high_water_bytes = self._total_bytes
+
+    def _unaccount(self, key):
+        """Forget the recorded size of the value at 'key', if any."""
+
+        self._total_bytes -= self._sizes.pop(key, 0)
+
+    def _size_of(self, value):
+        """Estimate the memory footprint of 'value' in bytes.
+
+        Images and bitmaps (anything with GetWidth() and GetHeight()) are
+        sized from their pixel dimensions and depth, everything else by
+        sys.getsizeof().  Override this for more accurate estimates.
+        """
+
+        try:
+            (width, height) = (value.GetWidth(), value.GetHeight())
+        except AttributeError:
+            return sys.getsizeof(value)
+
+        try:
+            depth = value.GetDepth()
+        except AttributeError:
+            # a wx.Image is RGB plus optional alpha
+            depth = 32 if getattr(value, 'HasAlpha', lambda: False)() else 24
+        if depth <= 0:
+            depth = 32
+
+        return width * height * depth // 8
+
+    def _known_missing(self, key):
+        """Return True if 'key' is known to be absent from the backing store.
+
+        Backing store implementations call this before an expensive lookup.
+        """
+
+        noted = self._missing.get(key, None)
+        if noted is None:
+            return False
+        if (self._missing_ttl is not None
+                and time.time() - noted > self._missing_ttl):
+            # remembered too long ago, must look again
+            del self._missing[key]
+            return False
+        self._missing_hits += 1
+        return True
 
-        # if a limit was defined and we have blown it
-        if self._max_lru and len(self) > self._max_lru:
-            # make sure in-memory dictionary doesn't get bigger
-            for key in self._lru_list[self._max_lru:]:
-                super(pyCacheBack, self).__delitem__(key)
-            # also truncate the LRU list
-            self._lru_list = self._lru_list[:self._max_lru]
+    def _note_missing(self, key):
+        """Remember that 'key' is absent from the backing store."""
+
+        self._missing_noted += 1
+        if not self._max_missing:
+            return
+        self._missing.pop(key, None)
+        self._missing[key] = time.time()
+        while len(self._missing) > self._max_missing:
+            self._missing.popitem(last=False)
+
+    def _forget_missing(self, key):
+        """Forget that 'key' is absent, usually because it's been stored."""
+
+        self._missing.pop(key, None)
+
+    def _lru_keys(self):
+        """Return a list of keys in LRU order, most recent first."""
+
+        result = []
+        root = self._lru_root
+        link = root[NEXT]
+        while link is not root:
+            result.append(link[KEY])
+            link = link[NEXT]
+        return result
 
     #####
     # override the following two methods to implement the backing cache
@@ -103,4 +298,3 @@ class pyCacheBack(dict):
         """
 
         raise KeyError
-
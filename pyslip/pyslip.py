@@ -27,6 +27,9 @@ import os
 import sys
 import glob
 import json
+import math
+import array
+import time
 try:
     import cPickle as pickle
 except ImportError:
@@ -34,6 +37,16 @@ except ImportError:
 import traceback
 import wx
 
+import spatial_index
+import pycacheback
+import point_columns
+
+# numpy is optional, batch conversions are faster with it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # if we don't have log.py, don't crash
 try:
     import pyslip.log as log
@@ -62,6 +75,12 @@ class _BufferedCanvas(wx.Panel):
     # The backing buffer
     buffer = None
 
+    # milliseconds areas marked by UpdateRect() are collected before redraw
+    DirtyDelay = 15
+
+    # default maximum redraws per second, full or scrolled, None is no limit
+    DefaultMaxFPS = 60
+
     def __init__(self, parent, id=wx.ID_ANY, pos=wx.DefaultPosition,
                  size=wx.DefaultSize, style=wx.NO_FULL_REPAINT_ON_RESIZE):
         """Initialise the canvas.
@@ -87,13 +106,69 @@ class _BufferedCanvas(wx.Panel):
         # set callback upon onSize event
         self.onSizeCallback = None
 
-    def Draw(self, dc):
-        """Stub: called when the canvas needs to be re-drawn."""
+        # area waiting to be redrawn by UpdateDirty(), None if nothing
+        self.dirty_region = None
+
+        # buffer the old drawing is moved into by UpdateScrollNow()
+        self.spare_buffer = None
+
+        # frame rate governor state for Update() and UpdateScroll()
+        self.max_fps = self.DefaultMaxFPS
+        self.last_frame_time = 0.0      # time of the last redraw or scroll
+        self.update_pending = False     # True if a full redraw is scheduled
+        self.scroll_pending = None      # (dx, dy) of a scheduled scroll
+
+    def Draw(self, dc, region=None):
+        """Stub: called when the canvas needs to be re-drawn.
+
+        dc      device context to draw on
+        region  if not None, the wx.Region to be redrawn, dc is clipped to it
+        """
 
         pass
 
-    def Update(self):
-        """Causes the canvas to be updated."""
+    def SetMaxFPS(self, max_fps):
+        """Set the maximum redraws per second, full or scrolled.
+
+        max_fps  the maximum rate, None (or 0) means redraw every time
+        """
+
+        self.max_fps = max_fps
+
+    def Update(self, immediate=False):
+        """Causes the canvas to be updated.
+
+        immediate  if True redraw now, else redraw now or, if the last
+                   redraw was less than 1/max_fps seconds ago, once then
+
+        Many calls in one frame interval cause just one more redraw.
+        """
+
+        if immediate or not self.max_fps:
+            self.UpdateNow()
+            return
+
+        if self.update_pending:
+            return
+        wait = self.last_frame_time + 1.0/self.max_fps - time.time()
+        if wait <= 0:
+            self.UpdateNow()
+        else:
+            self.update_pending = True
+            wx.CallLater(max(1, int(wait * 1000)), self.UpdateNow)
+
+    def UpdateNow(self):
+        """Redraw the whole canvas now."""
+
+        # the window may have gone since this was scheduled
+        if not self:
+            return
+
+        # everything is redrawn, so nothing is dirty or pending
+        self.dirty_region = None
+        self.update_pending = False
+        self.scroll_pending = None
+        self.last_frame_time = time.time()
 
         dc = wx.BufferedDC(wx.ClientDC(self), self.buffer)
         dc.BeginDrawing()
@@ -101,6 +176,144 @@ class _BufferedCanvas(wx.Panel):
         self.Draw(dc)
         dc.EndDrawing()
 
+    def UpdateRect(self, rect):
+        """Causes part of the canvas to be updated soon.
+
+        rect  wx.Rect of the view area to redraw
+
+        Areas marked within DirtyDelay milliseconds are redrawn together.
+        """
+
+        if self.scroll_pending is not None:
+            # the buffer isn't moved yet, mark the area where it is now
+            (dx, dy) = self.scroll_pending
+            rect = wx.Rect(rect.x + dx, rect.y + dy, rect.width, rect.height)
+
+        if self.dirty_region is None:
+            self.dirty_region = wx.Region()
+            wx.CallLater(self.DirtyDelay, self.UpdateDirty)
+        self.dirty_region.UnionRect(rect)
+
+    def UpdateDirty(self):
+        """Redraw the areas marked by UpdateRect()."""
+
+        # the window may have gone since this was scheduled
+        if not self:
+            return
+
+        # a scheduled scroll redraws these areas after moving the buffer
+        if self.scroll_pending is not None:
+            return
+
+        region = self.dirty_region
+        self.dirty_region = None
+        if region is None or region.IsEmpty():
+            return
+        self.UpdateRegion(region)
+
+    def UpdateScroll(self, dx, dy, immediate=False):
+        """Causes the canvas to be updated after the view has moved.
+
+        dx, dy     distance the view moved, as for UpdateScrollNow()
+        immediate  if True move and redraw now, else now or, if the last
+                   redraw was less than 1/max_fps seconds ago, once then
+
+        Moves in one frame interval, such as a burst of drag events, are
+        added up and drawn by one UpdateScrollNow().
+        """
+
+        if self.scroll_pending is not None:
+            (pending_dx, pending_dy) = self.scroll_pending
+            self.scroll_pending = (pending_dx + dx, pending_dy + dy)
+            if immediate:
+                self.UpdateScrollPending()
+            return
+
+        if immediate or not self.max_fps:
+            self.UpdateScrollNow(dx, dy)
+            return
+
+        if self.update_pending:
+            # the whole canvas is redrawn soon
+            return
+        wait = self.last_frame_time + 1.0/self.max_fps - time.time()
+        if wait <= 0:
+            self.UpdateScrollNow(dx, dy)
+        else:
+            self.scroll_pending = (dx, dy)
+            wx.CallLater(max(1, int(wait * 1000)), self.UpdateScrollPending)
+
+    def UpdateScrollPending(self):
+        """Draw the moves added up by UpdateScroll()."""
+
+        # the window may have gone since this was scheduled
+        if not self:
+            return
+
+        scroll = self.scroll_pending
+        self.scroll_pending = None
+        if scroll is None:
+            return
+        self.UpdateScrollNow(*scroll)
+
+    def UpdateScrollNow(self, dx, dy):
+        """Update the canvas now after the view has moved by (dx, dy) pixels.
+
+        dx, dy  distance the view moved over the drawing, positive is right
+                and down, so the drawing moves left and up
+
+        The buffer contents are moved with one blit and only the strips
+        uncovered are redrawn.  Draw() must draw nothing fixed in the view.
+        """
+
+        self.last_frame_time = time.time()
+        (width, height) = self.buffer.GetSize()
+        if abs(dx) >= width or abs(dy) >= height:
+            self.Update(immediate=True)
+            return
+
+        # move the buffer contents into the spare buffer, then swap them
+        if self.spare_buffer is None:
+            self.spare_buffer = wx.EmptyBitmap(width, height)
+        src_dc = wx.MemoryDC(self.buffer)
+        dst_dc = wx.MemoryDC(self.spare_buffer)
+        dst_dc.Blit(-dx, -dy, width, height, src_dc, 0, 0)
+        dst_dc.SelectObject(wx.NullBitmap)
+        src_dc.SelectObject(wx.NullBitmap)
+        (self.buffer, self.spare_buffer) = (self.spare_buffer, self.buffer)
+
+        # redraw the uncovered strips, and anything waiting to be redrawn
+        region = wx.Region()
+        if dx > 0:
+            region.UnionRect(wx.Rect(width - dx, 0, dx, height))
+        elif dx < 0:
+            region.UnionRect(wx.Rect(0, 0, -dx, height))
+        if dy > 0:
+            region.UnionRect(wx.Rect(0, height - dy, width, dy))
+        elif dy < 0:
+            region.UnionRect(wx.Rect(0, 0, width, -dy))
+        if self.dirty_region is not None:
+            self.dirty_region.Offset(-dx, -dy)
+            region.UnionRegion(self.dirty_region)
+            self.dirty_region = None
+        if region.IsEmpty():
+            return
+        self.UpdateRegion(region)
+
+    def UpdateRegion(self, region):
+        """Redraw part of the canvas now.
+
+        region  wx.Region of the view to redraw
+        """
+
+        dc = wx.BufferedDC(wx.ClientDC(self), self.buffer)
+        dc.BeginDrawing()
+        dc.SetClippingRegionAsRegion(region)
+        dc.Clear()
+        self.Draw(dc, region)
+        dc.DestroyClippingRegion()
+        dc.EndDrawing()
+
     def OnPaint(self, event):
         """Paint the canvas to the screen."""
 
@@ -120,13 +333,14 @@ class _BufferedCanvas(wx.Panel):
 
         # new off-screen buffer
         self.buffer = wx.EmptyBitmap(width, height)
+        self.spare_buffer = None
 
         # call onSize callback, if registered
         if self.onSizeCallback:
             self.onSizeCallback()
 
-        # Now update the screen
-        self.Update()
+        # Now update the screen, the new buffer is empty
+        self.Update(immediate=True)
 
 ######
 # A layer class - encapsulates all layer data.
@@ -161,6 +375,12 @@ class _Layer(object):
         self.selectable = selectable    # True if we can select on this layer
         self.delta = self.DefaultDelta  # minimum distance for selection
         self.name = name                # name of this layer
+        self.cached = False             # True if drawn from a raster cache
+        self.cache = None               # (level, x, y, bitmap) raster cache
+        self.index = None               # spatial index of map-relative data
+        self.index_margin = 0           # pixels objects may be drawn off point
+        self.edge_indexes = {}          # polygon number -> PolygonEdgeIndex
+        self.projected = None           # level -> map pixel positions LRU
         self.type = type                # type of layer
         self.id = id                    # ID of this layer
 
@@ -415,6 +635,19 @@ class PySlip(_BufferedCanvas):
     # layer type values
     (TypePoint, TypeImage, TypeText, TypePoly) = range(4)
 
+    # pixels around the view drawn into a cached layer's bitmap
+    LayerCacheMargin = 256
+
+    # polygons with this many vertices are converted with numpy, if we can
+    PexPolyArrayMin = 32
+
+    # number of levels of projected positions kept for each layer
+    ProjectedLevels = 4
+
+    # all of a layer's positions at a level are projected and kept once this
+    # fraction of its objects is looked at in one go, else just those are
+    ProjectedFraction = 0.1
+
 
     def __init__(self, parent, tile_src=None, start_level=None,
                  min_level=None, max_level=None, tilesets=None, **kwargs):
@@ -477,6 +710,9 @@ class PySlip(_BufferedCanvas):
         self.was_dragging = False               # True if dragging map
         self.last_drag_x = None                 # previous drag position
         self.last_drag_y = None
+        self.last_drag_time = None              # time of previous drag
+        self.drag_velocity = (0.0, 0.0)         # view movement, pixels/second
+        self.zoom_direction = 0                 # 1 zoomed in, -1 out, else 0
 
         self.ignore_next_up = False             # ignore next LEFT UP event
         self.ignore_next_right_up = False       # ignore next RIGHT UP event
@@ -559,10 +795,17 @@ class PySlip(_BufferedCanvas):
         img    tile image
         bmp    tile bitmap
 
-        We don't use any of the above - just redraw the entire canvas.
+        Only the area of the new tile is redrawn, and only if it's visible.
         """
 
-        self.Update()
+        if level != self.level:
+            return
+
+        rect = wx.Rect(x*self.tile_size_x - self.view_offset_x,
+                       y*self.tile_size_y - self.view_offset_y,
+                       self.tile_size_x, self.tile_size_y)
+        if rect.Intersects(wx.Rect(0, 0, self.view_width, self.view_height)):
+            self.UpdateRect(rect)
 
     def OnEnterWindow(self, event):
         """Event handler when mouse enters widget."""
@@ -666,6 +909,76 @@ class PySlip(_BufferedCanvas):
                              selectable=selectable, name=name,
                              type=self.TypePoint)
 
+    def AddPointColumnLayer(self, xs, ys, overrides=None, map_rel=True,
+                            visible=True, show_levels=None, selectable=False,
+                            name='<point_column_layer>', **kwargs):
+        """Add a layer of many points held as coordinate columns.
+
+        xs, ys       sequences of the point X and Y coordinates, either lon&lat
+                     (map) or x&y (view) coords
+        overrides    optional dictionary mapping a point index to a dictionary
+                     of attributes for that point, keys as for AddPointLayer()
+        map_rel      points are map relative if True, else view relative
+        visible      True if the layer is visible
+        show_levels  list of levels at which layer is auto-shown (or None==all)
+        selectable   True if select operates on this layer
+        name         the 'name' of the layer - mainly for debug
+        kwargs       a layer-specific attributes dictionary shared by all
+                     points, keys as for AddPointLayer()
+
+        The layer draws and selects like one made by AddPointLayer() but
+        takes much less memory and time to make, as a point only has its
+        own attributes if it is in 'overrides'.
+        """
+
+        # merge global and layer defaults
+        if map_rel:
+            default_placement = kwargs.get('placement', self.DefaultPointPlacement)
+            default_radius = kwargs.get('radius', self.DefaultPointRadius)
+            default_colour = self.get_i18n_kw(kwargs, ('colour', 'color'),
+                                              self.DefaultPointColour)
+            default_offset_x = kwargs.get('offset_x', self.DefaultPointOffsetX)
+            default_offset_y = kwargs.get('offset_y', self.DefaultPointOffsetY)
+            default_data = kwargs.get('data', self.DefaultPointData)
+        else:
+            default_placement = kwargs.get('placement', self.DefaultPointViewPlacement)
+            default_radius = kwargs.get('radius', self.DefaultPointViewRadius)
+            default_colour = self.get_i18n_kw(kwargs, ('colour', 'color'),
+                                              self.DefaultPointViewColour)
+            default_offset_x = kwargs.get('offset_x', self.DefaultPointViewOffsetX)
+            default_offset_y = kwargs.get('offset_y', self.DefaultPointViewOffsetY)
+            default_data = kwargs.get('data', self.DefaultPointData)
+
+        # the shared attributes, then those of points that differ
+        defaults = (default_placement.lower(), default_radius, default_colour,
+                    default_offset_x, default_offset_y, default_data)
+        point_attributes = {}
+        for (i, attributes) in (overrides or {}).items():
+            point_attributes[i] = (
+                    attributes.get('placement', default_placement).lower(),
+                    attributes.get('radius', default_radius),
+                    self.get_i18n_kw(attributes, ('colour', 'color'),
+                                     default_colour),
+                    attributes.get('offset_x', default_offset_x),
+                    attributes.get('offset_y', default_offset_y),
+                    attributes.get('data', default_data))
+
+        # check values that can be wrong
+        for attributes in [defaults] + point_attributes.values():
+            placement = attributes[0]
+            if placement not in self.valid_placements:
+                msg = ("Point placement value is invalid, got '%s'"
+                       % str(placement))
+                raise Exception(msg)
+
+        draw_data = point_columns.PointColumns(xs, ys, defaults,
+                                               point_attributes)
+
+        return self.AddLayer(self.DrawPointLayer, draw_data, map_rel,
+                             visible=visible, show_levels=show_levels,
+                             selectable=selectable, name=name,
+                             type=self.TypePoint)
+
     def AddImageLayer(self, data, map_rel=True, visible=True,
                       show_levels=None, selectable=False,
                       name='<image_layer>', **kwargs):
@@ -1000,6 +1313,10 @@ class PySlip(_BufferedCanvas):
                    visible=visible, show_levels=show_levels,
                    selectable=selectable, name=name, type=type)
 
+        # index map-relative data so only objects in view are drawn
+        if map_rel:
+            self.MakeLayerIndex(l)
+
         self.layer_mapping[id] = l
         self.layer_z_order.append(id)
 
@@ -1071,6 +1388,43 @@ class PySlip(_BufferedCanvas):
             if visible:
                 self.Update()
 
+    def SetLayerCached(self, id, cached=True):
+        """Draw a map-relative layer from a raster cache, or not.
+
+        id      ID of the layer we are going to update
+        cached  True if the layer is to be cached
+
+        A cached layer is drawn once into a bitmap LayerCacheMargin pixels
+        larger than the view all round, and that is drawn while panning.  It
+        is redrawn when the level changes or the view leaves the bitmap.
+        Call InvalidateLayerCache() if the layer data is changed.
+        View-relative layers are never cached.
+        """
+
+        if id:
+            layer = self.layer_mapping[id]
+            layer.cached = cached and layer.map_rel
+            layer.cache = None
+
+    def InvalidateLayerCache(self, id):
+        """Discard what is kept about a layer's data and redraw.
+
+        id  ID of the layer whose data has changed
+
+        The raster cache and projected positions are dropped, and the
+        spatial index of a map-relative layer is remade.
+        """
+
+        if id:
+            layer = self.layer_mapping[id]
+            layer.cache = None
+            layer.projected = None
+            if layer.map_rel:
+                layer.edge_indexes = {}
+                self.MakeLayerIndex(layer)
+            if layer.visible:
+                self.Update()
+
     def SetLayerSelectable(self, id, selectable=False):
         """Update the .selectable attribute for a layer.
 
@@ -1123,13 +1477,250 @@ class PySlip(_BufferedCanvas):
     # Layer drawing routines
     ######
 
-    def DrawPointLayer(self, dc, data, map_rel):
+    def MakeLayerIndex(self, layer):
+        """Build the spatial index of a map-relative layer's data.
+
+        layer  the _Layer to index
+
+        Each object is indexed by its geo position or extent.  Objects are
+        drawn up to some pixels from that, the most for the layer is kept
+        in layer.index_margin.
+        """
+
+        boxes = []
+        margin = 0
+        if isinstance(layer.data, point_columns.PointColumns):
+            # indexed straight from the coordinate columns
+            layer.index = spatial_index.PointGridIndex(layer.data.xs,
+                                                       layer.data.ys)
+            layer.index_margin = layer.data.margin()
+            return
+        elif layer.type == self.TypePoint:
+            for (x, y, place, radius, colour,
+                     x_off, y_off, udata) in layer.data:
+                boxes.append((x, x, y, y))
+                margin = max(margin, radius + abs(x_off), radius + abs(y_off))
+        elif layer.type == self.TypeImage:
+            for (lon, lat, bmap, w, h, place,
+                     x_off, y_off, radius, colour, udata) in layer.data:
+                boxes.append((lon, lon, lat, lat))
+                margin = max(margin, max(w, h, radius)
+                                     + max(abs(x_off), abs(y_off)))
+        elif layer.type == self.TypeText:
+            for (lon, lat, tdata, place, radius, colour, tcolour,
+                     fname, fsize, x_off, y_off, udata) in layer.data:
+                boxes.append((lon, lon, lat, lat))
+                # generous, text is drawn well inside this
+                margin = max(margin, 2*fsize*(len(tdata) + 1) + radius
+                                     + max(abs(x_off), abs(y_off)))
+        elif layer.type == self.TypePoly:
+            for (poly, place, width, colour, close,
+                     filled, fcolour, x_off, y_off, udata) in layer.data:
+                if poly:
+                    lons = [lon for (lon, lat) in poly]
+                    lats = [lat for (lon, lat) in poly]
+                    boxes.append((min(lons), max(lons), min(lats), max(lats)))
+                else:
+                    boxes.append(None)
+                margin = max(margin, width + max(abs(x_off), abs(y_off)))
+        else:
+            return
+
+        layer.index = spatial_index.GridIndex(boxes)
+        layer.index_margin = margin
+
+    def PaintLayer(self, dc, layer, region=None):
+        """Draw a layer with its painter, giving it only the data in view.
+
+        dc      the device context to draw on
+        layer   the _Layer to draw
+        region  if not None, the wx.Region of the view being redrawn, only
+                data near its rectangles is drawn
+
+        The rectangles of a region are looked up separately, as the
+        L-shaped region uncovered by a diagonal pan is bounded by the view.
+        """
+
+        if layer.index is None:
+            layer.painter(dc, layer.data, map_rel=layer.map_rel)
+            return
+
+        rects = []
+        if region is None:
+            rects.append((0, 0, self.view_width, self.view_height))
+        else:
+            region_rects = wx.RegionIterator(region)
+            while region_rects.HaveRects():
+                (x, y, width, height) = region_rects.GetRect().Get()
+                rects.append((x, y, x + width, y + height))
+                region_rects.Next()
+        (data, view) = self.LayerDataInViewRects(layer, rects)
+        if view is None:
+            layer.painter(dc, data, map_rel=True)
+        else:
+            layer.painter(dc, data, map_rel=True, view=view)
+
+    def LayerDataInViewRect(self, layer, x1, y1, x2, y2):
+        """Get the indexed layer data that may be drawn in part of the view.
+
+        layer           the _Layer with a spatial index
+        x1, y1, x2, y2  the view coordinates of the top-left and bottom-right
+                        of the view rectangle
+
+        Returns (data, view) where 'data' is the objects near the rectangle,
+        in their original order.  For point, image and text layers 'view' is
+        a matching list of (xview, yview) object positions, else None.
+        """
+
+        return self.LayerDataInViewRects(layer, [(x1, y1, x2, y2)])
+
+    def LayerDataInViewRects(self, layer, rects):
+        """Get the indexed layer data that may be drawn in parts of the view.
+
+        layer  the _Layer with a spatial index
+        rects  list of (x1, y1, x2, y2) view rectangles, as for
+               LayerDataInViewRect()
+
+        Returns (data, view) as for LayerDataInViewRect(), 'data' being the
+        objects near any of the rectangles.
+        """
+
+        margin = layer.index_margin + 1
+        indices = []
+        for (x1, y1, x2, y2) in rects:
+            (left, top) = self.View2Geo((x1 - margin, y1 - margin))
+            (right, bottom) = self.View2Geo((x2 + margin, y2 + margin))
+            indices.extend(layer.index.query(min(left, right),
+                                             max(left, right),
+                                             min(top, bottom),
+                                             max(top, bottom)))
+        if len(rects) > 1:
+            indices = sorted(set(indices))
+
+        data = layer.data
+        if len(indices) != len(data):
+            data = [data[i] for i in indices]
+
+        view = None
+        if layer.type in (self.TypePoint, self.TypeImage, self.TypeText):
+            if (len(indices) >= self.ProjectedFraction * len(layer.data)
+                    or (layer.projected is not None
+                            and self.level in layer.projected)):
+                (map_x, map_y) = self.LayerMapPositions(layer)
+                (offset_x, offset_y) = (self.view_offset_x,
+                                        self.view_offset_y)
+                view = [(map_x[i] - offset_x, map_y[i] - offset_y)
+                        for i in indices]
+            else:
+                # a click or a small view, don't project the whole layer
+                view = [self.Geo2View(obj[:2]) for obj in data]
+
+        return (data, view)
+
+    def LayerMapPositions(self, layer):
+        """Get the map pixel positions of a layer's objects at this level.
+
+        layer  a map-relative point, image or text _Layer
+
+        Returns (map_x, map_y), arrays of the map pixel coordinates of each
+        object.  A pan only changes the view offset, so positions are kept
+        for the last ProjectedLevels levels used.
+        """
+
+        if layer.projected is None:
+            layer.projected = pycacheback.pyCacheBack(
+                                                max_lru=self.ProjectedLevels)
+        try:
+            return layer.projected[self.level]
+        except KeyError:
+            pass
+
+        if isinstance(layer.data, point_columns.PointColumns):
+            (lons, lats) = (layer.data.xs, layer.data.ys)
+            if np is not None:
+                lons = np.frombuffer(lons, dtype=float)
+                lats = np.frombuffer(lats, dtype=float)
+        else:
+            lons = [obj[0] for obj in layer.data]
+            lats = [obj[1] for obj in layer.data]
+        (xtile, ytile) = self.tiles.Geo2TileArray(lons, lats)
+        size_x = self.tiles.tile_size_x
+        size_y = self.tiles.tile_size_y
+        if np is not None:
+            positions = (xtile*size_x, ytile*size_y)
+        else:
+            positions = (array.array('d', [x*size_x for x in xtile]),
+                         array.array('d', [y*size_y for y in ytile]))
+        layer.projected[self.level] = positions
+        return positions
+
+    def DrawCachedLayer(self, dc, layer):
+        """Draw a layer from its raster cache, remaking the cache if required.
+
+        dc     the device context to draw on
+        layer  the _Layer to draw
+        """
+
+        if layer.cache is not None:
+            (level, x, y, bitmap) = layer.cache
+            (width, height) = bitmap.GetSize()
+            if (level != self.level
+                    or not (x <= self.view_offset_x
+                            and self.view_offset_x + self.view_width <= x + width
+                            and y <= self.view_offset_y
+                            and self.view_offset_y + self.view_height
+                                <= y + height)):
+                layer.cache = None
+
+        if layer.cache is None:
+            layer.cache = self.MakeLayerCache(layer)
+
+        (_, x, y, bitmap) = layer.cache
+        dc.DrawBitmap(bitmap, x - self.view_offset_x, y - self.view_offset_y,
+                      True)
+
+    def MakeLayerCache(self, layer):
+        """Draw a layer into a transparent bitmap larger than the view.
+
+        layer  the _Layer to draw
+
+        Returns (level, x, y, bitmap) where (x, y) is the map pixel position
+        of the bitmap top-left corner.
+
+        The layer painter draws as if the view were the bitmap.
+        """
+
+        margin = self.LayerCacheMargin
+        saved = (self.view_offset_x, self.view_offset_y,
+                 self.view_width, self.view_height)
+        x = self.view_offset_x - margin
+        y = self.view_offset_y - margin
+        width = self.view_width + 2*margin
+        height = self.view_height + 2*margin
+
+        bitmap = wx.EmptyBitmapRGBA(width, height, 0, 0, 0, 0)
+        dc = wx.MemoryDC(bitmap)
+        (self.view_offset_x, self.view_offset_y,
+             self.view_width, self.view_height) = (x, y, width, height)
+        self.RecalcViewLimits()
+        try:
+            self.PaintLayer(dc, layer)
+        finally:
+            (self.view_offset_x, self.view_offset_y,
+                 self.view_width, self.view_height) = saved
+            self.RecalcViewLimits()
+            dc.SelectObject(wx.NullBitmap)
+
+        return (self.level, x, y, bitmap)
+
+    def DrawPointLayer(self, dc, data, map_rel, view=None):
         """Draw a points layer.
 
         dc       the device context to draw on
         data     an iterable of point tuples:
                      (x, y, place, radius, colour, x_off, y_off, udata)
         map_rel  points relative to map if True, else relative to view
+        view     if given, a list of the view positions of map-relative points
         """
 
         # allow transparent colours
@@ -1141,21 +1732,27 @@ class PySlip(_BufferedCanvas):
             pex = self.PexPoint
 
         # draw points on map/view
-        for (x, y, place, radius, colour, x_off, y_off, udata) in data:
-            (pt, ex) = pex(place, (x,y), x_off, y_off, radius)
+        for (i, (x, y, place, radius, colour,
+                 x_off, y_off, udata)) in enumerate(data):
+            if view:
+                (pt, ex) = pex(place, (x,y), x_off, y_off, radius,
+                               view=view[i])
+            else:
+                (pt, ex) = pex(place, (x,y), x_off, y_off, radius)
             if ex and radius:  # don't draw if not on screen or zero radius
                 dc.SetPen(wx.Pen(colour))
                 dc.SetBrush(wx.Brush(colour))
                 (x, _, y, _) = ex
                 dc.DrawCircle(x+radius, y+radius, radius)
 
-    def DrawImageLayer(self, dc, images, map_rel):
+    def DrawImageLayer(self, dc, images, map_rel, view=None):
         """Draw an image Layer on the view.
 
         dc       the device context to draw on
         images   a sequence of image tuple sequences
                    (x,y,bmap,w,h,placement,offset_x,offset_y,idata)
         map_rel  points relative to map if True, else relative to view
+        view     if given, a list of the view positions of map-relative images
         """
 
         # allow transparent colours
@@ -1167,9 +1764,13 @@ class PySlip(_BufferedCanvas):
             pex = self.PexExtent
 
         # draw the images
-        for (lon, lat, bmap, w, h, place,
-                 x_off, y_off, radius, colour, idata) in images:
-            (pt, ex) = pex(place, (lon, lat), x_off, y_off, w, h)
+        for (i, (lon, lat, bmap, w, h, place,
+                 x_off, y_off, radius, colour, idata)) in enumerate(images):
+            if view:
+                (pt, ex) = pex(place, (lon, lat), x_off, y_off, w, h,
+                               view=view[i])
+            else:
+                (pt, ex) = pex(place, (lon, lat), x_off, y_off, w, h)
             if ex:
                 (ix, _, iy, _) = ex
                 dc.DrawBitmap(bmap, ix, iy, False)
@@ -1180,7 +1781,7 @@ class PySlip(_BufferedCanvas):
                 (px, py) = pt
                 dc.DrawCircle(px, py, radius)
 
-    def DrawTextLayer(self, dc, text, map_rel):
+    def DrawTextLayer(self, dc, text, map_rel, view=None):
         """Draw a text Layer on the view.
 
         dc       the device context to draw on
@@ -1188,6 +1789,7 @@ class PySlip(_BufferedCanvas):
                      (lon, lat, tdata, placement, radius, colour, fontname,
                       fontsize, offset_x, offset_y, tdata)
         map_rel  points relative to map if True, else relative to view
+        view     if given, a list of the view positions of map-relative text
         """
 
         # we need the size of the DC
@@ -1200,8 +1802,8 @@ class PySlip(_BufferedCanvas):
 
         # draw text on map/view
         last_setfont = None
-        for (lon, lat, tdata, place, radius, colour,
-                textcolour, fontname, fontsize, x_off, y_off, data) in text:
+        for (i, (lon, lat, tdata, place, radius, colour, textcolour,
+                 fontname, fontsize, x_off, y_off, data)) in enumerate(text):
 
             # set font characteristics so we calculate text width/height
             dc.SetTextForeground(textcolour)
@@ -1214,7 +1816,11 @@ class PySlip(_BufferedCanvas):
             (w, h, _, _) = dc.GetFullTextExtent(tdata)
 
             # get point + extent information (each can be None if off-view)
-            (pt, ex) = pex(place, (lon, lat), x_off, y_off, w, h)
+            if view:
+                (pt, ex) = pex(place, (lon, lat), x_off, y_off, w, h,
+                               view=view[i])
+            else:
+                (pt, ex) = pex(place, (lon, lat), x_off, y_off, w, h)
             if ex:
                 (lx, _, ty, _) = ex
                 dc.DrawText(tdata, lx, ty)
@@ -1347,6 +1953,23 @@ class PySlip(_BufferedCanvas):
         return ((tx * self.tiles.tile_size_x) - self.view_offset_x,
                 (ty * self.tiles.tile_size_y) - self.view_offset_y)
 
+    def Geo2ViewArray(self, xgeo, ygeo):
+        """Convert many geo coords to view.
+
+        xgeo  sequence of geo X coordinates (numpy array or list)
+        ygeo  sequence of geo Y coordinates
+
+        Returns (xview, yview), numpy arrays if numpy is installed, else lists.
+        """
+
+        (tx, ty) = self.tiles.Geo2TileArray(xgeo, ygeo)
+        size_x = self.tiles.tile_size_x
+        size_y = self.tiles.tile_size_y
+        if np is not None:
+            return (tx*size_x - self.view_offset_x,
+                    ty*size_y - self.view_offset_y)
+        return ([x*size_x - self.view_offset_x for x in tx],
+                [y*size_y - self.view_offset_y for y in ty])
 
     def Geo2ViewMasked(self, geo):
         """Convert a geo (lon+lat) position to view pixel coords.
@@ -1374,12 +1997,13 @@ class PySlip(_BufferedCanvas):
     # tuple (lx, rx, ty, by) [left, right, top, bottom].
     ######
 
-    def PexPoint(self, place, geo, x_off, y_off, radius):
+    def PexPoint(self, place, geo, x_off, y_off, radius, view=None):
         """Given a point object (geo coords) get point/extent in view coords.
 
         place         placement string
         geo           point position tuple (xgeo, ygeo)
         x_off, y_off  X and Y offsets
+        view          view position of 'geo', if already known
 
         Return a tuple of point and extent origins (point, extent) where 'point'
         is (px, py) and extent is (elx, erx, ety, eby) (both in view coords).
@@ -1389,7 +2013,9 @@ class PySlip(_BufferedCanvas):
         """
 
         # get point view coords
-        (xview, yview) = self.Geo2View(geo)
+        if view is None:
+            view = self.Geo2View(geo)
+        (xview, yview) = view
         point = self.point_placement(place, xview, yview, x_off, y_off)
         (px, py) = point
 
@@ -1448,12 +2074,13 @@ class PySlip(_BufferedCanvas):
 
         return (point, extent)
 
-    def PexExtent(self, place, geo, x_off, y_off, w, h):
+    def PexExtent(self, place, geo, x_off, y_off, w, h, view=None):
         """Given an extent object convert point/extent coords to view coords.
 
         place         placement string
         geo           point position tuple (xgeo, ygeo)
         x_off, y_off  X and Y offsets
+        view          view position of 'geo', if already known
         w, h          width and height of extent in pixels
 
         Return a tuple of point and extent origins (point, extent) where 'point'
@@ -1464,7 +2091,9 @@ class PySlip(_BufferedCanvas):
         """
 
         # get point view coords
-        point = self.Geo2View(geo)
+        point = view
+        if point is None:
+            point = self.Geo2View(geo)
         (px, py) = point
 
         # extent = (left, right, top, bottom) in view coords
@@ -1531,6 +2160,14 @@ class PySlip(_BufferedCanvas):
         coords).  Return None for either or both if off-view.
         """
 
+        # an empty polygon is never on view
+        if not poly:
+            return (None, None)
+
+        # big polygons are converted in one go if numpy is available
+        if np is not None and len(poly) >= self.PexPolyArrayMin:
+            return self.PexPolyArray(place, poly, x_off, y_off)
+
         # get polygon points in perturbed view coordinates
         view = []
         for geo in poly:
@@ -1558,6 +2195,29 @@ class PySlip(_BufferedCanvas):
 
         return (res_pt, res_ex)
 
+    def PexPolyArray(self, place, poly, x_off, y_off):
+        """PexPoly() for a big polygon, using numpy.
+
+        Converts all vertices to view coordinates in one call.
+        """
+
+        geo = np.asarray(poly, dtype=float)
+        (xview, yview) = self.Geo2ViewArray(geo[:,0], geo[:,1])
+
+        # map-relative placement is just a shift
+        (dx, dy) = self.point_placement(place, 0, 0, x_off, y_off)
+        xview += dx
+        yview += dy
+
+        in_view = ((xview >= 0) & (xview < self.view_width)
+                   & (yview >= 0) & (yview < self.view_height))
+        if not in_view.any():
+            return (None, None)
+
+        view = zip(xview.tolist(), yview.tolist())
+        extent = (xview.min(), xview.max(), yview.min(), yview.max())
+        return (view, extent)
+
     def PexPolyView(self, place, poly, x_off, y_off):
         """Given a polygon object (view coords) get point/extent in view coords.
 
@@ -1622,6 +2282,7 @@ class PySlip(_BufferedCanvas):
 
         if event.Dragging() and event.LeftIsDown():
             (x, y) = mouse_view
+            scroll = None           # (dx, dy) the view moved, if it did
 
             # are we doing box select?
             if self.is_box_select:
@@ -1635,6 +2296,8 @@ class PySlip(_BufferedCanvas):
                 dy = self.last_drag_y - y
 
                 # move the map in the view
+                (old_x_offset, old_y_offset) = (self.view_offset_x,
+                                                self.view_offset_y)
                 self.view_offset_x += dx
                 self.view_offset_y += dy
 
@@ -1661,14 +2324,44 @@ class PySlip(_BufferedCanvas):
                     self.view_offset_y = (self.map_height
                                           - self.view_height) / 2
 
+                # smoothed speed the view moves over the map, for prefetch
+                now = time.time()
+                delta = max(now - self.last_drag_time, 0.001)
+                (vx, vy) = self.drag_velocity
+                self.drag_velocity = (0.5*vx + 0.5*dx/delta,
+                                      0.5*vy + 0.5*dy/delta)
+                self.last_drag_time = now
+                self.zoom_direction = 0
+
                 # adjust remembered X,Y
                 self.last_drag_x = x
                 self.last_drag_y = y
 
                 self.RecalcViewLimits()
+                scroll = (self.view_offset_x - old_x_offset,
+                          self.view_offset_y - old_y_offset)
 
-            # redraw client area
-            self.Update()
+            # redraw client area, just the uncovered part if panning
+            if scroll and self.CanScrollView():
+                if scroll != (0, 0):
+                    self.UpdateScroll(*scroll)
+            else:
+                self.Update()
+
+    def CanScrollView(self):
+        """Decide if a pan can move the drawn view rather than redraw it.
+
+        Not if anything is drawn fixed in the view: view-relative layers
+        or a selection box.
+        """
+
+        if self.sbox_1_x is not None:
+            return False
+        for id in self.layer_z_order:
+            l = self.layer_mapping[id]
+            if l.visible and not l.map_rel and self.level in l.show_levels:
+                return False
+        return True
 
     def OnKeyDown(self, event):
         if event.m_keyCode == wx.WXK_SHIFT:
@@ -1696,6 +2389,8 @@ class PySlip(_BufferedCanvas):
             self.is_box_select = False
             self.SetCursor(wx.StockCursor(wx.CURSOR_HAND))
             (self.last_drag_x, self.last_drag_y) = click_posn
+            self.last_drag_time = time.time()
+            self.drag_velocity = (0.0, 0.0)
         event.Skip()
 
     def OnLeftUp(self, event):
@@ -1709,6 +2404,7 @@ class PySlip(_BufferedCanvas):
 
         # turn off any dragging
         self.last_drag_x = self.last_drag_y = None
+        self.drag_velocity = (0.0, 0.0)
 
         # if required, ignore this event
         if self.ignore_next_up:
@@ -1948,11 +2644,12 @@ class PySlip(_BufferedCanvas):
     # This code does the actual drawing of tiles, layers, etc.
     ######
 
-    def Draw(self, dc):
+    def Draw(self, dc, region=None):
         """Do actual map tile and layers drawing.
         Overrides the _BufferedCanvas.draw() method.
 
-        dc  device context to draw on
+        dc      device context to draw on
+        region  if not None, the wx.Region to be redrawn, dc is clipped to it
 
         The idea is to create 4 things that define the tiles to be drawn and
         where to draw them:
@@ -1963,6 +2660,9 @@ class PySlip(_BufferedCanvas):
 
         Note that (x_pix_start, y_pix_start) will typically be OUTSIDE the view
         if the view is smaller than the map.
+
+        If only a region is redrawn, tiles outside it aren't drawn, indexed
+        layers only draw data near it and the dc clips the rest.
         """
 
         # figure out how to draw tiles
@@ -1992,14 +2692,24 @@ class PySlip(_BufferedCanvas):
             row_list = range(start_y_tile, stop_y_tile)
             y_pix_start = start_y_tile * self.tile_size_y - self.view_offset_y
 
+        # tell the tile source which tiles we are about to draw
+        self.tiles.SetVisibleTiles(col_list, row_list,
+                                   velocity=self.drag_velocity,
+                                   zoom_dir=self.zoom_direction)
+
         # start pasting tiles onto the view
         # use x_pix and y_pix to place tiles
         x_pix = x_pix_start
         for x in col_list:
             y_pix = y_pix_start
             for y in row_list:
-                tile = self.tiles.GetTile(x, y)
-                dc.DrawBitmap(tile, x_pix, y_pix, False)
+                if (region is None
+                        or region.ContainsRect(wx.Rect(x_pix, y_pix,
+                                                       self.tile_size_x,
+                                                       self.tile_size_y))
+                           != wx.OutRegion):
+                    tile = self.tiles.GetTile(x, y)
+                    dc.DrawBitmap(tile, x_pix, y_pix, False)
                 y_pix += self.tile_size_y
             x_pix += self.tile_size_x
 
@@ -2007,7 +2717,10 @@ class PySlip(_BufferedCanvas):
         for id in self.layer_z_order:
             l = self.layer_mapping[id]
             if l.visible and self.level in l.show_levels:
-                l.painter(dc, l.data, map_rel=l.map_rel)
+                if l.cached:
+                    self.DrawCachedLayer(dc, l)
+                else:
+                    self.PaintLayer(dc, l, region)
 
         # draw selection rectangle, if any
         if self.sbox_1_x:
@@ -2156,10 +2869,6 @@ class PySlip(_BufferedCanvas):
         selection point, which is meaningless for point selection.
         """
 
-# TODO: speed this up?  Do we need to??
-# http://en.wikipedia.org/wiki/Kd-tree
-# would need to create kd-tree in AddLayer()
-
         result = None
         delta = layer.delta
         dist = 9999999.0        # more than possible
@@ -2170,11 +2879,25 @@ class PySlip(_BufferedCanvas):
         if layer.map_rel:
             pex = self.PexPoint
             clickpt = self.Geo2View(pt)
+        (xclick, yclick) = clickpt
+
+        # only look at points the spatial index says are near the click
+        (data, views) = (layer.data, None)
+        if layer.index is not None:
+            reach = int(math.sqrt(delta)) + 1
+            (data, views) = self.LayerDataInViewRect(layer, xclick - reach,
+                                                     yclick - reach,
+                                                     xclick + reach,
+                                                     yclick + reach)
 
         # get selected point on map/view
-        (xclick, yclick) = clickpt
-        for (x, y, place, radius, colour, x_off, y_off, udata) in layer.data:
-            (vp, _) = pex(place, (x,y), x_off, y_off, radius)
+        for (i, (x, y, place, radius, colour,
+                 x_off, y_off, udata)) in enumerate(data):
+            if views:
+                (vp, _) = pex(place, (x,y), x_off, y_off, radius,
+                              view=views[i])
+            else:
+                (vp, _) = pex(place, (x,y), x_off, y_off, radius)
             if vp:
                 (vx, vy) = vp
                 d = (vx - xclick)*(vx - xclick) + (vy - yclick)*(vy - yclick)
@@ -2218,9 +2941,20 @@ class PySlip(_BufferedCanvas):
             (blx, bby) = self.Geo2View(ll)
             (brx, bty) = self.Geo2View(ur)
 
+        # only test points the spatial index says are near the box
+        (layer_data, views) = (layer.data, None)
+        if layer.index is not None:
+            (layer_data, views) = self.LayerDataInViewRect(layer, blx, bty,
+                                                           brx, bby)
+
         # get points selection
-        for (x, y, place, radius, colour, x_off, y_off, udata) in layer.data:
-            (vp, _) = pex(place, (x,y), x_off, y_off, radius)
+        for (i, (x, y, place, radius, colour,
+                 x_off, y_off, udata)) in enumerate(layer_data):
+            if views:
+                (vp, _) = pex(place, (x,y), x_off, y_off, radius,
+                              view=views[i])
+            else:
+                (vp, _) = pex(place, (x,y), x_off, y_off, radius)
             if vp:
                 (vpx, vpy) = vp
                 if blx <= vpx <= brx and bby >= vpy >= bty:
@@ -2303,12 +3037,22 @@ class PySlip(_BufferedCanvas):
         (vboxlx, vboxby) = ll
         (vboxrx, vboxty) = ur
 
+        # only test images the spatial index says are near the box
+        (layer_data, views) = (layer.data, None)
+        if layer.index is not None:
+            (layer_data, views) = self.LayerDataInViewRect(layer, vboxlx,
+                                                           vboxty, vboxrx,
+                                                           vboxby)
+
         # select images in map/view
         selection = []
         data = []
-        for (x, y, bmp, w, h, place,
-                x_off, y_off, radius, colour, udata) in layer.data:
-            (_, e) = pex(place, (x,y), x_off, y_off, w, h)
+        for (i, (x, y, bmp, w, h, place,
+                 x_off, y_off, radius, colour, udata)) in enumerate(layer_data):
+            if views:
+                (_, e) = pex(place, (x,y), x_off, y_off, w, h, view=views[i])
+            else:
+                (_, e) = pex(place, (x,y), x_off, y_off, w, h)
             if e:
                 (li, ri, ti, bi) = e    # image extents (view coords)
                 if (vboxlx <= li and ri <= vboxrx
@@ -2349,10 +3093,23 @@ class PySlip(_BufferedCanvas):
             clickpt = self.Geo2View(point)
         (xclick, yclick) = clickpt
 
+        # only look at text the spatial index says is near the click
+        (layer_data, views) = (layer.data, None)
+        if layer.index is not None:
+            reach = int(math.sqrt(delta)) + 1
+            (layer_data, views) = self.LayerDataInViewRect(layer,
+                                                           xclick - reach,
+                                                           yclick - reach,
+                                                           xclick + reach,
+                                                           yclick + reach)
+
         # select text in map/view layer
-        for (x, y, text, place, radius, colour,                                                                                                              
-                 tcolour, fname, fsize, x_off, y_off, data) in layer.data:
-            (vp, ex) = pex(place, (x,y), 0, 0, radius)
+        for (i, (x, y, text, place, radius, colour, tcolour,
+                 fname, fsize, x_off, y_off, data)) in enumerate(layer_data):
+            if views:
+                (vp, ex) = pex(place, (x,y), 0, 0, radius, view=views[i])
+            else:
+                (vp, ex) = pex(place, (x,y), 0, 0, radius)
             if vp:
                 (px, py) = vp
                 d = (px - xclick)**2 + (py - yclick)**2
@@ -2400,13 +3157,23 @@ class PySlip(_BufferedCanvas):
             pex = self.PexPoint
             ll = self.Geo2View(ll)
             ur = self.Geo2View(ur)
-        (lx, by) = ll                                                                                                                                        
+        (lx, by) = ll
         (rx, ty) = ur
 
+        # only test text the spatial index says is near the box
+        (layer_data, views) = (layer.data, None)
+        if layer.index is not None:
+            (layer_data, views) = self.LayerDataInViewRect(layer, lx, ty,
+                                                           rx, by)
+
         # get texts inside box
-        for (x, y, text, place, radius, colour,
-                tcolour, fname, fsize, x_off, y_off, udata) in layer.data:
-            (vp, ex) = pex(place, (x,y), x_off, y_off, radius)
+        for (i, (x, y, text, place, radius, colour, tcolour,
+                 fname, fsize, x_off, y_off, udata)) in enumerate(layer_data):
+            if views:
+                (vp, ex) = pex(place, (x,y), x_off, y_off, radius,
+                               view=views[i])
+            else:
+                (vp, ex) = pex(place, (x,y), x_off, y_off, radius)
             if vp:
                 (px, py) = vp
                 if lx <= px <= rx and ty <= py <= by:
@@ -2437,6 +3204,20 @@ class PySlip(_BufferedCanvas):
 
         result = None
 
+        # map-relative polygons are tested in geo coordinates, so only
+        # those whose extent holds the click need be tested
+        if layer.map_rel and layer.index is not None:
+            (x, y) = point
+            for i in layer.index.query(x, x, y, y):
+                if self.point_in_layer_poly(layer, i, point):
+                    (poly, place, width, colour, close,
+                         filled, fcolour, x_off, y_off, udata) = layer.data[i]
+                    sel = (poly, {'placement': place,
+                                  'offset_x': x_off,
+                                  'offset_y': y_off})
+                    return ([sel], udata, None)
+            return None
+
         # get correct 'point in polygon' routine
         pip = self.point_in_poly_view
         if layer.map_rel:
@@ -2478,9 +3259,14 @@ class PySlip(_BufferedCanvas):
         (lx, by) = p1
         (rx, ty) = p2
 
+        # only test polygons the spatial index says are near the box
+        layer_data = layer.data
+        if layer.index is not None:
+            (layer_data, _) = self.LayerDataInViewRect(layer, lx, ty, rx, by)
+
         # check polygons in layer
         for (poly, place, width, colour, close,
-                filled, fcolour, x_off, y_off, udata) in layer.data:
+                filled, fcolour, x_off, y_off, udata) in layer_data:
             (pt, ex) = pex(place, poly, x_off, y_off)
             if ex:
                 (plx, prx, pty, pby) = ex
@@ -2501,9 +3287,10 @@ class PySlip(_BufferedCanvas):
     #
     # A 'staged' zoom is something similar to google maps zoom where the
     # existing map image is algorithimically enlarged (or diminished) and
-    # is later overwritten with the actual zoomed map tiles.  I think google
-    # is using tiles that can be enlarged (diminished) without too much
-    # reduction in detail (SVG-ish), but we'll never be doing *that*!
+    # is later overwritten with the actual zoomed map tiles.  The tile
+    # source does this: a tile not yet loaded is drawn as the enlarged part
+    # of a cached ancestor tile, or the shrunk cached children, until the
+    # real tile arrives (see Tiles.GetStandInTile()).
     ######
 
     def ZoomIn(self, gposn):
@@ -2514,6 +3301,9 @@ class PySlip(_BufferedCanvas):
         The tile stuff has already been set to the correct level.
         """
 
+        # tile sources may prefetch the next level in
+        self.zoom_direction = 1
+
         # move to desired position
         self.GotoPosition(gposn)
 
@@ -2531,6 +3321,9 @@ class PySlip(_BufferedCanvas):
         The tile stuff has already been set to the correct level.
         """
 
+        # tile sources may prefetch the next level out
+        self.zoom_direction = -1
+
         # move to desired position
         self.GotoPosition(gposn)
 
@@ -2716,21 +3509,20 @@ class PySlip(_BufferedCanvas):
         May return True or False if point on edge of polygon.
 
         Slightly modified version of the 'published' algorithm found on the 'net.
-        Instead of indexing into the poly, create a new poly that 'wraps around'.
-        Even with the extra code, it runs in 2/3 the time.
+        Instead of indexing into the poly, start with the closing edge from
+        the last vertex and walk the vertices, so the poly isn't copied.
         """
 
         (x, y) = point
 
-        # we want a *copy* of original iterable plus extra wraparound point
-        l_poly = list(poly)
-        l_poly.append(l_poly[0])  # ensure poly wraps around
+        if not isinstance(poly, (list, tuple)):
+            poly = list(poly)
 
         inside = False
 
-        (p1x, p1y) = l_poly[0]
+        (p1x, p1y) = poly[-1]
 
-        for (p2x, p2y) in l_poly:
+        for (p2x, p2y) in poly:
             if y > min(p1y, p2y):
                 if y <= max(p1y, p2y):
                     if x <= max(p1x, p2x):
@@ -2742,6 +3534,29 @@ class PySlip(_BufferedCanvas):
 
         return inside
 
+    def point_in_layer_poly(self, layer, i, geo):
+        """Decide if a point is inside a polygon of a map-relative layer.
+
+        layer  the polygon _Layer
+        i      index of the polygon in the layer data
+        geo    tuple (xgeo, ygeo) of point position
+
+        Big polygons are tested with a PolygonEdgeIndex, made when first
+        needed and kept in the layer.
+        """
+
+        poly = layer.data[i][0]
+        if not poly:
+            return False
+        if len(poly) < spatial_index.PolygonEdgeIndex.MinVertices:
+            return self.point_inside_polygon(geo, poly)
+
+        edges = layer.edge_indexes.get(i, None)
+        if edges is None:
+            edges = spatial_index.PolygonEdgeIndex(poly)
+            layer.edge_indexes[i] = edges
+        return edges.contains(geo)
+
     def point_in_poly_geo(self, poly, geo, placement, offset_x, offset_y):
         """Decide if a point is inside a map-relative polygon.
 
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Simple spatial indexes used by pySlip to find layer objects in an area.
+
+GridIndex is a uniform grid laid over the bounding boxes of a list of
+objects.  Each grid cell holds the list indices of the objects whose boxes
+overlap the cell, so a query only looks at objects in the cells the query
+box covers.  Query results are list indices in ascending order, so the
+objects found can be drawn in their original order.
+
+PointGridIndex is the same grid over points held in coordinate columns,
+made without a box object for each point.
+
+PolygonEdgeIndex speeds up point-in-polygon tests on big polygons.
+"""
+
+import math
+import array
+
+# numpy is optional, PointGridIndex is made faster with it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def as_numpy(values):
+    """Get a float numpy array of 'values', an array('d') isn't copied."""
+
+    if isinstance(values, array.array):
+        return np.frombuffer(values, dtype=float)
+    return np.asarray(values, dtype=float)
+
+
+class GridIndex(object):
+    """A uniform grid index over the bounding boxes of a list of objects."""
+
+    # average number of objects in a grid cell aimed for
+    ItemsPerCell = 8
+
+    def __init__(self, boxes):
+        """Build the index.
+
+        boxes  list of (min_x, max_x, min_y, max_y), the bounding box of
+               each object, or None for an object that matches every query
+        """
+
+        self.boxes = boxes
+        self.size = len(boxes)
+        self.always = [i for (i, box) in enumerate(boxes) if box is None]
+        self.cells = {}                 # (cell_x, cell_y) -> [index, ...]
+
+        indexed = [i for (i, box) in enumerate(boxes) if box is not None]
+        if not indexed:
+            self.bounds = None
+            return
+
+        self.bounds = (min([boxes[i][0] for i in indexed]),
+                       max([boxes[i][1] for i in indexed]),
+                       min([boxes[i][2] for i in indexed]),
+                       max([boxes[i][3] for i in indexed]))
+        (min_x, max_x, min_y, max_y) = self.bounds
+
+        self.num_cells = max(1, int(math.sqrt(len(indexed)
+                                              / float(self.ItemsPerCell))))
+        self.cell_w = float(max_x - min_x) / self.num_cells or 1.0
+        self.cell_h = float(max_y - min_y) / self.num_cells or 1.0
+
+        for i in indexed:
+            (left, right, bottom, top) = boxes[i]
+            for cx in range(self._cell_x(left), self._cell_x(right) + 1):
+                for cy in range(self._cell_y(bottom), self._cell_y(top) + 1):
+                    self.cells.setdefault((cx, cy), []).append(i)
+
+    def _cell_x(self, x):
+        """Get the grid column holding X coordinate 'x'."""
+
+        cell = int((x - self.bounds[0]) / self.cell_w)
+        return min(max(cell, 0), self.num_cells - 1)
+
+    def _cell_y(self, y):
+        """Get the grid row holding Y coordinate 'y'."""
+
+        cell = int((y - self.bounds[2]) / self.cell_h)
+        return min(max(cell, 0), self.num_cells - 1)
+
+    def query(self, min_x, max_x, min_y, max_y):
+        """Find the objects whose boxes overlap a box.
+
+        min_x, max_x, min_y, max_y  the query box
+
+        Returns a sorted list of object indices.
+        """
+
+        if self.bounds is None:
+            return self.always[:]
+
+        (b_min_x, b_max_x, b_min_y, b_max_y) = self.bounds
+        if (max_x < b_min_x or min_x > b_max_x
+                or max_y < b_min_y or min_y > b_max_y):
+            return self.always[:]
+        if (min_x <= b_min_x and max_x >= b_max_x
+                and min_y <= b_min_y and max_y >= b_max_y):
+            return range(self.size)
+
+        found = set(self.always)
+        boxes = self.boxes
+        for cx in range(self._cell_x(min_x), self._cell_x(max_x) + 1):
+            for cy in range(self._cell_y(min_y), self._cell_y(max_y) + 1):
+                for i in self.cells.get((cx, cy), ()):
+                    (left, right, bottom, top) = boxes[i]
+                    if (left <= max_x and right >= min_x
+                            and bottom <= max_y and top >= min_y):
+                        found.add(i)
+
+        return sorted(found)
+
+class PointGridIndex(object):
+    """A uniform grid index over points held in coordinate columns.
+
+    The point indices are kept in one array sorted by grid cell, cells
+    ordered by row then column, with the start of each cell's run in
+    another array.  So the cells of one grid row covered by a query are
+    one slice of the sorted indices.
+    """
+
+    # average number of points in a grid cell aimed for
+    ItemsPerCell = 8
+
+    def __init__(self, xs, ys):
+        """Build the index.
+
+        xs, ys  sequences of the point X and Y coordinates, usually
+                array('d') columns, kept by the index
+        """
+
+        self.xs = xs
+        self.ys = ys
+        self.size = len(xs)
+        if not self.size:
+            self.bounds = None
+            return
+
+        self.bounds = (min(xs), max(xs), min(ys), max(ys))
+        (min_x, max_x, min_y, max_y) = self.bounds
+
+        n = self.num_cells = max(1, int(math.sqrt(self.size
+                                                  / float(self.ItemsPerCell))))
+        self.cell_w = float(max_x - min_x) / n or 1.0
+        self.cell_h = float(max_y - min_y) / n or 1.0
+
+        if np is not None:
+            self._build_numpy()
+        else:
+            self._build()
+
+    def _build(self):
+        """Sort the point indices into cells, a counting sort."""
+
+        (xs, ys, n) = (self.xs, self.ys, self.num_cells)
+        (min_x, _, min_y, _) = self.bounds
+        (cell_w, cell_h) = (self.cell_w, self.cell_h)
+        last = n - 1
+
+        # cell of each point, and the running total of points before a cell
+        cells = array.array('l', [0]) * self.size
+        starts = array.array('l', [0]) * (n*n + 1)
+        for i in xrange(self.size):
+            cx = int((xs[i] - min_x) / cell_w)
+            cy = int((ys[i] - min_y) / cell_h)
+            cell = min(cy, last)*n + min(cx, last)
+            cells[i] = cell
+            starts[cell + 1] += 1
+        for cell in xrange(n*n):
+            starts[cell + 1] += starts[cell]
+
+        order = array.array('l', [0]) * self.size
+        fill = array.array('l', starts)
+        for i in xrange(self.size):
+            cell = cells[i]
+            order[fill[cell]] = i
+            fill[cell] += 1
+
+        self.order = order
+        self.starts = starts
+
+    def _build_numpy(self):
+        """Sort the point indices into cells with numpy."""
+
+        xs = as_numpy(self.xs)
+        ys = as_numpy(self.ys)
+        (min_x, _, min_y, _) = self.bounds
+        n = self.num_cells
+
+        cx = np.minimum(((xs - min_x) / self.cell_w).astype(int), n - 1)
+        cy = np.minimum(((ys - min_y) / self.cell_h).astype(int), n - 1)
+        cells = cy*n + cx
+        self.order = np.argsort(cells, kind='mergesort')
+        self.starts = np.searchsorted(cells[self.order], np.arange(n*n + 1))
+
+    def _cell_x(self, x):
+        """Get the grid column holding X coordinate 'x'."""
+
+        cell = int((x - self.bounds[0]) / self.cell_w)
+        return min(max(cell, 0), self.num_cells - 1)
+
+    def _cell_y(self, y):
+        """Get the grid row holding Y coordinate 'y'."""
+
+        cell = int((y - self.bounds[2]) / self.cell_h)
+        return min(max(cell, 0), self.num_cells - 1)
+
+    def query(self, min_x, max_x, min_y, max_y):
+        """Find the points inside a box.
+
+        min_x, max_x, min_y, max_y  the query box
+
+        Returns a sorted list of point indices.
+        """
+
+        if self.bounds is None:
+            return []
+
+        (b_min_x, b_max_x, b_min_y, b_max_y) = self.bounds
+        if (max_x < b_min_x or min_x > b_max_x
+                or max_y < b_min_y or min_y > b_max_y):
+            return []
+        if (min_x <= b_min_x and max_x >= b_max_x
+                and min_y <= b_min_y and max_y >= b_max_y):
+            return range(self.size)
+
+        (xs, ys, order, starts) = (self.xs, self.ys, self.order, self.starts)
+        n = self.num_cells
+        (first_x, last_x) = (self._cell_x(min_x), self._cell_x(max_x))
+        found = []
+        for cy in range(self._cell_y(min_y), self._cell_y(max_y) + 1):
+            row = cy*n
+            run = order[starts[row + first_x]:starts[row + last_x + 1]]
+            if np is not None:
+                run = run.tolist()
+            for i in run:
+                if min_x <= xs[i] <= max_x and min_y <= ys[i] <= max_y:
+                    found.append(i)
+
+        found.sort()
+        return found
+
+class PolygonEdgeIndex(object):
+    """Edges of a polygon bucketed into horizontal bands for point-in-polygon.
+
+    A ray-cast point-in-polygon test only needs the edges that cross the
+    point's Y coordinate, so only the edges in that Y band are tested.
+    Worth building for polygons with many vertices.
+    """
+
+    # polygons with fewer vertices are tested without an edge index
+    MinVertices = 64
+
+    # average number of edges in a band aimed for
+    EdgesPerBand = 8
+
+    def __init__(self, poly):
+        """Build the index.
+
+        poly  sequence of (x, y) polygon vertices, closing edge implied
+        """
+
+        ys = [y for (_, y) in poly]
+        self.min_y = min(ys)
+        max_y = max(ys)
+        self.num_bands = max(1, len(poly) / self.EdgesPerBand)
+        self.band_h = float(max_y - self.min_y) / self.num_bands or 1.0
+        self.bands = [[] for _ in range(self.num_bands)]
+
+        # horizontal edges never cross a ray, so aren't indexed
+        (p1x, p1y) = poly[-1]
+        for (p2x, p2y) in poly:
+            if p1y != p2y:
+                edge = (p1x, p1y, p2x, p2y)
+                for band in range(self._band(min(p1y, p2y)),
+                                  self._band(max(p1y, p2y)) + 1):
+                    self.bands[band].append(edge)
+            (p1x, p1y) = (p2x, p2y)
+
+    def _band(self, y):
+        """Get the band holding Y coordinate 'y'."""
+
+        band = int((y - self.min_y) / self.band_h)
+        return min(max(band, 0), self.num_bands - 1)
+
+    def contains(self, point):
+        """Decide if point is inside the polygon.
+
+        point  tuple of (x, y) coordinates of the point
+
+        Gives the same result as pySlip.point_inside_polygon().
+        """
+
+        (x, y) = point
+
+        inside = False
+        for (p1x, p1y, p2x, p2y) in self.bands[self._band(y)]:
+            if min(p1y, p2y) < y <= max(p1y, p2y) and x <= max(p1x, p2x):
+                xinters = (y-p1y)*(p2x-p1x)/(p2y-p1y) + p1x
+                if p1x == p2x or x <= xinters:
+                    inside = not inside
+
+        return inside
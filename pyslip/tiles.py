@@ -13,6 +13,12 @@ import glob
 import wx
 import pycacheback
 
+# numpy is optional, batch conversions are faster with it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 ######
 # Base class for a tile source - handles access to a source of tiles.
@@ -22,6 +28,9 @@ class Tiles(object):
 
     DefaultTilesDir = '_=TILES=_'
 
+    # number of levels searched up for a tile to stand in for a missing tile
+    StandInLevels = 4
+
     """An object to source tiles for pyslip."""
 
     def __init__(self, tiles, start_level=None, min_level=None, max_level=None):
@@ -71,6 +80,128 @@ class Tiles(object):
 
         raise Exception('You must override Tiles.GetTile()')
 
+    def SetVisibleTiles(self, x_list, y_list, velocity=(0, 0), zoom_dir=0):
+        """Hint that the tiles in these columns and rows are about to be drawn.
+
+        x_list    list of tile X coordinates (left to right)
+        y_list    list of tile Y coordinates (top to bottom)
+        velocity  tuple (x, y) of the speed the view is moving over the
+                  map, in pixels/second
+        zoom_dir  1 if the view last zoomed in, -1 if out, else 0
+
+        Called by pySlip before it calls GetTile() for each visible tile of
+        the current level.  Tile sources may use this to fetch tiles in
+        bulk, or to prefetch tiles likely to be needed next.  The base
+        class only forgets stand-ins for tiles no longer visible.
+        """
+
+        self._prune_stand_ins(x_list, y_list)
+
+    def _prune_stand_ins(self, x_list, y_list):
+        """Forget the stand-ins for tiles outside the visible tiles.
+
+        x_list  list of visible tile X coordinates
+        y_list  list of visible tile Y coordinates
+
+        A tile that fails to load, or is cancelled, keeps its stand-in
+        until it scrolls out of view, so there are never more stand-ins
+        than visible tiles.
+        """
+
+        stand_ins = getattr(self, 'stand_ins', None)
+        if not stand_ins:
+            return
+
+        (x_set, y_set) = (set(x_list), set(y_list))
+        for (level, x, y) in stand_ins.keys():
+            if level != self.level or x not in x_set or y not in y_set:
+                del stand_ins[(level, x, y)]
+
+    def GetStandInTile(self, x, y, default):
+        """Get a tile to show while the real tile at (x, y) is loading.
+
+        x        X coord of the missing tile (tile coordinates)
+        y        Y coord of the missing tile (tile coordinates)
+        default  bitmap returned if no stand-in can be made
+
+        The stand-in is the enlarged quadrant of the nearest ancestor tile
+        held in memory, or else the shrunk children of the tile held in
+        memory drawn over 'default'.  Only in-memory tiles are used, so this
+        is quick.  Stand-ins are remembered in self.stand_ins (which child
+        classes must create) until the real tile arrives or fails, the tile
+        leaves the view or the level changes.  Stand-ins made from only some
+        of the children aren't remembered, so later children are shown.
+
+        This assumes each level has twice the tiles of the level above in
+        each direction.
+        """
+
+        key = (self.level, x, y)
+        try:
+            return self.stand_ins[key]
+        except KeyError:
+            pass
+
+        bitmap = self._ancestor_stand_in(x, y)
+        complete = True
+        if bitmap is None:
+            (bitmap, complete) = self._children_stand_in(x, y, default)
+        if bitmap is None:
+            return default
+
+        if complete:
+            self.stand_ins[key] = bitmap
+        return bitmap
+
+    def _ancestor_stand_in(self, x, y):
+        """Make a stand-in for (x, y) from an ancestor tile, or None."""
+
+        for up in range(1, self.StandInLevels+1):
+            key = (self.level - up, x >> up, y >> up)
+            if key[0] not in self.levels or key not in self.cache:
+                continue
+
+            # the part of the ancestor covering this tile
+            size_x = self.tile_size_x >> up
+            size_y = self.tile_size_y >> up
+            if size_x < 1 or size_y < 1:
+                return None
+            part_x = (x - (key[1] << up)) * size_x
+            part_y = (y - (key[2] << up)) * size_y
+            image = self.cache[key].ConvertToImage()
+            image = image.GetSubImage(wx.Rect(part_x, part_y, size_x, size_y))
+            image = image.Scale(self.tile_size_x, self.tile_size_y)
+            return image.ConvertToBitmap()
+
+        return None
+
+    def _children_stand_in(self, x, y, default):
+        """Make a stand-in for (x, y) from its child tiles.
+
+        Returns (bitmap, complete) where 'bitmap' is None if no child is in
+        memory and 'complete' is True if all four children are drawn.
+        """
+
+        level = self.level + 1
+        if level not in self.levels:
+            return (None, False)
+        children = [(dx, dy) for dx in (0, 1) for dy in (0, 1)
+                    if (level, 2*x+dx, 2*y+dy) in self.cache]
+        if not children:
+            return (None, False)
+
+        half_x = self.tile_size_x / 2
+        half_y = self.tile_size_y / 2
+        bitmap = wx.EmptyBitmap(self.tile_size_x, self.tile_size_y)
+        dc = wx.MemoryDC(bitmap)
+        dc.DrawBitmap(default, 0, 0)
+        for (dx, dy) in children:
+            image = self.cache[(level, 2*x+dx, 2*y+dy)].ConvertToImage()
+            image = image.Scale(half_x, half_y)
+            dc.DrawBitmap(image.ConvertToBitmap(), dx*half_x, dy*half_y)
+        dc.SelectObject(wx.NullBitmap)
+        return (bitmap, len(children) == 4)
+
     def GetInfo(self, level):
         """Get tile info for a particular level.
 
@@ -105,3 +236,41 @@ class Tiles(object):
         """
 
         raise Exception('You must override Tiles.Tile2Geo()')
+
+    def Geo2TileArray(self, xgeo, ygeo):
+        """Convert many geo positions to tile fractional coordinates.
+
+        xgeo  sequence of geo X coordinates (numpy array or list)
+        ygeo  sequence of geo Y coordinates
+
+        Returns (xtile, ytile), numpy arrays if numpy is installed, else lists.
+
+        This converts one point at a time with Geo2Tile(), child classes
+        override it with a numpy version.
+        """
+
+        tile = [self.Geo2Tile(geo) for geo in zip(xgeo, ygeo)]
+        xtile = [x for (x, _) in tile]
+        ytile = [y for (_, y) in tile]
+        if np is not None:
+            return (np.array(xtile, dtype=float), np.array(ytile, dtype=float))
+        return (xtile, ytile)
+
+    def Tile2GeoArray(self, xtile, ytile):
+        """Convert many tile fractional coordinates to geo positions.
+
+        xtile  sequence of tile fractional X coordinates (numpy array or list)
+        ytile  sequence of tile fractional Y coordinates
+
+        Returns (xgeo, ygeo), numpy arrays if numpy is installed, else lists.
+
+        This converts one point at a time with Tile2Geo(), child classes
+        override it with a numpy version.
+        """
+
+        geo = [self.Tile2Geo(tile) for tile in zip(xtile, ytile)]
+        xgeo = [x for (x, _) in geo]
+        ygeo = [y for (_, y) in geo]
+        if np is not None:
+            return (np.array(xgeo, dtype=float), np.array(ygeo, dtype=float))
+        return (xgeo, ygeo)
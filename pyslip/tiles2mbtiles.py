@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Convert a GMT or OSM tile directory tree into a single MBTiles file.
+
+Usage: tiles2mbtiles.py [-h] [-n <name>] -t <source> <tiles_dir> <tiles_file>
+
+where -h          prints this help and exits
+      -n <name>   sets the tileset name in the output file
+      -t <source> is the type of the tile directory, 'gmt' or 'osm'
+      tiles_dir   is the tile directory to convert
+      tiles_file  is the MBTiles file to create
+
+The new file can be served with mbtiles_tiles.MBTiles.
+"""
+
+import sys
+import time
+import getopt
+
+import mbtiles_tiles
+
+
+def usage(msg=None):
+    if msg:
+        print(('*'*80 + '\n%s\n' + '*'*80) % msg)
+    print(__doc__)
+
+def main(argv):
+    try:
+        (opts, args) = getopt.getopt(argv, 'hn:t:', ['help', 'name=', 'tiles='])
+    except getopt.error:
+        usage()
+        return 1
+
+    name = None
+    source = None
+    for (opt, param) in opts:
+        if opt in ['-h', '--help']:
+            usage()
+            return 0
+        elif opt in ['-n', '--name']:
+            name = param
+        elif opt in ['-t', '--tiles']:
+            source = param
+
+    if source is None:
+        usage('You must give the tile source type with -t')
+        return 1
+    if len(args) != 2:
+        usage()
+        return 1
+    (tiles_dir, tiles_file) = args
+
+    def progress(level, count):
+        print('level %2d: %d tiles' % (level, count))
+
+    start = time.time()
+    try:
+        count = mbtiles_tiles.ImportTiles(tiles_dir, tiles_file, source,
+                                          name=name, progress=progress)
+    except Exception as e:
+        usage(str(e))
+        return 1
+    print('%d tiles imported in %.1fs' % (count, time.time() - start))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))